@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Header
+from fastapi import APIRouter, Depends, HTTPException, Response, status, Header
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from uuid import UUID
@@ -15,7 +15,10 @@ from app.schemas.canva import (
     CanvasUpdate
 )
 from app.schemas.user import User
-from app.services.canva_service import CanvaService, CanvaServiceError, PermissionDeniedError, CanvaNotFoundError
+from app.services.canva_service import (
+    canva_service, CanvaServiceError, PermissionDeniedError, CanvaNotFoundError, CardNotFoundError,
+    DataConsistencyError, CARD_LIST_ADAPTER
+)
 from app.crud import canvas as canvas_crud, card as card_crud
 
 router = APIRouter()
@@ -104,7 +107,6 @@ async def add_card_to_canvas(
             )
         
         # 验证画布权限
-        canva_service = CanvaService()
         canvas = canva_service.verify_user_permission(db, canvas_id, current_user.id)
         
         # 创建卡片
@@ -183,7 +185,6 @@ async def delete_card(
             )
         
         # 验证画布权限
-        canva_service = CanvaService()
         canva_service.verify_user_permission(db, card.canvas_id, current_user.id)
         
         # 删除卡片
@@ -245,7 +246,6 @@ async def update_card(
             )
         
         # 验证画布权限
-        canva_service = CanvaService()
         canva_service.verify_user_permission(db, card.canvas_id, current_user.id)
         
         # 更新卡片
@@ -303,7 +303,6 @@ async def get_canvas_cards(
     """
     try:
         # 验证画布权限
-        canva_service = CanvaService()
         canvas = canva_service.verify_user_permission(db, canvas_id, current_user.id)
         
         # 获取卡片列表
@@ -382,7 +381,6 @@ async def batch_add_cards(
             )
         
         # 验证画布权限
-        canva_service = CanvaService()
         canvas = canva_service.verify_user_permission(db, canvas_id, current_user.id)
         
         # 批量创建卡片
@@ -457,9 +455,6 @@ async def pull_canvas(
             - 500: 服务器内部错误
     """
     try:
-        # 初始化画布服务
-        canva_service = CanvaService()
-        
         # 验证用户权限（同时验证画布是否存在）
         canvas = canva_service.verify_user_permission(
             db,
@@ -483,7 +478,11 @@ async def pull_canvas(
             )
             card_responses.append(card_response)
         
-        return card_responses
+        # 使用预构建的序列化器直接输出JSON
+        return Response(
+            content=CARD_LIST_ADAPTER.dump_json(card_responses),
+            media_type="application/json"
+        )
         
     except PermissionDeniedError as e:
         raise HTTPException(
@@ -535,77 +534,14 @@ async def push_canvas(
             - 500: 服务器内部错误
     """
     try:
-        # 初始化画布服务
-        canva_service = CanvaService()
-        
-        # 验证用户权限（同时验证画布是否存在）
-        canvas = canva_service.verify_user_permission(
-            db,
-            request.canva_id,
-            current_user.id
-        )
-        
-        # 处理卡片更新和创建
-        created_cards = []
-        updated_cards = []
-        
-        for card_update in request.cards:
-            if card_update.card_id is None:
-                # 创建新卡片
-                new_card_data = {
-                    "canvas_id": request.canva_id,
-                    "position_x": card_update.position.x,
-                    "position_y": card_update.position.y,
-                    "content_id": card_update.content_id,
-                    "user_id": current_user.id
-                }
-                new_card = card_crud.create(db, obj_in=new_card_data)
-                created_cards.append(new_card.id)
-            else:
-                # 更新现有卡片
-                card = card_crud.get(db, id=card_update.card_id)
-                if not card:
-                    raise HTTPException(
-                        status_code=status.HTTP_404_NOT_FOUND,
-                        detail=f"Card with id {card_update.card_id} not found"
-                    )
-                if card.canvas_id != request.canva_id:
-                    raise HTTPException(
-                        status_code=status.HTTP_400_BAD_REQUEST,
-                        detail=f"Card {card_update.card_id} does not belong to canvas {request.canva_id}"
-                    )
-                
-                # 验证内容访问权限（如果有content_id）
-                if card_update.content_id is not None:
-                    canva_service.verify_content_access(
-                        db,
-                        card_update.content_id,
-                        current_user.id
-                    )
-                
-                # 更新卡片
-                update_data = {
-                    "position_x": card_update.position.x,
-                    "position_y": card_update.position.y
-                }
-                if card_update.content_id is not None:
-                    update_data["content_id"] = card_update.content_id
-                
-                card_crud.update(db, db_obj=card, obj_in=update_data)
-                updated_cards.append(card_update.card_id)
-        
-        # 更新画布的修改时间
-        canvas_crud.update(
-            db,
-            db_obj=canvas,
-            obj_in={"updated_at": "now()"}
-        )
+        # 权限和卡片归属校验、批量写入卡片及画布修改时间均在服务层的同一事务内完成
+        result = canva_service.push_canva(db, request, current_user.id)
         
         return {
             "message": "Canvas updated successfully",
             "canvas_id": request.canva_id,
-            "created_cards": created_cards,
-            "updated_cards": updated_cards,
+            "created_cards": result["created_card_ids"],
+            "updated_cards": [card_data.card_id for card_data in request.cards if card_data.card_id is not None],
             "total_processed": len(request.cards)
         }
         
@@ -619,6 +555,16 @@ async def push_canvas(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="画布不存在"
         )
+    except CardNotFoundError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except DataConsistencyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     except CanvaServiceError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -663,9 +609,6 @@ async def get_canvas_info(
             - 500: 服务器内部错误
     """
     try:
-        # 初始化画布服务
-        canva_service = CanvaService()
-        
         # 验证用户权限
         canvas = canva_service.verify_user_permission(db, canvas_id, current_user.id)
         
@@ -310,7 +310,7 @@ async def generate_tags(
     使用AI为给定的文本内容生成相关标签
     """
     try:
-        result = tag_generation_service.generate_tags_for_text(db, request.content)
+        result = await tag_generation_service.generate_tags_for_text(db, request.content)
         return TagGenerationResponse(**result)
         
     except Exception as e:
@@ -4,7 +4,6 @@
 """
 
 import asyncio
-import json
 import logging
 from typing import Dict, Set, Optional
 from datetime import datetime
@@ -15,7 +14,8 @@ from app.services.smart_note_service import smart_note_service
 from app.utils.session_manager import session_manager
 from app.crud import user as user_crud
 from app.models.user import User
-from app.db.session import get_db
+from app.db.base import SessionLocal
+from app.utils.json_response import dumps_text
 
 logger = logging.getLogger(__name__)
 
@@ -56,11 +56,13 @@ class ConnectionManager:
         if task_id not in self.task_connections:
             return
         
+        # 同一消息只序列化一次，所有订阅连接复用
+        payload = dumps_text(message)
         disconnected = set()
         for websocket in self.task_connections[task_id].copy():
             try:
                 if websocket.client_state == WebSocketState.CONNECTED:
-                    await websocket.send_text(json.dumps(message, ensure_ascii=False))
+                    await websocket.send_text(payload)
                 else:
                     disconnected.add(websocket)
             except Exception as e:
@@ -73,11 +75,12 @@ class ConnectionManager:
     
     async def send_to_all(self, message: dict):
         """向所有连接发送消息"""
+        payload = dumps_text(message)
         disconnected = set()
         for websocket in self.active_connections.copy():
             try:
                 if websocket.client_state == WebSocketState.CONNECTED:
-                    await websocket.send_text(json.dumps(message, ensure_ascii=False))
+                    await websocket.send_text(payload)
                 else:
                     disconnected.add(websocket)
             except Exception as e:
@@ -131,9 +134,8 @@ async def get_current_user_from_websocket(websocket: WebSocket) -> Optional[User
             return None
         
         # 获取用户信息
-        db = next(get_db())
-        db_user = user_crud.get(db, id=user_id)
-        return db_user
+        with SessionLocal() as db:
+            return user_crud.get(db, id=user_id)
         
     except Exception as e:
         logger.error(f"WebSocket认证失败: {e}")
@@ -155,19 +157,18 @@ async def websocket_task_endpoint(websocket: WebSocket, task_id: str):
         # 发送初始任务状态
         task = smart_note_service.get_task_status(task_id)
         if task:
-            # 过滤掉不需要的字段
-            safe_task = {k: v for k, v in task.items() if k not in ['image_data']}
-            safe_task = serialize_for_websocket(safe_task)
+            # 任务快照已不含图片数据
+            safe_task = serialize_for_websocket(task)
             
-            await websocket.send_text(json.dumps({
+            await websocket.send_text(dumps_text({
                 "type": "initial_status",
                 "data": safe_task
-            }, ensure_ascii=False))
+            }))
         else:
-            await websocket.send_text(json.dumps({
+            await websocket.send_text(dumps_text({
                 "type": "error",
                 "data": {"message": "任务不存在"}
-            }, ensure_ascii=False))
+            }))
             await websocket.close()
             return
         
@@ -181,10 +182,10 @@ async def websocket_task_endpoint(websocket: WebSocket, task_id: str):
             try:
                 current_task = smart_note_service.get_task_status(task_id)
                 if not current_task:
-                    await websocket.send_text(json.dumps({
+                    await websocket.send_text(dumps_text({
                         "type": "error",
                         "data": {"message": "任务已被删除"}
-                    }, ensure_ascii=False))
+                    }))
                     break
                 
                 # 检查并发送新的中间结果
@@ -194,10 +195,10 @@ async def websocket_task_endpoint(websocket: WebSocket, task_id: str):
                     if result_key not in sent_intermediate_results:
                         # 序列化中间结果
                         safe_result = serialize_for_websocket(result)
-                        await websocket.send_text(json.dumps({
+                        await websocket.send_text(dumps_text({
                             "type": "intermediate_result",
                             "data": safe_result
-                        }, ensure_ascii=False))
+                        }))
                         sent_intermediate_results.add(result_key)
                 
                 # 检查状态是否有变化
@@ -217,10 +218,10 @@ async def websocket_task_endpoint(websocket: WebSocket, task_id: str):
                         "error": current_task.get("error_message")
                     }
                     
-                    await websocket.send_text(json.dumps({
+                    await websocket.send_text(dumps_text({
                         "type": "status_update",
                         "data": status_data
-                    }, ensure_ascii=False))
+                    }))
                     
                     last_status = current_task["status"]
                     last_progress = current_task["progress"]
@@ -237,15 +238,15 @@ async def websocket_task_endpoint(websocket: WebSocket, task_id: str):
                             "summary_result": result.get("summary"),
                             "content_id": result.get("content_id")
                         }
-                        await websocket.send_text(json.dumps({
+                        await websocket.send_text(dumps_text({
                             "type": "task_completed",
                             "data": result_data
-                        }, ensure_ascii=False))
+                        }))
                     else:
-                        await websocket.send_text(json.dumps({
+                        await websocket.send_text(dumps_text({
                             "type": "task_failed",
                             "data": {"error": current_task.get("error_message", "处理失败")}
-                        }, ensure_ascii=False))
+                        }))
                     
                     break
                 
@@ -256,10 +257,10 @@ async def websocket_task_endpoint(websocket: WebSocket, task_id: str):
                 break
             except Exception as e:
                 logger.error(f"WebSocket监控过程中出错: {e}")
-                await websocket.send_text(json.dumps({
+                await websocket.send_text(dumps_text({
                     "type": "error",
                     "data": {"message": f"监控错误: {str(e)}"}
-                }, ensure_ascii=False))
+                }))
                 break
     
     except WebSocketDisconnect:
@@ -276,19 +277,19 @@ async def websocket_global_endpoint(websocket: WebSocket):
         await websocket.accept()
         manager.active_connections.add(websocket)
         
-        await websocket.send_text(json.dumps({
+        await websocket.send_text(dumps_text({
             "type": "connected",
             "data": {"message": "已连接到全局WebSocket"}
-        }, ensure_ascii=False))
+        }))
         
         # 保持连接活跃
         while True:
             try:
                 # 发送心跳
-                await websocket.send_text(json.dumps({
+                await websocket.send_text(dumps_text({
                     "type": "heartbeat",
                     "data": {"timestamp": datetime.now().isoformat()}
-                }, ensure_ascii=False))
+                }))
                 
                 await asyncio.sleep(30)  # 每30秒发送一次心跳
                 
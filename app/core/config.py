@@ -42,6 +42,7 @@ class Settings:
     NOTE_TASK_TIMEOUT = int(os.getenv("NOTE_TASK_TIMEOUT", "300"))  # 5分钟
     NOTE_CONFIDENCE_THRESHOLD = float(os.getenv("NOTE_CONFIDENCE_THRESHOLD", "0.6"))
     NOTE_MAX_CONTENT_LENGTH = int(os.getenv("NOTE_MAX_CONTENT_LENGTH", "2000"))
+    NOTE_PROGRESS_DEBOUNCE = float(os.getenv("NOTE_PROGRESS_DEBOUNCE", "0.05"))  # 秒，合并该时间内的进度推送
     
     # AI模型配置
     NOTE_AI_MODEL = os.getenv("NOTE_AI_MODEL", "gemini-2.0-flash-exp")
@@ -0,0 +1,48 @@
+"""
+日志配置模块
+根日志器只挂载 QueueHandler，格式化和写出由 QueueListener 在后台线程完成，
+请求处理路径上的日志调用只需入队，不会被 stderr 等同步写入阻塞
+"""
+
+import logging
+import logging.handlers
+import os
+import queue
+from typing import Optional
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[logging.handlers.QueueHandler] = None
+
+
+def setup_logging() -> None:
+    """为根日志器配置队列日志，重复调用不会重复挂载"""
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    root = logging.getLogger()
+    _queue_handler = logging.handlers.QueueHandler(log_queue)
+    root.addHandler(_queue_handler)
+    root.setLevel(LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """从根日志器移除队列处理器，停止后台写日志线程并写出队列中剩余的日志"""
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    # 先摘除处理器，之后的日志不再进入无人消费的队列
+    logging.getLogger().removeHandler(_queue_handler)
+    _queue_handler = None
+    _listener.stop()
+    _listener = None
@@ -1,6 +1,6 @@
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, func
 from uuid import UUID
 from app.models.canvas import Canvas
 from app.models.card import Card
@@ -67,6 +67,15 @@ class CRUDCanvas:
         """获取画布中的卡片数量"""
         return db.query(Card).filter(Card.canvas_id == canvas_id).count()
 
+    def get_with_counts(self, db: Session, canvas_id: int) -> Optional[Tuple[Canvas, int]]:
+        """获取画布及其卡片数量（单次查询）"""
+        row = db.query(Canvas, func.count(Card.id)).outerjoin(
+            Card, Card.canvas_id == Canvas.id
+        ).filter(Canvas.id == canvas_id).group_by(Canvas.id).first()
+        if row is None:
+            return None
+        return row[0], row[1]
+
     def check_ownership(self, db: Session, canvas_id: int, owner_id: UUID) -> bool:
         """检查用户是否拥有该画布"""
         canvas = db.query(Canvas).filter(
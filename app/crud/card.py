@@ -1,6 +1,6 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, bindparam, func, insert, update
 from app.models.card import Card
 from app.schemas.canva import CardUpdateRequest
 
@@ -115,6 +115,67 @@ class CRUDCard:
             db.refresh(card)
         return updated_cards
 
+    def get_canvas_ids(self, db: Session, card_ids: List[int]) -> Dict[int, int]:
+        """一次查询多个卡片所属的画布，返回 {卡片ID: 画布ID}，不存在的卡片不在结果中"""
+        if not card_ids:
+            return {}
+        rows = db.query(Card.id, Card.canvas_id).filter(Card.id.in_(card_ids)).all()
+        return {row.id: row.canvas_id for row in rows}
+
+    def bulk_upsert(self, db: Session, canvas_id: int, cards_data: List[CardUpdateRequest], commit: bool = True) -> List[int]:
+        """
+        批量更新或创建画布中的卡片
+
+        card_id 不为空的卡片更新位置（content_id 不为空时一并更新内容），调用方需事先确认这些卡片属于该画布；
+        card_id 为空的卡片作为新卡片插入。更新和插入各使用一次 executemany 语句；
+        commit 为 False 时由调用方控制事务。返回与 cards_data 顺序一致的卡片ID列表。
+        """
+        update_rows = []
+        insert_rows = []
+        for card_data in cards_data:
+            if card_data.card_id is not None:
+                update_rows.append({
+                    "b_id": card_data.card_id,
+                    "b_position_x": card_data.position.x,
+                    "b_position_y": card_data.position.y,
+                    "b_content_id": card_data.content_id
+                })
+            else:
+                insert_rows.append({
+                    "canvas_id": canvas_id,
+                    "content_id": card_data.content_id,
+                    "position_x": card_data.position.x,
+                    "position_y": card_data.position.y
+                })
+
+        if update_rows:
+            table = Card.__table__
+            db.execute(
+                update(table)
+                .where(and_(table.c.id == bindparam("b_id"), table.c.canvas_id == canvas_id))
+                .values(
+                    position_x=bindparam("b_position_x"),
+                    position_y=bindparam("b_position_y"),
+                    content_id=func.coalesce(bindparam("b_content_id"), table.c.content_id)
+                ),
+                update_rows
+            )
+
+        new_ids = []
+        if insert_rows:
+            new_ids = list(db.scalars(
+                insert(Card).returning(Card.id, sort_by_parameter_order=True),
+                insert_rows
+            ))
+        if commit:
+            db.commit()
+
+        new_ids_iter = iter(new_ids)
+        return [
+            card_data.card_id if card_data.card_id is not None else next(new_ids_iter)
+            for card_data in cards_data
+        ]
+
     def check_canvas_ownership(self, db: Session, card_id: int, canvas_id: int) -> bool:
         """检查卡片是否属于指定画布"""
         card = db.query(Card).filter(
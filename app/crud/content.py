@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import List, Optional, Set
 from sqlalchemy.orm import Session
 from sqlalchemy import or_, and_, func
 from app.models.content import Content
@@ -16,6 +16,12 @@ class CRUDContent:
         """根据ID获取内容"""
         return db.query(Content).filter(Content.id == id).first()
 
+    def get_many(self, db: Session, ids: List[int]) -> List[Content]:
+        """根据ID列表批量获取内容"""
+        if not ids:
+            return []
+        return db.query(Content).filter(Content.id.in_(ids)).all()
+
     def get_multi(self, db: Session, skip: int = 0, limit: int = 100) -> List[Content]:
         """获取多个内容"""
         return db.query(Content).offset(skip).limit(limit).all()
@@ -112,6 +118,16 @@ class CRUDContent:
         ).first()
         return user_content is not None
 
+    def check_user_access_bulk(self, db: Session, content_ids: List[int], user_id: UUID) -> Set[int]:
+        """批量检查用户对内容的访问权限，返回有权访问的内容ID集合"""
+        if not content_ids:
+            return set()
+        rows = db.query(UserContent.content_id).filter(
+            UserContent.content_id.in_(content_ids),
+            UserContent.user_id == user_id
+        ).all()
+        return {row.content_id for row in rows}
+
     def get_content_usage_count(self, db: Session, content_id: int) -> int:
         """获取内容被使用的次数（在多少个卡片中）"""
         from app.models.card import Card
@@ -1,24 +1,38 @@
+import sys
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
 from app.core.config import settings
 from app.api.v2 import api_router
 from app.utils.task_manager import task_manager
+from app.utils.http_client import close_shared_async_client
+from app.core.logging import setup_logging, shutdown_logging
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
+    # 启动时配置队列日志，与关闭时的 shutdown_logging 成对
+    setup_logging()
     # 启动时初始化任务管理器
     await task_manager.start_cleanup_task()
     yield
-    # 关闭时清理资源（如果需要）
+    # 关闭时释放共享的上游连接池
+    await close_shared_async_client()
+    # OCR服务按需加载，仅在已加载时关闭其线程池和进程池
+    ocr_module = sys.modules.get("app.services.ocr_service")
+    if ocr_module is not None:
+        await ocr_module.ocr_service.close()
+    shutdown_logging()
 
 app = FastAPI(
     title="CogniBlock API",
     description="CogniBlock Backend API",
     version="2.0.0",
     openapi_url="/openapi.json",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -16,6 +16,19 @@ from app.schemas.canva import (
     CanvasResponse,
     ErrorResponse
 )
+from app.schemas import note_summary, ocr, smart_note
+from pydantic.dataclasses import rebuild_dataclass
+
+# 导入时完成热路径模型的schema构建，避免首个并发请求触发延迟构建
+for _dataclass_model in (PositionModel, CardResponse):
+    rebuild_dataclass(_dataclass_model, force=True)
+for _model in (
+    CanvaResponse,
+    note_summary.NoteInput, note_summary.SummaryRequest, note_summary.SummaryResult, note_summary.SummaryTaskResponse,
+    ocr.OCRTaskResponse, ocr.OCRTaskStatusResponse, ocr.OCRWebSocketMessage,
+    smart_note.SmartNoteResponse, smart_note.SmartNoteStatusResponse, smart_note.SmartNoteWebSocketMessage
+):
+    _model.model_rebuild(force=True)
 
 __all__ = [
     # User schemas
@@ -3,22 +3,28 @@
 包含请求和响应模型，以及数据验证规则
 """
 from typing import List, Optional
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, ConfigDict, Field, validator
+from pydantic.dataclasses import dataclass
 from uuid import UUID
 
 
-class PositionModel(BaseModel):
-    """位置模型"""
-    x: float = Field(..., description="X坐标", ge=0.0)
-    y: float = Field(..., description="Y坐标", ge=0.0)
-    
-    class Config:
-        json_schema_extra = {
+# 位置和卡片响应在拉取画布时按卡片批量构建，使用带 __slots__ 的不可变 pydantic dataclass 以减少实例开销
+@dataclass(
+    frozen=True,
+    slots=True,
+    config=ConfigDict(
+        json_schema_extra={
             "example": {
                 "x": 12.12,
                 "y": 86.21
             }
         }
+    )
+)
+class PositionModel:
+    """位置模型"""
+    x: float = Field(..., description="X坐标", ge=0.0)
+    y: float = Field(..., description="Y坐标", ge=0.0)
 
 
 class CanvaPullRequest(BaseModel):
@@ -59,15 +65,12 @@ class CardUpdateRequest(BaseModel):
         }
 
 
-class CardResponse(BaseModel):
-    """卡片响应模型"""
-    card_id: int = Field(..., description="卡片ID")
-    position: PositionModel = Field(..., description="卡片位置")
-    content_id: int = Field(..., description="内容ID")
-    
-    class Config:
-        from_attributes = True
-        json_schema_extra = {
+@dataclass(
+    frozen=True,
+    slots=True,
+    config=ConfigDict(
+        from_attributes=True,
+        json_schema_extra={
             "example": {
                 "card_id": 101,
                 "position": {
@@ -77,6 +80,13 @@ class CardResponse(BaseModel):
                 "content_id": 104
             }
         }
+    )
+)
+class CardResponse:
+    """卡片响应模型"""
+    card_id: int = Field(..., description="卡片ID")
+    position: PositionModel = Field(..., description="卡片位置")
+    content_id: int = Field(..., description="内容ID")
 
 
 class CanvaPushRequest(BaseModel):
@@ -238,4 +248,4 @@ class ErrorResponse(BaseModel):
                 "message": "指定的画布不存在",
                 "details": {"canvas_id": 12}
             }
-        }
\ No newline at end of file
+        }
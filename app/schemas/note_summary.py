@@ -2,8 +2,8 @@
 笔记总结相关的数据模型和验证
 """
 
-from typing import List, Optional
-from pydantic import BaseModel, Field, validator
+from typing import List, Literal, Optional
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
 from datetime import datetime
 from uuid import UUID
 
@@ -13,42 +13,45 @@ class NoteInput(BaseModel):
     title: str = Field(..., description="笔记标题", max_length=500)
     content: str = Field(..., description="笔记内容", min_length=1)
     
-    @validator('content')
-    def validate_content(cls, v):
+    @field_validator('content', mode='after')
+    @classmethod
+    def validate_content(cls, v: str) -> str:
         """验证笔记内容不能为空"""
         if not v or not v.strip():
             raise ValueError('笔记内容不能为空')
         return v.strip()
     
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "title": "机器学习基础概念",
                 "content": "机器学习是人工智能的一个分支，它使计算机能够在没有明确编程的情况下学习..."
             }
         }
+    )
 
 
 class SummaryRequest(BaseModel):
     """笔记总结请求模型"""
-    notes: List[NoteInput] = Field(..., description="笔记列表", min_items=1)
+    notes: List[NoteInput] = Field(..., description="笔记列表", min_length=1)
     min_notes_threshold: Optional[int] = Field(3, description="启用多笔记工作流的最小笔记数量", ge=1, le=10)
     
-    @validator('notes')
-    def validate_notes(cls, v):
+    @model_validator(mode='after')
+    def validate_notes(self) -> 'SummaryRequest':
         """验证笔记列表"""
-        if not v:
+        if not self.notes:
             raise ValueError('笔记列表不能为空')
         
         # 过滤掉空内容的笔记
-        valid_notes = [note for note in v if note.content and note.content.strip()]
+        valid_notes = [note for note in self.notes if note.content and note.content.strip()]
         if not valid_notes:
             raise ValueError('至少需要一份有效的笔记内容')
         
-        return valid_notes
+        self.notes = valid_notes
+        return self
     
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "notes": [
                     {
@@ -63,6 +66,7 @@ class SummaryRequest(BaseModel):
                 "min_notes_threshold": 3
             }
         }
+    )
 
 
 class SummaryResult(BaseModel):
@@ -71,10 +75,12 @@ class SummaryResult(BaseModel):
     topic: str = Field(..., description="主要主题")
     content: str = Field(..., description="总结内容（Markdown格式）")
     confidence_scores: List[float] = Field(..., description="置信度分数列表")
-    processing_method: str = Field(..., description="处理方法", pattern="^(single_summary|multi_note_workflow)$")
+    processing_method: Literal["single_summary", "multi_note_workflow"] = Field(..., description="处理方法")
     
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        frozen=True,
+        extra="forbid",
+        json_schema_extra={
             "example": {
                 "title": "机器学习与深度学习综合总结",
                 "topic": "人工智能基础概念",
@@ -83,20 +89,21 @@ class SummaryResult(BaseModel):
                 "processing_method": "multi_note_workflow"
             }
         }
+    )
 
 
 class SummaryTask(BaseModel):
     """总结任务模型"""
     task_id: str = Field(..., description="任务ID")
-    status: str = Field(..., description="任务状态", pattern="^(pending|processing|completed|failed)$")
+    status: Literal["pending", "processing", "completed", "failed"] = Field(..., description="任务状态")
     notes: List[NoteInput] = Field(..., description="输入的笔记列表")
     result: Optional[SummaryResult] = Field(None, description="总结结果")
     error_message: Optional[str] = Field(None, description="错误信息")
     created_at: datetime = Field(..., description="创建时间")
     completed_at: Optional[datetime] = Field(None, description="完成时间")
     
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "task_id": "550e8400-e29b-41d4-a716-446655440000",
                 "status": "completed",
@@ -118,6 +125,7 @@ class SummaryTask(BaseModel):
                 "completed_at": "2025-01-26T10:00:30Z"
             }
         }
+    )
 
 
 class SummaryTaskResponse(BaseModel):
@@ -129,9 +137,11 @@ class SummaryTaskResponse(BaseModel):
     created_at: datetime = Field(..., description="创建时间")
     completed_at: Optional[datetime] = Field(None, description="完成时间")
     
-    class Config:
-        from_attributes = True
-        json_schema_extra = {
+    model_config = ConfigDict(
+        from_attributes=True,
+        frozen=True,
+        extra="forbid",
+        json_schema_extra={
             "example": {
                 "task_id": "550e8400-e29b-41d4-a716-446655440000",
                 "status": "completed",
@@ -147,6 +157,7 @@ class SummaryTaskResponse(BaseModel):
                 "completed_at": "2025-01-26T10:00:30Z"
             }
         }
+    )
 
 
 class SummaryTaskCreate(BaseModel):
@@ -155,14 +166,17 @@ class SummaryTaskCreate(BaseModel):
     status: str = Field(..., description="任务状态")
     message: str = Field(..., description="创建消息")
     
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        frozen=True,
+        extra="forbid",
+        json_schema_extra={
             "example": {
                 "task_id": "550e8400-e29b-41d4-a716-446655440000",
                 "status": "pending",
                 "message": "笔记总结任务已创建，正在处理中..."
             }
         }
+    )
 
 
 class SummaryErrorResponse(BaseModel):
@@ -171,8 +185,10 @@ class SummaryErrorResponse(BaseModel):
     task_id: Optional[str] = Field(None, description="任务ID")
     timestamp: datetime = Field(..., description="错误时间戳")
     
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        frozen=True,
+        extra="forbid",
+        json_schema_extra={
             "example": {
                 "error": {
                     "code": "PROCESSING_FAILED",
@@ -182,4 +198,5 @@ class SummaryErrorResponse(BaseModel):
                 "task_id": "550e8400-e29b-41d4-a716-446655440000",
                 "timestamp": "2025-01-26T10:00:00Z"
             }
-        }
\ No newline at end of file
+        }
+    )
@@ -2,8 +2,8 @@
 OCR API 数据模式定义
 """
 
-from typing import Optional, List, Dict, Any
-from pydantic import BaseModel, Field
+from typing import Optional, List, Dict, Any, Literal
+from pydantic import BaseModel, ConfigDict, Field
 from enum import Enum
 
 
@@ -24,9 +24,21 @@ class OCRTaskStatus(str, Enum):
     FAILED = "failed"
 
 
+# 模型字段使用 Literal 标注，校验时为字符串集合匹配，无需枚举转换；
+# 枚举类保留给需要 .value 的外部代码
+OCRModelName = Literal[
+    "gemini-2.5-pro",
+    "gemini-2.0-flash-exp",
+    "qwen-vl-plus",
+    "qwen-vl-max-latest",
+    "qwen/qwen2.5-vl-72b-instruct",
+]
+OCRTaskStatusValue = Literal["pending", "processing", "completed", "failed"]
+
+
 class OCRRequest(BaseModel):
     """OCR请求模型"""
-    model: OCRModel = Field(default=OCRModel.GEMINI_2_0_FLASH, description="使用的OCR模型")
+    model: OCRModelName = Field(default=OCRModel.GEMINI_2_0_FLASH.value, description="使用的OCR模型")
     prompt: str = Field(
         default="请提取这张图片中的所有文字内容，保持原有的格式和布局。",
         description="OCR提示词"
@@ -37,17 +49,21 @@ class OCRRequest(BaseModel):
 class OCRTaskResponse(BaseModel):
     """OCR任务响应模型"""
     task_id: str = Field(description="任务ID")
-    status: OCRTaskStatus = Field(description="任务状态")
+    status: OCRTaskStatusValue = Field(description="任务状态")
     message: str = Field(description="响应消息")
+    
+    model_config = ConfigDict(frozen=True, extra="forbid")
 
 
 class OCRTaskStatusResponse(BaseModel):
     """OCR任务状态响应模型"""
     task_id: str = Field(description="任务ID")
-    status: OCRTaskStatus = Field(description="任务状态")
+    status: OCRTaskStatusValue = Field(description="任务状态")
     progress: int = Field(description="处理进度 (0-100)")
     result: Optional[str] = Field(default=None, description="识别结果")
     error: Optional[str] = Field(default=None, description="错误信息")
+    
+    model_config = ConfigDict(frozen=True, extra="forbid")
 
 
 class OCRResultResponse(BaseModel):
@@ -55,12 +71,16 @@ class OCRResultResponse(BaseModel):
     task_id: str = Field(description="任务ID")
     result: str = Field(description="识别结果")
     model: str = Field(description="使用的模型")
+    
+    model_config = ConfigDict(frozen=True, extra="forbid")
 
 
 class OCRStreamChunk(BaseModel):
     """OCR流式响应块"""
     chunk: str = Field(description="文本片段")
     finished: bool = Field(default=False, description="是否完成")
+    
+    model_config = ConfigDict(frozen=True, extra="forbid")
 
 
 class ModelInfo(BaseModel):
@@ -70,15 +90,21 @@ class ModelInfo(BaseModel):
     supports_stream: bool = Field(description="是否支持流式输出")
     description: str = Field(description="模型描述")
     available: bool = Field(default=False, description="模型是否可用")
+    
+    model_config = ConfigDict(frozen=True, extra="forbid")
 
 
 class ModelsResponse(BaseModel):
     """模型列表响应"""
     models: List[ModelInfo] = Field(..., description="可用模型列表")
+    
+    model_config = ConfigDict(frozen=True, extra="forbid")
 
 
 class OCRWebSocketMessage(BaseModel):
     """WebSocket消息模型"""
     type: str = Field(description="消息类型: status, chunk, error, complete")
     task_id: str = Field(description="任务ID")
-    data: Optional[Dict[str, Any]] = Field(default=None, description="消息数据")
\ No newline at end of file
+    data: Optional[Dict[str, Any]] = Field(default=None, description="消息数据")
+    
+    model_config = ConfigDict(frozen=True, extra="forbid")
@@ -2,8 +2,8 @@
 智能笔记API数据模式定义
 """
 
-from typing import Optional, List, Dict, Any
-from pydantic import BaseModel, Field
+from typing import Optional, List, Dict, Any, Literal
+from pydantic import BaseModel, ConfigDict, Field
 from enum import Enum
 
 
@@ -17,6 +17,18 @@ class ProcessingStatus(str, Enum):
     FAILED = "failed"
 
 
+# 模型字段使用 Literal 标注，校验时为字符串集合匹配，无需枚举转换；
+# 枚举类保留给需要 .value 的外部代码
+ProcessingStatusValue = Literal[
+    "pending",
+    "ocr_processing",
+    "correction_processing",
+    "summary_processing",
+    "completed",
+    "failed",
+]
+
+
 class SmartNoteRequest(BaseModel):
     """智能笔记请求模型"""
     title: str = Field(default="", description="笔记标题（可选）")
@@ -31,18 +43,22 @@ class SmartNoteTextRequest(BaseModel):
 class SmartNoteResponse(BaseModel):
     """智能笔记任务响应模型"""
     task_id: str = Field(description="任务ID")
-    status: ProcessingStatus = Field(description="处理状态")
+    status: ProcessingStatusValue = Field(description="处理状态")
     message: str = Field(description="响应消息")
+    
+    model_config = ConfigDict(frozen=True, extra="forbid")
 
 
 class SmartNoteStatusResponse(BaseModel):
     """智能笔记任务状态响应模型"""
     task_id: str = Field(description="任务ID")
-    status: ProcessingStatus = Field(description="处理状态")
+    status: ProcessingStatusValue = Field(description="处理状态")
     progress: int = Field(description="处理进度 (0-100)")
     current_step: Optional[str] = Field(default=None, description="当前处理步骤")
     error: Optional[str] = Field(default=None, description="错误信息")
     content_id: Optional[int] = Field(default=None, description="内容ID（完成后可用）")
+    
+    model_config = ConfigDict(frozen=True, extra="forbid")
 
 
 class SmartNoteResultResponse(BaseModel):
@@ -52,6 +68,8 @@ class SmartNoteResultResponse(BaseModel):
     corrected_result: Optional[str] = Field(description="纠错校正结果")
     summary_result: Optional[str] = Field(description="笔记总结结果")
     content_id: Optional[int] = Field(description="保存的内容ID")
+    
+    model_config = ConfigDict(frozen=True, extra="forbid")
 
 
 class ProcessingStep(BaseModel):
@@ -59,15 +77,21 @@ class ProcessingStep(BaseModel):
     step: int = Field(description="步骤序号")
     name: str = Field(description="步骤名称")
     description: str = Field(description="步骤描述")
+    
+    model_config = ConfigDict(frozen=True, extra="forbid")
 
 
 class ProcessingStepResponse(BaseModel):
     """处理步骤响应模型"""
     steps: List[ProcessingStep] = Field(description="处理步骤列表")
+    
+    model_config = ConfigDict(frozen=True, extra="forbid")
 
 
 class SmartNoteWebSocketMessage(BaseModel):
     """WebSocket消息模型"""
     type: str = Field(description="消息类型: status, complete, error")
     task_id: str = Field(description="任务ID")
-    data: Optional[Dict[str, Any]] = Field(default=None, description="消息数据")
\ No newline at end of file
+    data: Optional[Dict[str, Any]] = Field(default=None, description="消息数据")
+    
+    model_config = ConfigDict(frozen=True, extra="forbid")
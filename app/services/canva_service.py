@@ -6,6 +6,8 @@
 import logging
 from typing import List, Optional, Dict, Any
 from uuid import UUID
+from pydantic import TypeAdapter
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
 
@@ -20,6 +22,9 @@ from app.models.content import Content
 
 logger = logging.getLogger(__name__)
 
+# 预构建的序列化器，路由可直接输出JSON字节，跳过FastAPI的通用编码流程
+CARD_LIST_ADAPTER = TypeAdapter(List[CardResponse])
+
 
 class CanvaServiceError(Exception):
     """画布服务异常基类"""
@@ -41,6 +46,12 @@ class CanvaNotFoundError(CanvaServiceError):
         super().__init__(message, "CANVA_NOT_FOUND")
 
 
+class CardNotFoundError(CanvaServiceError):
+    """卡片未找到异常"""
+    def __init__(self, message: str = "卡片不存在"):
+        super().__init__(message, "CARD_NOT_FOUND")
+
+
 class DataConsistencyError(CanvaServiceError):
     """数据一致性异常"""
     def __init__(self, message: str = "数据一致性错误"):
@@ -48,19 +59,17 @@ class DataConsistencyError(CanvaServiceError):
 
 
 class CanvaService:
-    """画布业务服务类"""
-    
-    def __init__(self):
-        self.logger = logging.getLogger(__name__)
+    """画布业务服务类（无状态，方法均为静态方法）"""
     
-    def verify_user_permission(self, db: Session, canva_id: int, user_id: UUID) -> Canvas:
+    @staticmethod
+    def verify_user_permission(db: Session, canva_id: int, user_id: UUID) -> Canvas:
         """
         验证用户对画布的访问权限
         
         Args:
             db: 数据库会话
             canva_id: 画布ID
-            user_id: 用户ID
+            user_id: 用户ID（已在认证依赖中解析为UUID，服务层不再重复转换）
             
         Returns:
             Canvas: 画布对象
@@ -72,17 +81,18 @@ class CanvaService:
         # 检查画布是否存在
         canva = canvas.get(db, canva_id)
         if not canva:
-            self.logger.warning(f"画布不存在: canva_id={canva_id}")
+            logger.warning("画布不存在: canva_id=%s", canva_id)
             raise CanvaNotFoundError(f"画布 {canva_id} 不存在")
         
-        # 检查用户权限
-        if not canvas.check_ownership(db, canva_id, user_id):
-            self.logger.warning(f"用户权限不足: user_id={user_id}, canva_id={canva_id}")
+        # 检查用户权限：直接比较已加载的owner_id，无需再次查询数据库
+        if canva.owner_id != user_id:
+            logger.warning("用户权限不足: user_id=%s, canva_id=%s", user_id, canva_id)
             raise PermissionDeniedError(f"用户无权访问画布 {canva_id}")
         
         return canva
     
-    def verify_content_access(self, db: Session, content_id: int, user_id: UUID) -> Content:
+    @staticmethod
+    def verify_content_access(db: Session, content_id: int, user_id: UUID) -> Content:
         """
         验证用户对内容的访问权限
         
@@ -108,7 +118,8 @@ class CanvaService:
         
         return content_obj
     
-    def validate_card_data_consistency(self, db: Session, cards_data: List[CardUpdateRequest], user_id: UUID) -> None:
+    @staticmethod
+    def validate_card_data_consistency(db: Session, cards_data: List[CardUpdateRequest], user_id: UUID) -> None:
         """
         验证卡片数据的一致性
         
@@ -120,24 +131,35 @@ class CanvaService:
         Raises:
             DataConsistencyError: 数据一致性错误
         """
-        # 检查卡片ID是否重复
-        card_ids = [card_data.card_id for card_data in cards_data]
-        if len(card_ids) != len(set(card_ids)):
-            raise DataConsistencyError("卡片ID不能重复")
-        
-        # 验证每个卡片的内容访问权限
-        for card_data in cards_data:
-            try:
-                self.verify_content_access(db, card_data.content_id, user_id)
-            except CanvaServiceError as e:
-                raise DataConsistencyError(f"卡片 {card_data.card_id} 的内容验证失败: {e.message}")
+        # 批量查询卡片关联内容的存在性和访问权限
+        content_ids = list({card_data.content_id for card_data in cards_data if card_data.content_id is not None})
+        existing_ids = {content_obj.id for content_obj in content.get_many(db, content_ids)}
+        accessible_ids = content.check_user_access_bulk(db, content_ids, user_id)
         
-        # 验证位置数据
+        # 单次遍历完成重复ID、内容权限和位置检查，遇到第一个错误即返回；
+        # card_id 为空表示新卡片，content_id 为空表示不修改内容，均不参与对应检查
+        seen_card_ids = set()
+        add_card_id = seen_card_ids.add
         for card_data in cards_data:
-            if card_data.position.x < 0 or card_data.position.y < 0:
-                raise DataConsistencyError(f"卡片 {card_data.card_id} 的位置坐标不能为负数")
+            card_id = card_data.card_id
+            if card_id is not None:
+                if card_id in seen_card_ids:
+                    raise DataConsistencyError(f"卡片ID不能重复: {card_id}")
+                add_card_id(card_id)
+            
+            content_id = card_data.content_id
+            if content_id is not None:
+                if content_id not in existing_ids:
+                    raise DataConsistencyError(f"卡片 {card_id} 的内容验证失败: 内容 {content_id} 不存在")
+                if content_id not in accessible_ids:
+                    raise DataConsistencyError(f"卡片 {card_id} 的内容验证失败: 用户无权访问内容 {content_id}")
+            
+            position = card_data.position
+            if position.x < 0 or position.y < 0:
+                raise DataConsistencyError(f"卡片 {card_id} 的位置坐标不能为负数")
     
-    def pull_canva(self, db: Session, request: CanvaPullRequest, user_id: UUID) -> CanvaResponse:
+    @staticmethod
+    def pull_canva(db: Session, request: CanvaPullRequest, user_id: UUID) -> CanvaResponse:
         """
         拉取画布当前状态
         
@@ -155,44 +177,51 @@ class CanvaService:
         """
         try:
             # 验证用户权限
-            canva_obj = self.verify_user_permission(db, request.canva_id, user_id)
+            canva_obj = CanvaService.verify_user_permission(db, request.canva_id, user_id)
             
             # 获取画布中的所有卡片
             cards_list = card.get_by_canvas(db, request.canva_id)
             
+            # 一次性批量查询内容及访问权限，避免逐卡片查询
+            content_ids = list({card_obj.content_id for card_obj in cards_list})
+            existing_ids = {content_obj.id for content_obj in content.get_many(db, content_ids)}
+            accessible_ids = content.check_user_access_bulk(db, content_ids, user_id)
+            
             # 构建响应数据
             card_responses = []
             for card_obj in cards_list:
-                # 验证内容访问权限
-                try:
-                    self.verify_content_access(db, card_obj.content_id, user_id)
-                    
-                    card_response = CardResponse(
-                        card_id=card_obj.id,
-                        position=PositionModel(x=card_obj.position_x, y=card_obj.position_y),
-                        content_id=card_obj.content_id
-                    )
-                    card_responses.append(card_response)
-                except CanvaServiceError as e:
-                    # 记录权限问题但不中断整个操作
-                    self.logger.warning(f"跳过无权限访问的卡片: card_id={card_obj.id}, {e.message}")
+                # 记录权限问题但不中断整个操作
+                if card_obj.content_id not in existing_ids:
+                    logger.warning("跳过无权限访问的卡片: card_id=%s, 内容 %s 不存在", card_obj.id, card_obj.content_id)
+                    continue
+                if card_obj.content_id not in accessible_ids:
+                    logger.warning("跳过无权限访问的卡片: card_id=%s, 用户无权访问内容 %s", card_obj.id, card_obj.content_id)
                     continue
+                
+                card_response = CardResponse(
+                    card_id=card_obj.id,
+                    position=PositionModel(x=card_obj.position_x, y=card_obj.position_y),
+                    content_id=card_obj.content_id
+                )
+                card_responses.append(card_response)
             
             response = CanvaResponse(
                 canva_id=request.canva_id,
                 cards=card_responses
             )
             
-            self.logger.info(f"成功拉取画布: canva_id={request.canva_id}, cards_count={len(card_responses)}")
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("成功拉取画布: canva_id=%s, cards_count=%s", request.canva_id, len(card_responses))
             return response
             
         except CanvaServiceError:
             raise
         except Exception as e:
-            self.logger.error(f"拉取画布失败: {str(e)}")
+            logger.error("拉取画布失败: %s", e)
             raise CanvaServiceError(f"拉取画布失败: {str(e)}")
     
-    def push_canva(self, db: Session, request: CanvaPushRequest, user_id: UUID) -> Dict[str, Any]:
+    @staticmethod
+    def push_canva(db: Session, request: CanvaPushRequest, user_id: UUID) -> Dict[str, Any]:
         """
         推送画布更新
         
@@ -207,73 +236,61 @@ class CanvaService:
         Raises:
             CanvaNotFoundError: 画布不存在
             PermissionDeniedError: 权限不足
-            DataConsistencyError: 数据一致性错误
+            CardNotFoundError: 要更新的卡片不存在
+            DataConsistencyError: 数据一致性错误，包括卡片不属于该画布
         """
         try:
             # 验证用户权限
-            canva_obj = self.verify_user_permission(db, request.canva_id, user_id)
+            canva_obj = CanvaService.verify_user_permission(db, request.canva_id, user_id)
             
             # 验证数据一致性
-            self.validate_card_data_consistency(db, request.cards, user_id)
-            
-            # 开始事务处理
-            updated_cards = []
-            failed_cards = []
-            
-            for card_data in request.cards:
-                try:
-                    # 检查卡片是否存在于该画布中
-                    card_obj = card.get_by_canvas_and_id(db, request.canva_id, card_data.card_id)
-                    
-                    if card_obj:
-                        # 更新现有卡片
-                        updated_card = card.update(db, card_obj, card_data)
-                        updated_cards.append(updated_card.id)
-                    else:
-                        # 创建新卡片
-                        new_card = card.create(
-                            db=db,
-                            canvas_id=request.canva_id,
-                            content_id=card_data.content_id,
-                            position_x=card_data.position.x,
-                            position_y=card_data.position.y
-                        )
-                        updated_cards.append(new_card.id)
-                        
-                except Exception as e:
-                    self.logger.error(f"更新卡片失败: card_id={card_data.card_id}, error={str(e)}")
-                    failed_cards.append({
-                        "card_id": card_data.card_id,
-                        "error": str(e)
-                    })
-            
-            # 检查是否有失败的操作
-            if failed_cards:
-                raise DataConsistencyError(f"部分卡片更新失败: {failed_cards}")
+            CanvaService.validate_card_data_consistency(db, request.cards, user_id)
+            
+            # 一次查询校验所有待更新卡片的存在性和归属
+            card_ids = [card_data.card_id for card_data in request.cards if card_data.card_id is not None]
+            card_canvas_ids = card.get_canvas_ids(db, card_ids)
+            for card_id in card_ids:
+                if card_id not in card_canvas_ids:
+                    raise CardNotFoundError(f"Card with id {card_id} not found")
+                if card_canvas_ids[card_id] != request.canva_id:
+                    raise DataConsistencyError(f"Card {card_id} does not belong to canvas {request.canva_id}")
+            
+            # 批量更新/插入卡片并刷新画布修改时间，整个更新在同一事务内完成并只提交一次；
+            # 外键或唯一约束冲突由下方统一回滚，作为数据一致性错误返回
+            result_card_ids = card.bulk_upsert(db, request.canva_id, request.cards, commit=False)
+            canva_obj.updated_at = func.now()
+            db.commit()
+            
+            created_cards = [
+                card_id for card_id, card_data in zip(result_card_ids, request.cards) if card_data.card_id is None
+            ]
             
             result = {
                 "success": True,
                 "message": "画布更新成功",
                 "canva_id": request.canva_id,
-                "updated_cards_count": len(updated_cards),
-                "updated_card_ids": updated_cards
+                "created_card_ids": created_cards,
+                "updated_cards_count": len(result_card_ids),
+                "updated_card_ids": result_card_ids
             }
             
-            self.logger.info(f"成功推送画布更新: canva_id={request.canva_id}, updated_cards={len(updated_cards)}")
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("成功推送画布更新: canva_id=%s, updated_cards=%s", request.canva_id, len(result_card_ids))
             return result
             
         except CanvaServiceError:
             raise
         except SQLAlchemyError as e:
             db.rollback()
-            self.logger.error(f"数据库操作失败: {str(e)}")
+            logger.error("数据库操作失败: %s", e)
             raise DataConsistencyError(f"数据库操作失败: {str(e)}")
         except Exception as e:
             db.rollback()
-            self.logger.error(f"推送画布更新失败: {str(e)}")
+            logger.error("推送画布更新失败: %s", e)
             raise CanvaServiceError(f"推送画布更新失败: {str(e)}")
     
-    def get_canva_info(self, db: Session, canva_id: int, user_id: UUID) -> Dict[str, Any]:
+    @staticmethod
+    def get_canva_info(db: Session, canva_id: int, user_id: UUID) -> Dict[str, Any]:
         """
         获取画布基本信息
         
@@ -286,11 +303,16 @@ class CanvaService:
             Dict[str, Any]: 画布信息
         """
         try:
-            # 验证用户权限
-            canva_obj = self.verify_user_permission(db, canva_id, user_id)
+            # 单次查询获取画布及卡片数量，再在内存中校验权限
+            canva_with_count = canvas.get_with_counts(db, canva_id)
+            if not canva_with_count:
+                logger.warning("画布不存在: canva_id=%s", canva_id)
+                raise CanvaNotFoundError(f"画布 {canva_id} 不存在")
             
-            # 获取卡片数量
-            cards_count = canvas.get_cards_count(db, canva_id)
+            canva_obj, cards_count = canva_with_count
+            if canva_obj.owner_id != user_id:
+                logger.warning("用户权限不足: user_id=%s, canva_id=%s", user_id, canva_id)
+                raise PermissionDeniedError(f"用户无权访问画布 {canva_id}")
             
             return {
                 "canva_id": canva_obj.id,
@@ -304,10 +326,11 @@ class CanvaService:
         except CanvaServiceError:
             raise
         except Exception as e:
-            self.logger.error(f"获取画布信息失败: {str(e)}")
+            logger.error("获取画布信息失败: %s", e)
             raise CanvaServiceError(f"获取画布信息失败: {str(e)}")
     
-    def validate_canva_state(self, db: Session, canva_id: int, user_id: UUID) -> Dict[str, Any]:
+    @staticmethod
+    def validate_canva_state(db: Session, canva_id: int, user_id: UUID) -> Dict[str, Any]:
         """
         验证画布状态的一致性
         
@@ -321,7 +344,7 @@ class CanvaService:
         """
         try:
             # 验证用户权限
-            self.verify_user_permission(db, canva_id, user_id)
+            CanvaService.verify_user_permission(db, canva_id, user_id)
             
             # 获取所有卡片
             cards_list = card.get_by_canvas(db, canva_id)
@@ -334,10 +357,14 @@ class CanvaService:
                 "issues": []
             }
             
+            # 一次性批量查询内容及访问权限
+            content_ids = list({card_obj.content_id for card_obj in cards_list})
+            existing_ids = {content_obj.id for content_obj in content.get_many(db, content_ids)}
+            accessible_ids = content.check_user_access_bulk(db, content_ids, user_id)
+            
             for card_obj in cards_list:
                 # 检查内容是否存在
-                content_obj = content.get(db, card_obj.content_id)
-                if not content_obj:
+                if card_obj.content_id not in existing_ids:
                     validation_result["invalid_cards"] += 1
                     validation_result["issues"].append({
                         "card_id": card_obj.id,
@@ -346,7 +373,7 @@ class CanvaService:
                     continue
                 
                 # 检查用户是否有权限访问内容
-                if not content.check_user_access(db, card_obj.content_id, user_id):
+                if card_obj.content_id not in accessible_ids:
                     validation_result["invalid_cards"] += 1
                     validation_result["issues"].append({
                         "card_id": card_obj.id,
@@ -363,7 +390,7 @@ class CanvaService:
         except CanvaServiceError:
             raise
         except Exception as e:
-            self.logger.error(f"验证画布状态失败: {str(e)}")
+            logger.error("验证画布状态失败: %s", e)
             raise CanvaServiceError(f"验证画布状态失败: {str(e)}")
 
 
@@ -4,18 +4,60 @@ OCR服务
 """
 
 import asyncio
+import functools
+import hashlib
+import heapq
 import logging
+import multiprocessing
 import os
+import tempfile
+import threading
 import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional, AsyncIterator
+from typing import Dict, Any, Optional, AsyncIterator, BinaryIO, Callable, Iterator, List, Tuple
 from dataclasses import dataclass, field
 from enum import Enum
 
 from app.utils.multi_model_ocr import MultiModelOCR, ModelConfig
+from app.utils.image_processing import compress_image
 
 logger = logging.getLogger(__name__)
 
+# 同时进行的上游OCR调用上限，防止突发请求压垮模型服务触发限流
+OCR_MAX_CONCURRENCY = int(os.getenv("OCR_MAX_CONCURRENCY", "8"))
+# 上游模型调用专用线程数，不小于并发上限，避免长时间的流式调用占满默认线程池
+OCR_AI_THREADS = max(int(os.getenv("OCR_AI_THREADS", str(OCR_MAX_CONCURRENCY))), OCR_MAX_CONCURRENCY)
+# 全局每秒请求上限，以及触发上游限流后所有调用方统一暂停的秒数
+OCR_MAX_RPS = float(os.getenv("OCR_MAX_RPS", "5"))
+OCR_RATE_LIMIT_BACKOFF = float(os.getenv("OCR_RATE_LIMIT_BACKOFF", "5"))
+OCR_RATE_LIMIT_RETRIES = int(os.getenv("OCR_RATE_LIMIT_RETRIES", "2"))
+# 上传图片的最大像素面积，超出时在发送给模型前等比缩小
+OCR_MAX_IMAGE_AREA = int(os.getenv("OCR_MAX_IMAGE_AREA", str(2048 * 2048)))
+# 排队任务的图片超过该字节数时转存到临时文件（目录由 TMPDIR 决定），不常驻内存
+OCR_IMAGE_SPOOL_BYTES = int(os.getenv("OCR_IMAGE_SPOOL_BYTES", str(512 * 1024)))
+# 图片压缩等CPU密集任务使用的进程数，为0时退回默认线程池
+OCR_CPU_WORKERS = int(os.getenv("OCR_CPU_WORKERS", str(max((os.cpu_count() or 1) - 1, 0))))
+
+# 等待处理的任务队列容量，队列满时拒绝新任务
+OCR_QUEUE_SIZE = int(os.getenv("OCR_QUEUE_SIZE", "1024"))
+
+# 可用模型列表的缓存时长（秒）
+MODELS_CACHE_TTL = float(os.getenv("OCR_MODELS_CACHE_TTL", "60"))
+
+# 已完成或失败任务的保留时长，以及任何任务的最长保留时长
+FINISHED_TASK_TTL = timedelta(hours=1)
+TASK_MAX_AGE = timedelta(hours=24)
+
+
+def _is_rate_limited(error: Exception) -> bool:
+    """判断异常是否由上游限流引起"""
+    if getattr(error, "status_code", None) == 429:
+        return True
+    message = str(error).lower()
+    return "429" in message or "rate limit" in message or "quota" in message
+
 
 class OCRTaskStatus(Enum):
     """OCR任务状态"""
@@ -37,7 +79,56 @@ class OCRTask:
     progress: int = 0
     result: Optional[str] = None
     error: Optional[str] = None
-    image_data: Optional[bytes] = field(default=None, repr=False)
+    image_file: Optional[BinaryIO] = field(default=None, repr=False)
+    image_digest: Optional[str] = field(default=None, repr=False)
+
+
+def _spool_task_image(image_data: bytes) -> Tuple[BinaryIO, str]:
+    """
+    将图片写入临时缓冲，超过阈值时由 SpooledTemporaryFile 自动转存到磁盘
+    
+    Returns:
+        (图片缓冲, 图片的SHA-256摘要)
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=OCR_IMAGE_SPOOL_BYTES)
+    spool.write(image_data)
+    return spool, hashlib.sha256(image_data).hexdigest()
+
+
+def _read_task_image(image_file: BinaryIO) -> bytes:
+    """读出任务图片并立即释放临时缓冲"""
+    try:
+        image_file.seek(0)
+        return image_file.read()
+    finally:
+        image_file.close()
+
+
+class RateLimiter:
+    """全局请求限速器，按固定间隔发放调用时隙，并支持限流时整体暂停"""
+    
+    def __init__(self, max_rate: float, loop: asyncio.AbstractEventLoop):
+        self.interval = 1.0 / max_rate if max_rate > 0 else 0.0
+        self.loop = loop
+        self._next_slot = 0.0
+        self._resume = asyncio.Event()
+        self._resume.set()
+    
+    async def acquire(self):
+        """等待暂停结束并占用下一个调用时隙"""
+        await self._resume.wait()
+        now = self.loop.time()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+    
+    def pause(self, seconds: float):
+        """暂停所有调用方，重复触发时不延长已有的暂停窗口"""
+        if not self._resume.is_set():
+            return
+        self._resume.clear()
+        self.loop.call_later(seconds, self._resume.set)
 
 
 class OCRService:
@@ -45,13 +136,39 @@ class OCRService:
     
     def __init__(self):
         """初始化OCR服务"""
-        self.tasks: Dict[str, OCRTask] = {}
+        # 任务按创建时间顺序插入，最旧的任务始终位于队首
+        self.tasks: "OrderedDict[str, OCRTask]" = OrderedDict()
+        # 已结束任务的 (过期时间, 任务ID) 最小堆
+        self._finished_heap: List[Tuple[datetime, str]] = []
+        # 出现更早的过期时间时唤醒清理协程重新计算休眠时长
+        self._expiry_changed = asyncio.Event()
         self.running_tasks: Dict[str, asyncio.Task] = {}
+        # 进行中的上游调用，键为 (图片摘要, 模型, 提示词)
+        self._inflight: Dict[Tuple[str, str, str], asyncio.Future] = {}
         self.ocr_client = None
         self._init_clients()
         
-        # 启动清理任务
-        asyncio.create_task(self._cleanup_expired_tasks())
+        # 可用模型缓存：完整信息与可用模型名集合，过期后按需刷新
+        self._models_cache: Dict[str, Dict[str, Any]] = {}
+        self._available_model_names: frozenset = frozenset()
+        self._models_cached_at: Optional[float] = None
+        
+        # 记录服务所属的事件循环，工作线程通过它把结果投递回来
+        self.loop = asyncio.get_running_loop()
+        self._sem = asyncio.Semaphore(OCR_MAX_CONCURRENCY)
+        self.limiter = RateLimiter(OCR_MAX_RPS, self.loop)
+        # 上游模型调用使用独立线程池，图片压缩等CPU任务仍走默认线程池
+        self.ai_executor = ThreadPoolExecutor(max_workers=OCR_AI_THREADS, thread_name_prefix="ocr-ai")
+        # 图片解码和重编码在PIL中大部分持有GIL，放到独立进程才能利用多核；
+        # 进程池在首次需要时创建，由 close 关闭
+        self.cpu_pool: Optional[ProcessPoolExecutor] = None
+        
+        # 固定数量的工作协程从队列中取任务处理，突发提交只在队列中排队
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=OCR_QUEUE_SIZE)
+        self.workers = [self.loop.create_task(self._worker()) for _ in range(OCR_MAX_CONCURRENCY)]
+        
+        # 启动清理任务，保留引用避免被垃圾回收
+        self.cleanup_job = self.loop.create_task(self._cleanup_expired_tasks())
     
     def _init_clients(self):
         """初始化OCR客户端"""
@@ -75,21 +192,114 @@ class OCRService:
             logger.error(f"OCR客户端初始化失败: {e}")
             self.ocr_client = None
     
+    def _post(self, callback: Callable[..., Any], *args: Any) -> None:
+        """从工作线程把回调投递到服务事件循环执行"""
+        self.loop.call_soon_threadsafe(callback, *args)
+    
+    async def _run_blocking(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """在默认线程池中执行同步函数，避免阻塞事件循环"""
+        return await self.loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+    
+    async def _run_cpu_bound(self, func: Callable[..., Any], *args: Any) -> Any:
+        """在进程池中执行CPU密集的模块级函数，未启用进程池时使用默认线程池"""
+        if self.cpu_pool is None and OCR_CPU_WORKERS > 0:
+            # 服务已启动多个线程，使用spawn避免fork时复制其他线程持有的锁
+            self.cpu_pool = ProcessPoolExecutor(
+                max_workers=OCR_CPU_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return await self.loop.run_in_executor(self.cpu_pool, func, *args)
+    
+    async def _run_ai_call(self, func: Callable[..., Any], **kwargs: Any) -> Any:
+        """在模型调用专用线程池中执行同步的上游调用"""
+        return await self.loop.run_in_executor(self.ai_executor, functools.partial(func, **kwargs))
+    
+    async def _call_with_limit(self, func: Callable[..., Any], **kwargs: Any) -> Any:
+        """
+        经全局限速器调用上游模型，遇到限流时暂停所有调用方后重试
+        
+        Args:
+            func: 同步的模型调用函数
+            **kwargs: 调用参数
+            
+        Returns:
+            模型调用结果
+        """
+        for attempt in range(OCR_RATE_LIMIT_RETRIES + 1):
+            await self.limiter.acquire()
+            try:
+                return await self._run_ai_call(func, **kwargs)
+            except Exception as e:
+                if not _is_rate_limited(e) or attempt == OCR_RATE_LIMIT_RETRIES:
+                    raise
+                logger.warning("上游OCR触发限流，全局暂停 %.1f 秒后重试", OCR_RATE_LIMIT_BACKOFF)
+                self.limiter.pause(OCR_RATE_LIMIT_BACKOFF)
+    
+    async def _iterate_in_thread(self, iterator_factory: Callable[[], Iterator[str]]) -> AsyncIterator[str]:
+        """
+        在线程池中消费同步生成器，并把片段逐个投递回事件循环
+        
+        Args:
+            iterator_factory: 返回同步生成器的可调用对象
+            
+        Yields:
+            生成器产出的片段
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        finished = object()
+        stop_event = threading.Event()
+        
+        def produce():
+            try:
+                for chunk in iterator_factory():
+                    if stop_event.is_set():
+                        break
+                    self._post(queue.put_nowait, chunk)
+            except Exception as e:
+                self._post(queue.put_nowait, e)
+            finally:
+                self._post(queue.put_nowait, finished)
+        
+        producer = self.loop.run_in_executor(self.ai_executor, produce)
+        try:
+            while True:
+                item = await queue.get()
+                if item is finished:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # 消费方提前退出时通知工作线程停止拉取
+            stop_event.set()
+            await producer
+    
     def get_available_models(self) -> Dict[str, Dict[str, Any]]:
-        """获取可用的OCR模型"""
+        """获取可用的OCR模型，结果在 MODELS_CACHE_TTL 秒内复用"""
         if not self.ocr_client:
             return {}
         
+        now = self.loop.time()
+        if self._models_cached_at is not None and now - self._models_cached_at < MODELS_CACHE_TTL:
+            return self._models_cache
+        
         try:
-            return self.ocr_client.get_available_models()
+            models = self.ocr_client.get_available_models()
         except Exception as e:
             logger.error(f"获取可用模型失败: {e}")
             return {}
+        
+        self._models_cache = models
+        self._available_model_names = frozenset(
+            name for name, info in models.items() if info.get("available", False)
+        )
+        self._models_cached_at = now
+        return models
     
     def _validate_model(self, model: str) -> bool:
         """验证模型是否可用"""
-        available_models = self.get_available_models()
-        return model in available_models and available_models[model].get("available", False)
+        self.get_available_models()
+        return model in self._available_model_names
     
     async def create_task(self, 
                          image_data: bytes, 
@@ -112,6 +322,10 @@ class OCRService:
         if not self._validate_model(model):
             raise Exception(f"模型 {model} 不可用")
         
+        # 超大图片先缩小，排队期间图片保存在临时缓冲中
+        image_data = await self._run_cpu_bound(compress_image, image_data, OCR_MAX_IMAGE_AREA)
+        image_file, image_digest = await self._run_blocking(_spool_task_image, image_data)
+        
         # 生成任务ID
         task_id = str(uuid.uuid4())
         
@@ -123,18 +337,40 @@ class OCRService:
             prompt=prompt,
             created_at=datetime.now(),
             updated_at=datetime.now(),
-            image_data=image_data
+            image_file=image_file,
+            image_digest=image_digest
         )
         
-        self.tasks[task_id] = task
+        # 加入处理队列
+        try:
+            self.queue.put_nowait(task_id)
+        except asyncio.QueueFull:
+            self._release_image(task)
+            raise Exception("OCR任务队列已满，请稍后重试")
         
-        # 异步执行任务
-        async_task = asyncio.create_task(self._process_task(task_id))
-        self.running_tasks[task_id] = async_task
+        self.tasks[task_id] = task
+        if len(self.tasks) == 1:
+            self._expiry_changed.set()
         
         logger.info(f"OCR任务已创建: {task_id}, 模型: {model}")
         return task_id
     
+    async def _worker(self):
+        """工作协程：逐个处理队列中的任务，已被清理的任务直接跳过"""
+        while True:
+            task_id = await self.queue.get()
+            try:
+                if task_id not in self.tasks:
+                    continue
+                job = self.loop.create_task(self._process_task(task_id))
+                self.running_tasks[task_id] = job
+                # 使用wait而不是直接await，任务被cleanup_task取消时工作协程不受影响
+                await asyncio.wait([job])
+            except Exception as e:
+                logger.error(f"OCR工作协程处理任务失败: {task_id}, 错误: {e}")
+            finally:
+                self.queue.task_done()
+    
     async def _process_task(self, task_id: str):
         """处理OCR任务"""
         task = self.tasks.get(task_id)
@@ -151,11 +387,7 @@ class OCRService:
             
             # 执行OCR识别
             task.progress = 50
-            result = self.ocr_client.extract_text(
-                image_source=task.image_data,
-                prompt=task.prompt,
-                model=task.model
-            )
+            result = await self._extract_single_flight(task)
             
             # 任务完成
             task.status = OCRTaskStatus.COMPLETED
@@ -178,9 +410,53 @@ class OCRService:
             if task_id in self.running_tasks:
                 del self.running_tasks[task_id]
             
+            # 登记已结束任务的过期时间
+            if task.status in (OCRTaskStatus.COMPLETED, OCRTaskStatus.FAILED):
+                expires_at = task.updated_at + FINISHED_TASK_TTL
+                heapq.heappush(self._finished_heap, (expires_at, task_id))
+                if self._finished_heap[0][1] == task_id:
+                    self._expiry_changed.set()
+            
             # 清理图片数据以节省内存
-            if task.image_data:
-                task.image_data = None
+            self._release_image(task)
+    
+    async def _extract_single_flight(self, task: OCRTask) -> str:
+        """
+        执行任务的OCR识别，图片、模型和提示词都相同的并发任务共享同一次上游调用
+        
+        Args:
+            task: OCR任务
+            
+        Returns:
+            识别结果
+        """
+        key = (task.image_digest, task.model, task.prompt)
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self._release_image(task)
+            return await asyncio.shield(pending)
+        
+        future = self.loop.create_future()
+        self._inflight[key] = future
+        try:
+            async with self._sem:
+                image_file, task.image_file = task.image_file, None
+                image_data = await self._run_blocking(_read_task_image, image_file)
+                result = await self._call_with_limit(
+                    self.ocr_client.extract_text,
+                    image_source=image_data,
+                    prompt=task.prompt,
+                    model=task.model
+                )
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            # 发起方失败或被取消时，等待同一结果的任务一并失败
+            future.set_exception(e if isinstance(e, Exception) else Exception("共享的OCR识别已取消"))
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
     
     async def process_ocr_stream(self, 
                                 image_data: bytes, 
@@ -206,30 +482,61 @@ class OCRService:
         try:
             logger.info(f"开始流式OCR处理，模型: {model}")
             
-            # 使用同步生成器，在异步环境中逐个yield
-            for chunk in self.ocr_client.extract_text_stream(
-                image_source=image_data,
-                prompt=prompt,
-                model=model
-            ):
-                yield chunk
-                # 让出控制权，避免阻塞事件循环
-                await asyncio.sleep(0)
+            # 超大图片先缩小，减少上传和编码开销
+            image_data = await self._run_cpu_bound(compress_image, image_data, OCR_MAX_IMAGE_AREA)
+            
+            # 同步生成器在线程池中运行，片段经事件循环逐个yield
+            async with self._sem:
+                await self.limiter.acquire()
+                async for chunk in self._iterate_in_thread(
+                    functools.partial(
+                        self.ocr_client.extract_text_stream,
+                        image_source=image_data,
+                        prompt=prompt,
+                        model=model
+                    )
+                ):
+                    yield chunk
             
             logger.info("流式OCR处理完成")
             
         except Exception as e:
+            if _is_rate_limited(e):
+                self.limiter.pause(OCR_RATE_LIMIT_BACKOFF)
             logger.error(f"流式OCR处理失败: {e}")
             raise Exception(f"流式OCR处理失败: {str(e)}")
     
+    async def close(self):
+        """停止工作协程和清理协程，关闭模型调用线程池和图片处理进程池"""
+        jobs = self.workers + [self.cleanup_job]
+        for job in jobs:
+            job.cancel()
+        await asyncio.gather(*jobs, return_exceptions=True)
+        
+        self.ai_executor.shutdown(wait=False, cancel_futures=True)
+        if self.cpu_pool is not None:
+            self.cpu_pool.shutdown(cancel_futures=True)
+            self.cpu_pool = None
+        
+        for task in self.tasks.values():
+            self._release_image(task)
+    
     def get_task_status(self, task_id: str) -> Optional[OCRTask]:
         """获取任务状态"""
         return self.tasks.get(task_id)
     
+    @staticmethod
+    def _release_image(task: OCRTask):
+        """关闭任务尚未读取的图片缓冲"""
+        if task.image_file is not None:
+            task.image_file.close()
+            task.image_file = None
+    
     def cleanup_task(self, task_id: str):
         """清理任务"""
-        if task_id in self.tasks:
-            del self.tasks[task_id]
+        task = self.tasks.pop(task_id, None)
+        if task is not None:
+            self._release_image(task)
         
         if task_id in self.running_tasks:
             # 取消正在运行的任务
@@ -238,35 +545,66 @@ class OCRService:
         
         logger.info(f"任务已清理: {task_id}")
     
+    def _evict_expired_tasks(self, current_time: datetime) -> int:
+        """
+        清理过期任务，只访问已过期的条目
+        
+        Args:
+            current_time: 当前时间
+            
+        Returns:
+            清理的任务数量
+        """
+        evicted = 0
+        
+        # 清理24小时前的所有任务：按创建顺序从队首弹出，遇到未过期的即停止
+        max_age_cutoff = current_time - TASK_MAX_AGE
+        while self.tasks:
+            task_id, task = next(iter(self.tasks.items()))
+            if task.created_at >= max_age_cutoff:
+                break
+            self.cleanup_task(task_id)
+            evicted += 1
+        
+        # 清理1小时前的已完成或失败任务：堆中可能残留已被清理的任务，跳过即可
+        while self._finished_heap and self._finished_heap[0][0] < current_time:
+            _, task_id = heapq.heappop(self._finished_heap)
+            if task_id in self.tasks:
+                self.cleanup_task(task_id)
+                evicted += 1
+        
+        return evicted
+    
+    def _next_expiry(self) -> Optional[datetime]:
+        """最早的过期时间，没有任务时返回None"""
+        deadlines = []
+        if self.tasks:
+            deadlines.append(next(iter(self.tasks.values())).created_at + TASK_MAX_AGE)
+        if self._finished_heap:
+            deadlines.append(self._finished_heap[0][0])
+        return min(deadlines) if deadlines else None
+    
     async def _cleanup_expired_tasks(self):
-        """清理过期任务"""
+        """清理过期任务，休眠到下一个任务过期为止"""
         while True:
             try:
-                current_time = datetime.now()
-                expired_tasks = []
-                
-                for task_id, task in self.tasks.items():
-                    # 清理1小时前的已完成或失败任务
-                    if (task.status in [OCRTaskStatus.COMPLETED, OCRTaskStatus.FAILED] and
-                        current_time - task.updated_at > timedelta(hours=1)):
-                        expired_tasks.append(task_id)
-                    
-                    # 清理24小时前的所有任务
-                    elif current_time - task.created_at > timedelta(hours=24):
-                        expired_tasks.append(task_id)
-                
-                # 清理过期任务
-                for task_id in expired_tasks:
-                    self.cleanup_task(task_id)
-                
-                if expired_tasks:
-                    logger.info(f"清理了 {len(expired_tasks)} 个过期任务")
+                evicted = self._evict_expired_tasks(datetime.now())
+                if evicted:
+                    logger.info(f"清理了 {evicted} 个过期任务")
                 
             except Exception as e:
                 logger.error(f"清理过期任务失败: {e}")
             
-            # 每10分钟清理一次
-            await asyncio.sleep(600)
+            next_expiry = self._next_expiry()
+            timeout = None
+            if next_expiry is not None:
+                timeout = max((next_expiry - datetime.now()).total_seconds(), 0.1)
+            
+            self._expiry_changed.clear()
+            try:
+                await asyncio.wait_for(self._expiry_changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
 
 
 # 全局OCR服务实例
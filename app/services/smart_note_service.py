@@ -4,27 +4,126 @@
 """
 
 import asyncio
+import functools
+import hashlib
 import json
 import logging
 import time
 import uuid
 import os
 import re
-from typing import Dict, Any, Optional, List
-from datetime import datetime
+import tempfile
+from collections import OrderedDict
+from typing import Awaitable, BinaryIO, Callable, Dict, Any, Optional, List, Tuple
+from datetime import datetime, timedelta
 
+import openai
+from openai import AsyncOpenAI
 from sqlalchemy.orm import Session
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_exponential
+from app.crud.content import content as content_crud
+from app.db.base import SessionLocal
 from app.models.content import Content
+from app.models.user_content import UserContent
+from app.services.tag_generation_service import tag_generation_service
 from app.utils.multi_model_ocr import MultiModelOCR
 
 from app.core.config import settings
+from app.utils.http_client import get_shared_async_client
 
-# 配置日志
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 提示词模板中待处理文本的占位说明，实际文本放在最后一条用户消息中
+PROMPT_INPUT_PLACEHOLDER = "（见下方用户消息）"
 
+# 笔记总结、关键词提取与知识库记录合并为一次调用时追加的输出格式说明
+SUMMARY_JSON_INSTRUCTION = (
+    "请同时完成以上笔记总结、关键词提取和知识库记录三项任务，只返回一个JSON对象，不要输出其他内容。"
+    "字段为 summary（字符串，按笔记总结要求生成的完整笔记）、"
+    "keywords（字符串数组，按关键词提取要求得到的关键词）和 "
+    "knowledge_record（对象，按知识库记录要求根据 summary 生成，包含 title、date、content_preview）。"
+)
+# 合并调用中知识库记录模板的笔记总结占位说明，总结由同一次调用生成
+KNOWLEDGE_SUMMARY_PLACEHOLDER = "（即本次生成的 summary）"
+# 知识库记录JSON无法解析时逐字段提取的正则
+KNOWLEDGE_TITLE_RE = re.compile(r'"title"\s*:\s*"([^"]*)"')
+KNOWLEDGE_DATE_RE = re.compile(r'"date"\s*:\s*"([^"]*)"')
+KNOWLEDGE_PREVIEW_RE = re.compile(r'"content_preview"\s*:\s*"([^"]*)"')
 
+# OCR和模型调用结果的缓存条数，相同输入重复上传时跳过上游调用
+RESULT_CACHE_SIZE = int(os.getenv("SMART_NOTE_RESULT_CACHE_SIZE", "256"))
+# 缓存结果的有效期（秒），过期后重新调用上游，避免长期返回旧模型版本的输出
+RESULT_CACHE_TTL = int(os.getenv("SMART_NOTE_RESULT_CACHE_TTL", "86400"))
+# 所有任务合计同时进行的对话模型调用上限，大量任务同时到达时在本地排队而不是同时压向上游
+LLM_MAX_CONCURRENCY = int(os.getenv("SMART_NOTE_LLM_CONCURRENCY", "8"))
+# 同时进行的OCR调用上限，OCR客户端在默认线程池中运行，限制其占用以免数据库写入和图片读取排队
+OCR_MAX_CONCURRENCY = int(os.getenv("SMART_NOTE_OCR_CONCURRENCY", "4"))
+# 上游限流、连接失败和5xx错误时的最大尝试次数与指数退避基数（秒），退避上限8秒
+LLM_MAX_ATTEMPTS = int(os.getenv("SMART_NOTE_LLM_MAX_ATTEMPTS", "4"))
+LLM_RETRY_BACKOFF = float(os.getenv("SMART_NOTE_LLM_RETRY_BACKOFF", "0.5"))
+RETRYABLE_LLM_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+# 同时处理的任务数（工作协程数）与等待队列长度，超出队列长度的新任务直接拒绝
+TASK_WORKERS = int(os.getenv("SMART_NOTE_WORKERS", "8"))
+TASK_QUEUE_SIZE = int(os.getenv("SMART_NOTE_QUEUE_SIZE", "256"))
+# 已结束任务的保留时长，以及任何任务的最长保留时长
+FINISHED_TASK_TTL = timedelta(seconds=int(os.getenv("SMART_NOTE_TASK_TTL", "3600")))
+TASK_MAX_AGE = timedelta(hours=24)
+# 过期任务的清理间隔（秒）
+TASK_CLEANUP_INTERVAL = 600
+# 纠错文本超过该字符数时按段落分块并行纠错，0表示不分块
+CORRECTION_CHUNK_CHARS = int(os.getenv("SMART_NOTE_CORRECTION_CHUNK_CHARS", "4000"))
+# 任务图片超过该字节数时转存到临时文件，排队和等待模型期间不常驻内存
+IMAGE_SPOOL_BYTES = int(os.getenv("SMART_NOTE_IMAGE_SPOOL_BYTES", str(512 * 1024)))
+
+
+# 项目根目录下的提示词文件夹，以及各提示词文件缺失时使用的默认内容
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "prompts")
+PROMPT_DEFAULTS = {
+    "ocr_recognition": "请识别图片中的所有文字内容，包括数学公式、表格等。保持原有的格式和结构，对于数学公式请使用LaTeX格式表示。",
+    "error_correction": "请对以下OCR识别的文本进行纠错校正，修正可能的识别错误，但保持原有的格式和结构。",
+    "note_summary": "请对以下文本内容进行笔记总结，生成结构化的学习笔记。",
+    "keyword_extraction": "请从以下内容中提取5-10个关键词，用逗号分隔。",
+    "knowledge_base_record": "请根据笔记总结内容生成结构化的知识库记录。",
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _read_prompt(path: str, default: str) -> str:
+    """读取提示词文件，同一文件在进程内只读取一次"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return default
+    except Exception as e:
+        logger.error("提示词文件加载失败 %s: %s", path, e)
+        return default
+
+
+@functools.lru_cache(maxsize=32)
+def _render_instructions(template: str, keys: Tuple[str, ...], placeholder: str = PROMPT_INPUT_PLACEHOLDER) -> str:
+    """将模板中的占位符替换为固定说明，同一模板只渲染一次"""
+    for key in keys:
+        template = template.replace("{" + key + "}", placeholder)
+    return template
+
+
+def _spool_image(image_data: bytes) -> Tuple[BinaryIO, str]:
+    """
+    将任务图片写入临时缓冲，超过阈值时由 SpooledTemporaryFile 自动转存到磁盘
+    
+    Returns:
+        (图片缓冲, 图片的BLAKE2b摘要)，后续步骤的缓存键都使用该摘要，不再重复扫描图片
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=IMAGE_SPOOL_BYTES)
+    spool.write(image_data)
+    return spool, hashlib.blake2b(image_data, digest_size=16).hexdigest()
+
+
+def _read_image(image_file: BinaryIO) -> bytes:
+    """从临时缓冲读出完整图片，缓冲保持打开供后续步骤再次读取"""
+    image_file.seek(0)
+    return image_file.read()
 
 
 class SmartNoteService:
@@ -33,6 +132,16 @@ class SmartNoteService:
     def __init__(self):
         """初始化服务"""
         self.tasks: Dict[str, Dict[str, Any]] = {}
+        # 按输入摘要缓存的OCR和模型调用结果，最近使用的排在末尾
+        self._result_cache: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        # 进行中的OCR和模型调用，键与结果缓存相同，重复请求共享同一次调用
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._llm_sem = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+        self._ocr_sem = asyncio.Semaphore(OCR_MAX_CONCURRENCY)
+        # 任务队列及消费它的工作协程，首次创建任务时启动
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._cleanup_job: Optional[asyncio.Task] = None
         
         # 初始化客户端
         self._init_clients()
@@ -51,74 +160,16 @@ class SmartNoteService:
         ]
     
     def _load_prompts(self):
-        """加载提示词文件"""
-        try:
-            # 获取项目根目录下的prompts文件夹路径
-            current_dir = os.path.dirname(os.path.abspath(__file__))
-            project_root = os.path.dirname(os.path.dirname(current_dir))
-            prompts_dir = os.path.join(project_root, "prompts")
-            
-            # 读取各个提示词文件
-            self.prompts = {}
-            
-            # OCR识别提示词
-            ocr_prompt_path = os.path.join(prompts_dir, "ocr_recognition.txt")
-            if os.path.exists(ocr_prompt_path):
-                with open(ocr_prompt_path, 'r', encoding='utf-8') as f:
-                    self.prompts['ocr_recognition'] = f.read().strip()
-            else:
-                self.prompts['ocr_recognition'] = "请识别图片中的所有文字内容，包括数学公式、表格等。保持原有的格式和结构，对于数学公式请使用LaTeX格式表示。"
-            
-            # 纠错校正提示词
-            error_correction_path = os.path.join(prompts_dir, "error_correction.txt")
-            if os.path.exists(error_correction_path):
-                with open(error_correction_path, 'r', encoding='utf-8') as f:
-                    self.prompts['error_correction'] = f.read().strip()
-            else:
-                self.prompts['error_correction'] = "请对以下OCR识别的文本进行纠错校正，修正可能的识别错误，但保持原有的格式和结构。"
-            
-            # 笔记总结提示词
-            note_summary_path = os.path.join(prompts_dir, "note_summary.txt")
-            if os.path.exists(note_summary_path):
-                with open(note_summary_path, 'r', encoding='utf-8') as f:
-                    self.prompts['note_summary'] = f.read().strip()
-            else:
-                self.prompts['note_summary'] = "请对以下文本内容进行笔记总结，生成结构化的学习笔记。"
-            
-            # 关键词提取提示词
-            keyword_extraction_path = os.path.join(prompts_dir, "keyword_extraction.txt")
-            if os.path.exists(keyword_extraction_path):
-                with open(keyword_extraction_path, 'r', encoding='utf-8') as f:
-                    self.prompts['keyword_extraction'] = f.read().strip()
-            else:
-                self.prompts['keyword_extraction'] = "请从以下内容中提取5-10个关键词，用逗号分隔。"
-            
-            # 知识库记录生成提示词
-            knowledge_base_record_path = os.path.join(prompts_dir, "knowledge_base_record.txt")
-            if os.path.exists(knowledge_base_record_path):
-                with open(knowledge_base_record_path, 'r', encoding='utf-8') as f:
-                    self.prompts['knowledge_base_record'] = f.read().strip()
-            else:
-                self.prompts['knowledge_base_record'] = "请根据笔记总结内容生成结构化的知识库记录。"
-            
-            logger.info("提示词文件加载成功")
-            
-        except Exception as e:
-            logger.error(f"提示词文件加载失败: {e}")
-            # 使用默认提示词
-            self.prompts = {
-                'ocr_recognition': "请识别图片中的所有文字内容，包括数学公式、表格等。保持原有的格式和结构，对于数学公式请使用LaTeX格式表示。",
-                'error_correction': "请对以下OCR识别的文本进行纠错校正，修正可能的识别错误，但保持原有的格式和结构。",
-                'note_summary': "请对以下文本内容进行笔记总结，生成结构化的学习笔记。",
-                'keyword_extraction': "请从以下内容中提取5-10个关键词，用逗号分隔。",
-                'knowledge_base_record': "请根据笔记总结内容生成结构化的知识库记录。"
-            }
+        """加载提示词文件，文件不存在或读取失败时使用默认提示词"""
+        self.prompts = {
+            name: _read_prompt(os.path.join(PROMPTS_DIR, f"{name}.txt"), default)
+            for name, default in PROMPT_DEFAULTS.items()
+        }
+        logger.info("提示词文件加载成功")
     
     def _init_clients(self):
         """初始化AI客户端"""
         try:
-            import os
-            
             # 初始化OCR客户端
             self.ocr_client = MultiModelOCR(
                 gemini_api_key=os.getenv("GEMINI_API_KEY"),
@@ -129,19 +180,24 @@ class SmartNoteService:
             )
             
             # 初始化PPINFRA客户端（用于DeepSeek和Kimi）
-            from openai import OpenAI
             ppinfra_api_key = os.getenv("PPINFRA_API_KEY")
             ppinfra_base_url = os.getenv("PPINFRA_BASE_URL", "https://api.ppinfra.com/v3/openai")
             
             if ppinfra_api_key:
-                # DeepSeek和Kimi都使用PPINFRA
-                self.deepseek_client = OpenAI(
+                # DeepSeek和Kimi都使用PPINFRA，共享同一个连接池复用TCP/TLS连接；
+                # 重试统一由 _chat_completion 负责，关闭SDK自带重试避免次数叠加
+                http_client = get_shared_async_client()
+                self.deepseek_client = AsyncOpenAI(
                     api_key=ppinfra_api_key,
-                    base_url=ppinfra_base_url
+                    base_url=ppinfra_base_url,
+                    http_client=http_client,
+                    max_retries=0
                 )
-                self.kimi_client = OpenAI(
+                self.kimi_client = AsyncOpenAI(
                     api_key=ppinfra_api_key,
-                    base_url=ppinfra_base_url
+                    base_url=ppinfra_base_url,
+                    http_client=http_client,
+                    max_retries=0
                 )
             else:
                 logger.warning("PPINFRA API密钥未配置，DeepSeek和Kimi功能将不可用")
@@ -151,36 +207,275 @@ class SmartNoteService:
             logger.info("AI客户端初始化成功")
             
         except Exception as e:
-            logger.error(f"AI客户端初始化失败: {e}")
+            logger.error("AI客户端初始化失败: %s", e)
             raise
     
+    @staticmethod
+    def _cache_key(*parts: Any) -> str:
+        """计算缓存键，图片等字节数据直接参与哈希"""
+        digest = hashlib.blake2b(digest_size=16)
+        for part in parts:
+            data = part if isinstance(part, bytes) else str(part).encode("utf-8")
+            digest.update(len(data).to_bytes(8, "little"))
+            digest.update(data)
+        return digest.hexdigest()
+    
+    def _cache_get(self, key: str) -> Optional[str]:
+        """读取缓存结果，已过期的条目视为未命中并移除"""
+        entry = self._result_cache.get(key)
+        if entry is None:
+            return None
+        expires_at, result = entry
+        if time.monotonic() >= expires_at:
+            del self._result_cache[key]
+            return None
+        self._result_cache.move_to_end(key)
+        return result
+    
+    def _cache_put(self, key: str, result: str):
+        """写入缓存结果，超出容量时淘汰最久未使用的条目"""
+        self._result_cache[key] = (time.monotonic() + RESULT_CACHE_TTL, result)
+        self._result_cache.move_to_end(key)
+        while len(self._result_cache) > RESULT_CACHE_SIZE:
+            self._result_cache.popitem(last=False)
+    
+    async def _shared_call(self, key: str, call: Callable[[], Awaitable[str]]) -> str:
+        """
+        按缓存键执行上游调用
+        
+        命中缓存时直接返回；相同键的调用正在进行时等待其结果，不重复调用上游；
+        否则执行 call，非空结果写入缓存
+        """
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+        
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await call()
+            if result:
+                self._cache_put(key, result)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            # 发起方失败或被取消时，等待同一结果的调用一并失败
+            future.set_exception(e if isinstance(e, Exception) else Exception("共享的上游调用已取消"))
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+    
+    async def _chat_completion(self, client: Any, model: str, messages: List[Dict[str, str]],
+                               temperature: float, response_format: Optional[Dict[str, str]] = None,
+                               on_delta: Optional[Callable[[str], Awaitable[None]]] = None) -> str:
+        """
+        调用对话模型并返回去除首尾空白的回复内容
+        
+        相同模型、参数和消息的调用直接返回缓存结果，正在进行的相同调用则等待其结果；
+        提示词文件修改后消息随之变化，缓存自然失效。未命中缓存的调用受 LLM_MAX_CONCURRENCY 限制，
+        遇到限流、连接失败或5xx错误时指数退避重试，等待期间不占用并发名额。
+        传入 on_delta 时以流式方式调用，每收到一段增量内容即回调（命中缓存或共享调用时不回调）；
+        已回调过增量内容后出错不再重试，避免调用方收到重复的片段
+        """
+        key = self._cache_key(model, temperature, response_format, json.dumps(messages, ensure_ascii=False))
+        
+        async def call() -> str:
+            extra_params = {"response_format": response_format} if response_format else {}
+            forwarded = False
+            
+            async def forward(delta: str):
+                nonlocal forwarded
+                forwarded = True
+                await on_delta(delta)
+            
+            def should_retry(error: BaseException) -> bool:
+                return isinstance(error, RETRYABLE_LLM_ERRORS) and not forwarded
+            
+            retrying = AsyncRetrying(
+                wait=wait_exponential(multiplier=LLM_RETRY_BACKOFF, max=8),
+                stop=stop_after_attempt(LLM_MAX_ATTEMPTS),
+                retry=retry_if_exception(should_retry),
+                reraise=True
+            )
+            async for attempt in retrying:
+                with attempt:
+                    async with self._llm_sem:
+                        if on_delta is None:
+                            response = await client.chat.completions.create(
+                                model=model,
+                                messages=messages,
+                                temperature=temperature,
+                                **extra_params
+                            )
+                            content = response.choices[0].message.content
+                        else:
+                            content = await self._stream_completion(
+                                client,
+                                forward,
+                                model=model,
+                                messages=messages,
+                                temperature=temperature,
+                                **extra_params
+                            )
+            return content.strip()
+        
+        return await self._shared_call(key, call)
+    
+    @staticmethod
+    async def _stream_completion(client: Any, on_delta: Callable[[str], Awaitable[None]], **params: Any) -> str:
+        """流式调用对话模型，逐段回调增量内容，返回拼接后的完整回复"""
+        stream = await client.chat.completions.create(stream=True, **params)
+        parts = []
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                await on_delta(delta)
+        return "".join(parts)
+    
+    @staticmethod
+    def _build_messages(system_prompt: str, template: str, **values: str) -> List[Dict[str, str]]:
+        """
+        构建对话消息
+        
+        系统角色与提示词模板作为固定前缀放在前面，待处理文本放在最后的用户消息中，
+        使同一步骤每次调用的前缀逐字节一致，便于命中上游模型的提示词前缀缓存
+        
+        Args:
+            system_prompt: 系统角色提示词
+            template: 提示词模板
+            **values: 模板占位符对应的待处理文本
+            
+        Returns:
+            消息列表
+        """
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "system", "content": _render_instructions(template, tuple(values))},
+            {"role": "user", "content": "\n\n".join(values.values())}
+        ]
+    
     async def create_task(self, image_data: bytes, title: Optional[str] = None, user_id: Optional[str] = None) -> str:
         """创建智能笔记处理任务"""
         task_id = str(uuid.uuid4())
+        image_file, image_hash = await asyncio.to_thread(_spool_image, image_data)
+        now = datetime.now()
         
-        # 创建任务记录
+        # 创建任务记录，只保存图片缓冲，不持有原始字节
         self.tasks[task_id] = {
             "task_id": task_id,
             "status": "pending",
             "current_step": None,
             "progress": 0.0,
-            "image_data": image_data,
+            "image_file": image_file,
+            "image_hash": image_hash,
             "title": title,
             "user_id": user_id,  # 添加用户ID
             "result": None,
             "error_message": None,
-            "created_at": datetime.now(),
-            "updated_at": datetime.now()
+            "created_at": now,
+            "updated_at": now
         }
         
-        # 启动异步处理
-        asyncio.create_task(self._process_task(task_id))
+        # 加入处理队列
+        try:
+            self._enqueue(task_id)
+        except Exception:
+            del self.tasks[task_id]
+            image_file.close()
+            raise
         
         return task_id
     
+    def _ensure_cleanup_job(self):
+        """首次创建任务时启动过期任务清理协程（服务实例在事件循环启动前创建）"""
+        if self._cleanup_job is None or self._cleanup_job.done():
+            self._cleanup_job = asyncio.create_task(self._cleanup_expired_tasks())
+    
+    def _enqueue(self, task_id: str):
+        """将任务加入处理队列，首次调用时启动工作协程（服务实例在事件循环启动前创建）"""
+        if self._queue is None or all(worker.done() for worker in self._workers):
+            self._queue = asyncio.Queue(maxsize=TASK_QUEUE_SIZE)
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(TASK_WORKERS)]
+        self._ensure_cleanup_job()
+        
+        try:
+            self._queue.put_nowait(task_id)
+        except asyncio.QueueFull:
+            raise Exception("智能笔记任务队列已满，请稍后重试")
+    
+    async def _worker(self):
+        """工作协程：逐个处理队列中的任务，已被删除或清理的任务直接跳过"""
+        while True:
+            task_id = await self._queue.get()
+            try:
+                task = self.tasks.get(task_id)
+                if task is None:
+                    continue
+                if task.get("is_text_mode"):
+                    await self._process_text_task(task_id)
+                else:
+                    await self._process_task(task_id)
+            except Exception as e:
+                logger.error("智能笔记工作协程处理任务失败 %s: %s", task_id, e)
+            finally:
+                self._queue.task_done()
+    
+    @staticmethod
+    def _release_image(task: Dict[str, Any]):
+        """关闭任务尚未读取的图片缓冲"""
+        image_file = task.pop("image_file", None)
+        if image_file is not None:
+            image_file.close()
+    
+    def _discard_task(self, task_id: str):
+        """移除任务；处理中的任务可能正在读取图片，由处理协程结束时释放图片缓冲"""
+        task = self.tasks.pop(task_id)
+        if task.get("status") != "processing":
+            self._release_image(task)
+    
+    def _evict_expired_tasks(self, current_time: datetime) -> int:
+        """
+        清理过期任务
+        
+        Args:
+            current_time: 当前时间
+            
+        Returns:
+            清理的任务数量
+        """
+        expired = [
+            task_id for task_id, task in self.tasks.items()
+            if current_time - task["created_at"] > TASK_MAX_AGE
+            or (task["status"] in ("completed", "failed")
+                and current_time - task["updated_at"] > FINISHED_TASK_TTL)
+        ]
+        for task_id in expired:
+            self._discard_task(task_id)
+        return len(expired)
+    
+    async def _cleanup_expired_tasks(self):
+        """定期清理过期任务"""
+        while True:
+            await asyncio.sleep(TASK_CLEANUP_INTERVAL)
+            try:
+                evicted = self._evict_expired_tasks(datetime.now())
+                if evicted:
+                    logger.info("清理了 %s 个过期智能笔记任务", evicted)
+            except Exception as e:
+                logger.error("清理过期智能笔记任务失败: %s", e)
+    
     async def create_text_task(self, text: str, title: Optional[str] = None, user_id: Optional[str] = None) -> str:
         """创建智能笔记文字处理任务（跳过OCR步骤）"""
         task_id = str(uuid.uuid4())
+        now = datetime.now()
         
         # 创建任务记录
         self.tasks[task_id] = {
@@ -193,18 +488,24 @@ class SmartNoteService:
             "user_id": user_id,
             "result": None,
             "error_message": None,
-            "created_at": datetime.now(),
-            "updated_at": datetime.now(),
+            "created_at": now,
+            "updated_at": now,
             "is_text_mode": True  # 标记为文字模式
         }
         
-        # 启动异步处理
-        asyncio.create_task(self._process_text_task(task_id))
+        # 加入处理队列
+        try:
+            self._enqueue(task_id)
+        except Exception:
+            del self.tasks[task_id]
+            raise
         
         return task_id
     
     async def _process_task(self, task_id: str):
         """处理智能笔记任务"""
+        # 任务在处理中被删除时仍由本协程释放图片缓冲
+        task = self.tasks.get(task_id, {})
         try:
             await self._update_task_status(task_id, "processing", "ocr_recognition", 10.0)
             
@@ -258,8 +559,12 @@ class SmartNoteService:
             await self._update_task_status(task_id, "completed", None, 100.0)
             
         except Exception as e:
-            logger.error(f"任务处理失败 {task_id}: {e}")
+            logger.error("任务处理失败 %s: %s", task_id, e)
             await self._update_task_status(task_id, "failed", None, 0.0, str(e))
+        
+        finally:
+            # 图片已保存到数据库或处理已失败，释放任务中的图片缓冲
+            self._release_image(task)
     
     async def _process_text_task(self, task_id: str):
         """处理智能笔记文字任务（跳过OCR步骤）"""
@@ -312,14 +617,17 @@ class SmartNoteService:
             await self._update_task_status(task_id, "completed", None, 100.0)
             
         except Exception as e:
-            logger.error(f"文字任务处理失败 {task_id}: {e}")
+            logger.error("文字任务处理失败 %s: %s", task_id, e)
             await self._update_task_status(task_id, "failed", None, 0.0, str(e))
     
+    def _recognize_image_file(self, image_file: BinaryIO, model: str, prompt: str) -> str:
+        """在工作线程中读出任务图片并调用OCR，图片字节只在本次识别期间存在"""
+        return self.ocr_client.extract_text(image_source=_read_image(image_file), model=model, prompt=prompt)
+    
     async def _perform_ocr(self, task_id: str) -> Optional[str]:
         """执行OCR识别"""
         try:
             task = self.tasks[task_id]
-            image_data = task["image_data"]
             
             # 推送控制台输出
             await self._push_console_output(task_id, "开始OCR识别...")
@@ -329,30 +637,42 @@ class SmartNoteService:
             
             await self._push_console_output(task_id, "正在调用Qwen2.5-VL模型进行OCR识别...")
             
-            # 使用PPInfra的Qwen2.5-VL模型进行OCR
-            result = self.ocr_client.extract_text(
-                image_source=image_data,
-                model="qwen/qwen2.5-vl-72b-instruct",
-                prompt=ocr_prompt
+            # 相同图片和提示词直接使用缓存的识别结果，同时上传的相同图片共享同一次识别；
+            # 图片以创建任务时计算的摘要参与缓存键
+            ocr_model = "qwen/qwen2.5-vl-72b-instruct"
+            # 等待并发名额前取得图片句柄，发起共享识别的任务在等待期间被删除也不影响其他等待方
+            image_file = task["image_file"]
+            
+            async def recognize() -> str:
+                # 使用PPInfra的Qwen2.5-VL模型进行OCR，同步客户端在线程中调用，避免阻塞事件循环；
+                # 取得并发名额后才读出图片，排队中的任务不持有图片字节
+                async with self._ocr_sem:
+                    result = await asyncio.to_thread(
+                        self._recognize_image_file, image_file, ocr_model, ocr_prompt
+                    )
+                return (result or "").strip()
+            
+            result = await self._shared_call(
+                self._cache_key(task["image_hash"], ocr_model, ocr_prompt), recognize
             )
             
-            if result and result.strip():
-                await self._push_console_output(task_id, f"OCR识别完成，识别到 {len(result.strip())} 个字符")
+            if result:
+                await self._push_console_output(task_id, f"OCR识别完成，识别到 {len(result)} 个字符")
                 
                 # 实时推送OCR结果
                 await self._push_intermediate_result(task_id, "ocr_completed", {
-                    "ocr_text": result.strip(),
+                    "ocr_text": result,
                     "step": "OCR识别完成",
                     "progress": 25.0
                 })
-                return result.strip()
+                return result
             else:
                 await self._push_console_output(task_id, "OCR识别失败，未获取到文本内容")
                 raise Exception("OCR识别失败，未获取到文本内容")
                 
         except Exception as e:
             await self._push_console_output(task_id, f"OCR识别失败: {e}")
-            logger.error(f"OCR识别失败 {task_id}: {e}")
+            logger.error("OCR识别失败 %s: %s", task_id, e)
             await self._update_task_status(task_id, "failed", "ocr_recognition", 0.0, f"OCR识别失败: {e}")
             return None
     
@@ -365,21 +685,32 @@ class SmartNoteService:
             error_correction_template = self.prompts.get('error_correction', 
                 "请对以下OCR识别的文本进行纠错校正，修正可能的识别错误，但保持原有的格式和结构：\n\n原始文本：\n{ocr_text}")
             
-            # 格式化提示词，插入OCR文本
-            prompt = error_correction_template.format(ocr_text=ocr_text)
+            chunks = self._split_paragraphs(ocr_text, CORRECTION_CHUNK_CHARS)
             
             await self._push_console_output(task_id, "正在调用DeepSeek-V3模型进行纠错校正...")
-            
-            response = self.deepseek_client.chat.completions.create(
-                model="deepseek/deepseek-v3",
-                messages=[
-                    {"role": "system", "content": "你是一个专业的文本纠错专家，擅长修正OCR识别错误。"},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.1
-            )
-            
-            corrected_text = response.choices[0].message.content.strip()
+            if len(chunks) > 1:
+                await self._push_console_output(task_id, f"文本较长，按段落分为 {len(chunks)} 块并行纠错")
+            
+            async def push_delta(index: int, delta: str):
+                await self._push_live_result(task_id, "correction_delta", {"chunk": index, "delta": delta})
+            
+            # 各块独立纠错后按原顺序拼接，并发数受 LLM_MAX_CONCURRENCY 限制；
+            # 纠错内容边生成边推送，chunk 为分块序号，前端按序号拼接
+            corrected_chunks = await asyncio.gather(*(
+                self._chat_completion(
+                    self.deepseek_client,
+                    "deepseek/deepseek-v3",
+                    self._build_messages(
+                        "你是一个专业的文本纠错专家，擅长修正OCR识别错误。",
+                        error_correction_template,
+                        ocr_text=chunk
+                    ),
+                    temperature=0.1,
+                    on_delta=functools.partial(push_delta, index)
+                )
+                for index, chunk in enumerate(chunks)
+            ))
+            corrected_text = "\n\n".join(corrected_chunks)
             
             await self._push_console_output(task_id, f"纠错校正完成，处理了 {len(corrected_text)} 个字符")
             
@@ -394,10 +725,73 @@ class SmartNoteService:
             
         except Exception as e:
             await self._push_console_output(task_id, f"纠错校正失败: {e}")
-            logger.error(f"纠错校正失败 {task_id}: {e}")
+            logger.error("纠错校正失败 %s: %s", task_id, e)
             await self._update_task_status(task_id, "failed", "error_correction", 0.0, f"纠错校正失败: {e}")
             return None
     
+    @staticmethod
+    def _split_paragraphs(text: str, max_chars: int) -> List[str]:
+        """
+        按空行分隔的段落将文本切分为不超过 max_chars 的块
+        
+        相邻段落尽量合并到同一块中，单个段落超过上限时独立成块，不在段落中间切开
+        
+        Args:
+            text: 待切分文本
+            max_chars: 每块的最大字符数，0或负数表示不切分
+            
+        Returns:
+            文本块列表，文本未超过上限时只有一块
+        """
+        if max_chars <= 0 or len(text) <= max_chars:
+            return [text]
+        
+        chunks = []
+        current = []
+        current_len = 0
+        for paragraph in re.split(r"\n\s*\n", text):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            if current and current_len + len(paragraph) + 2 > max_chars:
+                chunks.append("\n\n".join(current))
+                current = []
+                current_len = 0
+            current.append(paragraph)
+            current_len += len(paragraph) + (2 if current_len else 0)
+        if current:
+            chunks.append("\n\n".join(current))
+        return chunks or [text]
+    
+    @staticmethod
+    def _parse_summary_json(response_content: str) -> Optional[Tuple[str, str, Optional[Dict[str, Any]]]]:
+        """
+        解析合并调用返回的JSON
+        
+        Returns:
+            (笔记总结, 逗号分隔的关键词, 知识库记录)，总结或关键词格式不符时返回None；
+            知识库记录缺失或不是对象时为None，由知识库记录步骤单独生成
+        """
+        try:
+            data = json.loads(response_content)
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(data, dict):
+            return None
+        
+        summary = data.get("summary")
+        keywords = data.get("keywords")
+        if not isinstance(summary, str) or not summary.strip():
+            return None
+        if isinstance(keywords, list):
+            keywords = ", ".join(str(keyword).strip() for keyword in keywords if str(keyword).strip())
+        if not isinstance(keywords, str):
+            return None
+        knowledge_record = data.get("knowledge_record")
+        if not isinstance(knowledge_record, dict):
+            knowledge_record = None
+        return summary.strip(), keywords.strip(), knowledge_record
+    
     async def _perform_note_summary(self, task_id: str, corrected_text: str) -> Optional[Dict[str, Any]]:
         """执行笔记总结"""
         try:
@@ -410,39 +804,55 @@ class SmartNoteService:
             note_summary_template = self.prompts.get('note_summary',
                 "请对以下文本内容进行笔记总结，生成结构化的学习笔记：\n\n原始内容：\n{corrected_text}")
             
-            # 格式化提示词，插入纠错后的文本
-            prompt = note_summary_template.format(corrected_text=corrected_text)
-            
-            await self._push_console_output(task_id, "正在调用Kimi-K2模型生成笔记总结...")
-            
-            response = self.kimi_client.chat.completions.create(
-                model="moonshotai/kimi-k2-instruct",
-                messages=[
-                    {"role": "system", "content": "你是一个专业的学习笔记整理专家，擅长将复杂内容整理成结构化的学习材料。"},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3
+            messages = self._build_messages(
+                "你是一个专业的学习笔记整理专家，擅长将复杂内容整理成结构化的学习材料。",
+                note_summary_template,
+                corrected_text=corrected_text
             )
             
-            summary_content = response.choices[0].message.content.strip()
-            
-            await self._push_console_output(task_id, "正在提取关键词...")
-            
-            # 使用从文件加载的关键词提取提示词
             keyword_template = self.prompts.get('keyword_extraction',
                 "请从以下内容中提取5-10个关键词，用逗号分隔：\n{content}")
             
-            keywords_prompt = keyword_template.format(content=corrected_text)
-            keywords_response = self.kimi_client.chat.completions.create(
-                model="moonshotai/kimi-k2-instruct",
-                messages=[
-                    {"role": "system", "content": "你是一个关键词提取专家。"},
-                    {"role": "user", "content": keywords_prompt}
-                ],
-                temperature=0.1
+            keywords_messages = self._build_messages(
+                "你是一个关键词提取专家。",
+                keyword_template,
+                content=corrected_text
+            )
+            
+            knowledge_instructions = _render_instructions(
+                self.prompts["knowledge_base_record"], ("note_summary",), KNOWLEDGE_SUMMARY_PLACEHOLDER
+            )
+            
+            await self._push_console_output(task_id, "正在调用Kimi-K2模型生成笔记总结、关键词和知识库记录...")
+            
+            # 总结和关键词输入相同，知识库记录只依赖总结，合并为一次调用，纠错后的文本只发送一次
+            fused_messages = messages[:2] + [
+                keywords_messages[1],
+                {"role": "system", "content": knowledge_instructions},
+                {"role": "system", "content": SUMMARY_JSON_INSTRUCTION}
+            ] + messages[2:]
+            fused_content = await self._chat_completion(
+                self.kimi_client, "moonshotai/kimi-k2-instruct", fused_messages,
+                temperature=0.3, response_format={"type": "json_object"}
             )
+            parsed = self._parse_summary_json(fused_content)
             
-            keywords = keywords_response.choices[0].message.content.strip()
+            if parsed:
+                summary_content, keywords, knowledge_record = parsed
+                if knowledge_record is not None:
+                    # 交给知识库记录步骤使用，省去一次调用
+                    task["knowledge_record_draft"] = knowledge_record
+            else:
+                # 模型未按JSON格式返回时，退回分别并发调用
+                logger.warning("笔记总结合并调用返回格式无效，改为分别调用 %s", task_id)
+                summary_content, keywords = await asyncio.gather(
+                    self._chat_completion(
+                        self.kimi_client, "moonshotai/kimi-k2-instruct", messages, temperature=0.3
+                    ),
+                    self._chat_completion(
+                        self.kimi_client, "moonshotai/kimi-k2-instruct", keywords_messages, temperature=0.1
+                    )
+                )
             
             summary_result = {
                 "title": title,
@@ -463,166 +873,178 @@ class SmartNoteService:
             
         except Exception as e:
             await self._push_console_output(task_id, f"笔记总结失败: {e}")
-            logger.error(f"笔记总结失败 {task_id}: {e}")
+            logger.error("笔记总结失败 %s: %s", task_id, e)
             await self._update_task_status(task_id, "failed", "note_summary", 0.0, f"笔记总结失败: {e}")
             return None
     
-    async def _generate_knowledge_base_record(self, task_id: str, summary_result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-        """生成知识库记录"""
+    async def _request_knowledge_record(self, task_id: str, summary_result: Dict[str, Any]) -> Dict[str, Any]:
+        """单独调用模型生成知识库记录，解析失败时使用默认格式"""
+        # 使用从文件加载的知识库记录提示词模板
+        knowledge_record_template = self.prompts.get('knowledge_base_record',
+            "请根据笔记总结内容生成结构化的知识库记录：\n\n笔记总结：\n{note_summary}")
+        
+        messages = self._build_messages(
+            "你是一个专业的知识管理专家，擅长生成结构化的知识库记录。请严格按照JSON格式返回结果，不要添加任何额外的文字说明。",
+            knowledge_record_template,
+            note_summary=summary_result["content"]
+        )
+        
+        await self._push_console_output(task_id, "正在调用Kimi API生成知识库记录...")
+        
+        # 要求模型直接输出JSON对象，正常情况下一次解析即可，下方修复逻辑仅在模型未遵守时使用
+        response_content = await self._chat_completion(
+            self.kimi_client, "moonshotai/kimi-k2-instruct", messages,
+            temperature=0.2, response_format={"type": "json_object"}
+        )
+        
+        await self._push_console_output(task_id, "正在解析知识库记录JSON...")
+        
+        # 改进的JSON解析逻辑
         try:
-            from datetime import datetime
-            
-            await self._push_console_output(task_id, "开始生成知识库记录...")
-            
-            # 使用从文件加载的知识库记录提示词模板
-            knowledge_record_template = self.prompts.get('knowledge_base_record',
-                "请根据笔记总结内容生成结构化的知识库记录：\n\n笔记总结：\n{note_summary}")
-            
-            # 格式化提示词，插入笔记总结内容
-            prompt = knowledge_record_template.format(note_summary=summary_result["content"])
-            
-            await self._push_console_output(task_id, "正在调用Kimi API生成知识库记录...")
+            # 记录原始响应用于调试
+            logger.info("知识库记录原始响应: %s...", response_content[:200])
             
-            response = self.kimi_client.chat.completions.create(
-                model="moonshotai/kimi-k2-instruct",
-                messages=[
-                    {"role": "system", "content": "你是一个专业的知识管理专家，擅长生成结构化的知识库记录。请严格按照JSON格式返回结果，不要添加任何额外的文字说明。"},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.2
-            )
-            
-            response_content = response.choices[0].message.content.strip()
-            
-            await self._push_console_output(task_id, "正在解析知识库记录JSON...")
+            # 第一步：基础清理
+            cleaned_content = response_content.strip()
             
-            # 改进的JSON解析逻辑
-            try:
-                import json
-                import re
-                
-                # 记录原始响应用于调试
-                logger.info(f"知识库记录原始响应: {response_content[:200]}...")
-                
-                # 第一步：基础清理
-                cleaned_content = response_content.strip()
+            # 移除markdown代码块标记
+            if cleaned_content.startswith('```json'):
+                cleaned_content = cleaned_content[7:]
+            elif cleaned_content.startswith('```'):
+                cleaned_content = cleaned_content[3:]
                 
-                # 移除markdown代码块标记
-                if cleaned_content.startswith('```json'):
-                    cleaned_content = cleaned_content[7:]
-                elif cleaned_content.startswith('```'):
-                    cleaned_content = cleaned_content[3:]
-                    
-                if cleaned_content.endswith('```'):
-                    cleaned_content = cleaned_content[:-3]
-                
-                # 移除可能的前后空白和换行
-                cleaned_content = cleaned_content.strip()
+            if cleaned_content.endswith('```'):
+                cleaned_content = cleaned_content[:-3]
+            
+            # 移除可能的前后空白和换行
+            cleaned_content = cleaned_content.strip()
+            
+            # 第二步：查找JSON起止符
+            if not cleaned_content.startswith('{'):
+                # 查找第一个 { 的位置
+                json_start = cleaned_content.find('{')
+                if json_start != -1:
+                    cleaned_content = cleaned_content[json_start:]
+                    await self._push_console_output(task_id, f"找到JSON起始位置: {json_start}")
+            
+            if not cleaned_content.endswith('}'):
+                # 查找最后一个 } 的位置
+                json_end = cleaned_content.rfind('}')
+                if json_end != -1:
+                    cleaned_content = cleaned_content[:json_end + 1]
+                    await self._push_console_output(task_id, f"找到JSON结束位置: {json_end}")
+            
+            await self._push_console_output(task_id, f"清理后的JSON内容长度: {len(cleaned_content)}")
+            
+            # 第三步：尝试解析JSON
+            knowledge_record = None
+            try:
+                knowledge_record = json.loads(cleaned_content)
+                await self._push_console_output(task_id, "JSON解析成功")
+            except json.JSONDecodeError as e:
+                await self._push_console_output(task_id, f"JSON解析失败: {e}，尝试修复...")
                 
-                # 第二步：查找JSON起止符
-                if not cleaned_content.startswith('{'):
-                    # 查找第一个 { 的位置
-                    json_start = cleaned_content.find('{')
-                    if json_start != -1:
-                        cleaned_content = cleaned_content[json_start:]
-                        await self._push_console_output(task_id, f"找到JSON起始位置: {json_start}")
+                # 第四步：尝试修复常见问题
+                # 移除注释和空行
+                lines = cleaned_content.split('\n')
+                json_lines = []
+                for line in lines:
+                    line = line.strip()
+                    if line and not line.startswith('//') and not line.startswith('#'):
+                        # 移除行内注释
+                        if '//' in line:
+                            line = line[:line.find('//')]
+                        json_lines.append(line)
                 
-                if not cleaned_content.endswith('}'):
-                    # 查找最后一个 } 的位置
-                    json_end = cleaned_content.rfind('}')
-                    if json_end != -1:
-                        cleaned_content = cleaned_content[:json_end + 1]
-                        await self._push_console_output(task_id, f"找到JSON结束位置: {json_end}")
+                fixed_content = '\n'.join(json_lines).strip()
                 
-                await self._push_console_output(task_id, f"清理后的JSON内容长度: {len(cleaned_content)}")
+                # 尝试修复不完整的JSON
+                if fixed_content and not fixed_content.endswith('}'):
+                    # 如果JSON不完整，尝试补全
+                    brace_count = fixed_content.count('{') - fixed_content.count('}')
+                    if brace_count > 0:
+                        fixed_content += '}' * brace_count
+                        await self._push_console_output(task_id, f"补全JSON括号: {brace_count}个")
                 
-                # 第三步：尝试解析JSON
-                knowledge_record = None
+                # 第五步：再次尝试解析
                 try:
-                    knowledge_record = json.loads(cleaned_content)
-                    await self._push_console_output(task_id, "JSON解析成功")
-                except json.JSONDecodeError as e:
-                    await self._push_console_output(task_id, f"JSON解析失败: {e}，尝试修复...")
+                    knowledge_record = json.loads(fixed_content)
+                    await self._push_console_output(task_id, "修复后JSON解析成功")
+                except json.JSONDecodeError as e2:
+                    await self._push_console_output(task_id, f"修复后仍然失败: {e2}")
                     
-                    # 第四步：尝试修复常见问题
-                    # 移除注释和空行
-                    lines = cleaned_content.split('\n')
-                    json_lines = []
-                    for line in lines:
-                        line = line.strip()
-                        if line and not line.startswith('//') and not line.startswith('#'):
-                            # 移除行内注释
-                            if '//' in line:
-                                line = line[:line.find('//')]
-                            json_lines.append(line)
+                    # 第六步：最后的尝试 - 使用正则表达式提取字段
+                    await self._push_console_output(task_id, "尝试使用正则表达式提取字段...")
                     
-                    fixed_content = '\n'.join(json_lines).strip()
+                    title_match = KNOWLEDGE_TITLE_RE.search(response_content)
+                    date_match = KNOWLEDGE_DATE_RE.search(response_content)
+                    preview_match = KNOWLEDGE_PREVIEW_RE.search(response_content)
                     
-                    # 尝试修复不完整的JSON
-                    if fixed_content and not fixed_content.endswith('}'):
-                        # 如果JSON不完整，尝试补全
-                        brace_count = fixed_content.count('{') - fixed_content.count('}')
-                        if brace_count > 0:
-                            fixed_content += '}' * brace_count
-                            await self._push_console_output(task_id, f"补全JSON括号: {brace_count}个")
-                    
-                    # 第五步：再次尝试解析
-                    try:
-                        knowledge_record = json.loads(fixed_content)
-                        await self._push_console_output(task_id, "修复后JSON解析成功")
-                    except json.JSONDecodeError as e2:
-                        await self._push_console_output(task_id, f"修复后仍然失败: {e2}")
-                        
-                        # 第六步：最后的尝试 - 使用正则表达式提取字段
-                        await self._push_console_output(task_id, "尝试使用正则表达式提取字段...")
-                        
-                        title_match = re.search(r'"title"\s*:\s*"([^"]*)"', response_content)
-                        date_match = re.search(r'"date"\s*:\s*"([^"]*)"', response_content)
-                        preview_match = re.search(r'"content_preview"\s*:\s*"([^"]*)"', response_content)
-                        
-                        if title_match:
-                            knowledge_record = {
-                                "title": title_match.group(1)[:50],  # 限制长度
-                                "date": date_match.group(1) if date_match else datetime.now().strftime("%Y-%m-%d"),
-                                "content_preview": preview_match.group(1)[:200] if preview_match else summary_result.get("content", "")[:200]
-                            }
-                            await self._push_console_output(task_id, "正则表达式提取成功")
-                        else:
-                            raise ValueError("无法提取任何有效字段")
-                
-                # 验证和补充必要字段
-                if not isinstance(knowledge_record, dict):
-                    raise ValueError("解析结果不是字典格式")
-                    
-                # 确保包含必要字段并限制长度
-                if "title" not in knowledge_record or not knowledge_record["title"]:
-                    knowledge_record["title"] = summary_result.get("title", "智能笔记")
-                
-                # 限制标题长度为50个字符
-                if len(knowledge_record["title"]) > 50:
-                    knowledge_record["title"] = knowledge_record["title"][:50]
-                
-                if "date" not in knowledge_record or not knowledge_record["date"]:
-                    knowledge_record["date"] = datetime.now().strftime("%Y-%m-%d")
-                    
-                if "content_preview" not in knowledge_record or not knowledge_record["content_preview"]:
-                    # 生成内容预览
-                    content = summary_result.get("content", "")
-                    if len(content) > 200:
-                        knowledge_record["content_preview"] = content[:200] + "..."
+                    if title_match:
+                        knowledge_record = {
+                            "title": title_match.group(1)[:50],  # 限制长度
+                            "date": date_match.group(1) if date_match else datetime.now().strftime("%Y-%m-%d"),
+                            "content_preview": preview_match.group(1)[:200] if preview_match else summary_result.get("content", "")[:200]
+                        }
+                        await self._push_console_output(task_id, "正则表达式提取成功")
                     else:
-                        knowledge_record["content_preview"] = content
-                        
-            except (json.JSONDecodeError, ValueError, KeyError) as e:
-                await self._push_console_output(task_id, f"JSON解析完全失败: {e}，使用默认格式")
-                logger.warning(f"知识库记录JSON解析失败，使用默认格式: {e}")
-                
-                # 如果解析失败，使用默认格式
-                knowledge_record = {
-                    "title": summary_result.get("title", "智能笔记")[:50],  # 限制长度
-                    "date": datetime.now().strftime("%Y-%m-%d"),
-                    "content_preview": summary_result.get("content", "智能笔记内容")[:200] + ("..." if len(summary_result.get("content", "")) > 200 else "")
-                }
+                        raise ValueError("无法提取任何有效字段")
+            
+            knowledge_record = self._normalize_knowledge_record(knowledge_record, summary_result)
+                    
+        except (json.JSONDecodeError, ValueError, KeyError) as e:
+            await self._push_console_output(task_id, f"JSON解析完全失败: {e}，使用默认格式")
+            logger.warning("知识库记录JSON解析失败，使用默认格式: %s", e)
+            
+            # 如果解析失败，使用默认格式
+            knowledge_record = {
+                "title": summary_result.get("title", "智能笔记")[:50],  # 限制长度
+                "date": datetime.now().strftime("%Y-%m-%d"),
+                "content_preview": summary_result.get("content", "智能笔记内容")[:200] + ("..." if len(summary_result.get("content", "")) > 200 else "")
+            }
+    
+        return knowledge_record
+    
+    @staticmethod
+    def _normalize_knowledge_record(knowledge_record: Any, summary_result: Dict[str, Any]) -> Dict[str, Any]:
+        """校验知识库记录并补充缺失字段"""
+        # 验证和补充必要字段
+        if not isinstance(knowledge_record, dict):
+            raise ValueError("解析结果不是字典格式")
+            
+        # 确保包含必要字段并限制长度
+        if "title" not in knowledge_record or not knowledge_record["title"]:
+            knowledge_record["title"] = summary_result.get("title", "智能笔记")
+        
+        # 限制标题长度为50个字符
+        if len(knowledge_record["title"]) > 50:
+            knowledge_record["title"] = knowledge_record["title"][:50]
+        
+        if "date" not in knowledge_record or not knowledge_record["date"]:
+            knowledge_record["date"] = datetime.now().strftime("%Y-%m-%d")
+            
+        if "content_preview" not in knowledge_record or not knowledge_record["content_preview"]:
+            # 生成内容预览
+            content = summary_result.get("content", "")
+            if len(content) > 200:
+                knowledge_record["content_preview"] = content[:200] + "..."
+            else:
+                knowledge_record["content_preview"] = content
+        
+        return knowledge_record
+    
+    async def _generate_knowledge_base_record(self, task_id: str, summary_result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """生成知识库记录"""
+        try:
+            await self._push_console_output(task_id, "开始生成知识库记录...")
+            
+            # 笔记总结步骤已在合并调用中生成时直接使用，否则单独调用模型生成
+            draft = self.tasks[task_id].pop("knowledge_record_draft", None)
+            if draft is not None and isinstance(draft.get("title"), str) and draft["title"].strip():
+                knowledge_record = self._normalize_knowledge_record(draft, summary_result)
+                await self._push_console_output(task_id, "使用笔记总结时一并生成的知识库记录")
+            else:
+                knowledge_record = await self._request_knowledge_record(task_id, summary_result)
             
             await self._push_console_output(task_id, f"知识库记录生成完成，标题: {knowledge_record.get('title', '未知')}")
             
@@ -637,31 +1059,61 @@ class SmartNoteService:
             
         except Exception as e:
             await self._push_console_output(task_id, f"知识库记录生成失败: {e}")
-            logger.error(f"知识库记录生成失败 {task_id}: {e}")
+            logger.error("知识库记录生成失败 %s: %s", task_id, e)
             await self._update_task_status(task_id, "failed", "knowledge_base_record", 0.0, f"知识库记录生成失败: {e}")
             return None
     
+    @staticmethod
+    def _insert_owned_content(user_id: str, **content_fields: Any) -> int:
+        """
+        创建Content记录并关联为用户所有（同步数据库操作，在线程中调用）
+        
+        Args:
+            user_id: 所有者用户ID
+            **content_fields: Content字段
+            
+        Returns:
+            新内容ID
+        """
+        with SessionLocal() as db:
+            try:
+                content = Content(**content_fields)
+                db.add(content)
+                # flush即可生成主键，内容和所有权记录在同一事务中提交；
+                # 提交后对象会过期，主键提前取出以免再查询一次
+                db.flush()
+                content_id = content.id
+                
+                # 创建UserContent记录，关联用户和内容
+                user_content = UserContent(
+                    user_id=uuid.UUID(user_id),
+                    content_id=content_id,
+                    permission="owner"  # 创建者拥有所有权限
+                )
+                
+                db.add(user_content)
+                db.commit()
+                return content_id
+            except Exception:
+                db.rollback()
+                raise
+    
     async def _save_to_database(self, task_id: str, ocr_text: str, corrected_text: str, summary_result: Dict[str, Any], knowledge_record: Dict[str, Any]) -> Optional[int]:
         """保存到数据库"""
         try:
-            from app.db.session import get_db
-            from app.models.content import Content
-            from app.models.user_content import UserContent
-            import uuid
-            
-            # 获取数据库会话
-            db = next(get_db())
-            
             task = self.tasks[task_id]
             user_id = task.get("user_id")
             
             if not user_id:
                 raise Exception("缺少用户ID，无法保存到数据库")
             
-            # 创建Content记录
-            content = Content(
+            # 创建Content记录，同步数据库操作在线程中执行，避免阻塞事件循环
+            image_data = await asyncio.to_thread(_read_image, task["image_file"])
+            content_id = await asyncio.to_thread(
+                self._insert_owned_content,
+                user_id,
                 content_type="image",
-                image_data=task["image_data"],
+                image_data=image_data,
                 text_data=corrected_text,  # 存储纠错后的文本
                 summary_title=summary_result["title"],
                 summary_content=summary_result["content"],
@@ -671,57 +1123,34 @@ class SmartNoteService:
                 knowledge_preview=knowledge_record.get("content_preview")
             )
             
-            db.add(content)
-            db.commit()
-            db.refresh(content)
-            
-            # 创建UserContent记录，关联用户和内容
-            user_content = UserContent(
-                user_id=uuid.UUID(user_id),
-                content_id=content.id,
-                permission="owner"  # 创建者拥有所有权限
-            )
-            
-            db.add(user_content)
-            db.commit()
-            
             # 实时推送保存结果
             await self._push_intermediate_result(task_id, "save_completed", {
-                "content_id": content.id,
+                "content_id": content_id,
                 "step": "保存到数据库完成",
                 "progress": 100.0
             })
             
-            logger.info(f"内容已保存到数据库，ID: {content.id}，用户: {user_id}")
-            return content.id
+            logger.info("内容已保存到数据库，ID: %s，用户: %s", content_id, user_id)
+            return content_id
             
         except Exception as e:
-            logger.error(f"保存到数据库失败 {task_id}: {e}")
+            logger.error("保存到数据库失败 %s: %s", task_id, e)
             await self._update_task_status(task_id, "failed", "save_to_database", 0.0, f"保存到数据库失败: {e}")
             return None
-        finally:
-            if 'db' in locals():
-                db.close()
     
     async def _save_to_database_text(self, task_id: str, original_text: str, corrected_text: str, summary_result: Dict[str, Any], knowledge_record: Dict[str, Any]) -> Optional[int]:
         """保存文字任务到数据库"""
         try:
-            from app.db.session import get_db
-            from app.models.content import Content
-            from app.models.user_content import UserContent
-            import uuid
-            
-            # 获取数据库会话
-            db = next(get_db())
-            
             task = self.tasks[task_id]
             user_id = task.get("user_id")
             
             if not user_id:
                 raise Exception("缺少用户ID，无法保存到数据库")
             
-            # 创建Content记录（文字模式）
-            content = Content(
+            # 创建Content记录（文字模式），同步数据库操作在线程中执行
+            content_id = await asyncio.to_thread(
+                self._insert_owned_content,
+                user_id,
                 content_type="text",  # 标记为文字类型
                 image_data=None,  # 文字模式没有图片数据
                 text_data=corrected_text,  # 存储纠错后的文本
@@ -734,37 +1163,20 @@ class SmartNoteService:
                 original_text=original_text  # 存储原始输入文字
             )
             
-            db.add(content)
-            db.commit()
-            db.refresh(content)
-            
-            # 创建UserContent记录，关联用户和内容
-            user_content = UserContent(
-                user_id=uuid.UUID(user_id),
-                content_id=content.id,
-                permission="owner"  # 创建者拥有所有权限
-            )
-            
-            db.add(user_content)
-            db.commit()
-            
             # 实时推送保存结果
             await self._push_intermediate_result(task_id, "save_completed", {
-                "content_id": content.id,
+                "content_id": content_id,
                 "step": "保存到数据库完成",
                 "progress": 100.0
             })
             
-            logger.info(f"文字内容已保存到数据库，ID: {content.id}，用户: {user_id}")
-            return content.id
+            logger.info("文字内容已保存到数据库，ID: %s，用户: %s", content_id, user_id)
+            return content_id
             
         except Exception as e:
-            logger.error(f"保存文字任务到数据库失败 {task_id}: {e}")
+            logger.error("保存文字任务到数据库失败 %s: %s", task_id, e)
             await self._update_task_status(task_id, "failed", "save_to_database", 0.0, f"保存到数据库失败: {e}")
             return None
-        finally:
-            if 'db' in locals():
-                db.close()
     
     async def _push_console_output(self, task_id: str, message: str):
         """推送控制台输出到前端"""
@@ -774,22 +1186,35 @@ class SmartNoteService:
                 if "console_outputs" not in self.tasks[task_id]:
                     self.tasks[task_id]["console_outputs"] = []
                 
+                now = datetime.now()
                 self.tasks[task_id]["console_outputs"].append({
-                    "timestamp": datetime.now(),
+                    "timestamp": now,
                     "message": message
                 })
                 
                 # 推送到前端
                 await self._push_intermediate_result(task_id, "console_output", {
                     "message": message,
-                    "timestamp": datetime.now().isoformat()
+                    "timestamp": now.isoformat()
                 })
                 
                 # 同时输出到日志
-                logger.info(f"任务 {task_id} 控制台输出: {message}")
+                logger.info("任务 %s 控制台输出: %s", task_id, message)
         except Exception as e:
-            logger.error(f"推送控制台输出失败 {task_id}: {e}")
+            logger.error("推送控制台输出失败 %s: %s", task_id, e)
 
+    async def _push_live_result(self, task_id: str, result_type: str, data: Dict[str, Any]):
+        """
+        仅通过WebSocket推送实时结果，不记入任务的中间结果历史
+        
+        用于流式增量等高频碎片，避免轮询接口在每次状态检查时重复发送
+        """
+        try:
+            from app.api.v2.endpoints.smart_note_websocket import websocket_service
+            await websocket_service.push_intermediate_result(task_id, result_type, data)
+        except Exception as e:
+            logger.warning("WebSocket推送实时结果失败 %s: %s", task_id, e)
+    
     async def _push_intermediate_result(self, task_id: str, result_type: str, data: Dict[str, Any]):
         """推送中间结果"""
         if task_id in self.tasks:
@@ -797,16 +1222,17 @@ class SmartNoteService:
             if "intermediate_results" not in self.tasks[task_id]:
                 self.tasks[task_id]["intermediate_results"] = []
             
+            now = datetime.now()
             intermediate_result = {
                 "type": result_type,
                 "data": data,
-                "timestamp": datetime.now()
+                "timestamp": now
             }
             
             self.tasks[task_id]["intermediate_results"].append(intermediate_result)
-            self.tasks[task_id]["updated_at"] = datetime.now()
+            self.tasks[task_id]["updated_at"] = now
             
-            logger.info(f"任务 {task_id} 推送中间结果: {result_type}")
+            logger.info("任务 %s 推送中间结果: %s", task_id, result_type)
             
             # 立即刷新任务状态，确保流式推送能够检测到变化
             await asyncio.sleep(0.01)  # 短暂延迟确保状态更新被检测到
@@ -815,18 +1241,19 @@ class SmartNoteService:
                                 progress: float = 0.0, error_message: Optional[str] = None):
         """更新任务状态"""
         if task_id in self.tasks:
+            now = datetime.now()
             self.tasks[task_id].update({
                 "status": status,
                 "current_step": current_step,
                 "progress": progress,
                 "error_message": error_message,
-                "updated_at": datetime.now()
+                "updated_at": now
             })
             
             if status == "completed":
-                self.tasks[task_id]["completed_at"] = datetime.now()
+                self.tasks[task_id]["completed_at"] = now
             
-            logger.info(f"任务 {task_id} 状态更新: {status} - {current_step} ({progress}%)")
+            logger.info("任务 %s 状态更新: %s - %s (%s%%)", task_id, status, current_step, progress)
             
             # 通过WebSocket推送状态更新
             try:
@@ -842,23 +1269,26 @@ class SmartNoteService:
                     await websocket_service.push_task_failed(task_id, error_message or "处理失败")
                     
             except Exception as e:
-                logger.warning(f"WebSocket推送状态更新失败: {e}")
+                logger.warning("WebSocket推送状态更新失败: %s", e)
     
     def get_task_status(self, task_id: str) -> Optional[Dict[str, Any]]:
-        """获取任务状态"""
-        return self.tasks.get(task_id)
+        """获取任务状态的浅拷贝，不包含图片缓冲和知识库记录草稿，调用方修改不会影响内部状态"""
+        task = self.tasks.get(task_id)
+        if task is None:
+            return None
+        return {k: v for k, v in task.items() if k not in ("image_file", "knowledge_record_draft")}
     
     def get_task_result(self, task_id: str) -> Optional[Dict[str, Any]]:
-        """获取任务结果"""
+        """获取任务结果的浅拷贝"""
         task = self.tasks.get(task_id)
-        if task and task["status"] == "completed":
-            return task["result"]
+        if task and task["status"] == "completed" and task["result"] is not None:
+            return dict(task["result"])
         return None
     
     def delete_task(self, task_id: str) -> bool:
         """删除任务"""
         if task_id in self.tasks:
-            del self.tasks[task_id]
+            self._discard_task(task_id)
             return True
         return False
     
@@ -872,15 +1302,8 @@ class SmartNoteService:
         try:
             await self._push_console_output(task_id, "开始生成内容标签...")
 
-            # 导入标签生成服务
-            from app.services.tag_generation_service import tag_generation_service
-            from app.db.session import get_db
-            from app.crud.content import content as content_crud
-
             # 获取数据库会话
-            db = next(get_db())
-
-            try:
+            with SessionLocal() as db:
                 # 获取内容对象
                 content = content_crud.get(db, content_id)
                 if not content:
@@ -904,11 +1327,8 @@ class SmartNoteService:
                     error_msg = result.get("error", "未知错误")
                     await self._push_console_output(task_id, f"标签生成失败: {error_msg}")
 
-            finally:
-                db.close()
-
         except Exception as e:
-            logger.error(f"标签生成失败 {task_id}: {e}")
+            logger.error("标签生成失败 %s: %s", task_id, e)
             await self._push_console_output(task_id, f"标签生成失败: {str(e)}")
 
 
@@ -2,12 +2,13 @@ import json
 import logging
 from typing import List, Dict, Any, Optional
 from sqlalchemy.orm import Session
-from openai import OpenAI
+from openai import AsyncOpenAI
 import os
 
 from app.crud.tag import tag as tag_crud
 from app.crud.content_tag import content_tag as content_tag_crud
 from app.models.content import Content
+from app.utils.http_client import get_shared_async_client
 
 logger = logging.getLogger(__name__)
 
@@ -28,9 +29,10 @@ class TagGenerationService:
             ppinfra_base_url = os.getenv("PPINFRA_BASE_URL", "https://api.ppinfra.com/v3/openai")
             
             if ppinfra_api_key:
-                self.ai_client = OpenAI(
+                self.ai_client = AsyncOpenAI(
                     api_key=ppinfra_api_key,
-                    base_url=ppinfra_base_url
+                    base_url=ppinfra_base_url,
+                    http_client=get_shared_async_client()
                 )
                 logger.info("AI客户端初始化成功")
             else:
@@ -92,7 +94,7 @@ class TagGenerationService:
             )
             
             # 调用AI生成标签
-            response = self.ai_client.chat.completions.create(
+            response = await self.ai_client.chat.completions.create(
                 model="moonshotai/kimi-k2-instruct",
                 messages=[
                     {"role": "system", "content": "你是一个专业的内容标签生成专家。请严格按照JSON格式返回结果。"},
@@ -147,9 +149,9 @@ class TagGenerationService:
             logger.error(f"标签生成失败: {e}")
             return {"success": False, "error": str(e)}
     
-    def generate_tags_for_text(self, db: Session, text_content: str, 
-                              content_id: Optional[int] = None) -> Dict[str, Any]:
-        """为纯文本生成标签（同步版本）"""
+    async def generate_tags_for_text(self, db: Session, text_content: str, 
+                                    content_id: Optional[int] = None) -> Dict[str, Any]:
+        """为纯文本生成标签"""
         if not self.ai_client:
             logger.warning("AI客户端未初始化，跳过标签生成")
             return {"success": False, "error": "AI客户端未初始化"}
@@ -175,7 +177,7 @@ class TagGenerationService:
 """
             
             # 调用AI生成标签
-            response = self.ai_client.chat.completions.create(
+            response = await self.ai_client.chat.completions.create(
                 model="moonshotai/kimi-k2-instruct",
                 messages=[
                     {"role": "system", "content": "你是一个专业的内容标签生成专家。请严格按照JSON格式返回结果。"},
@@ -0,0 +1,36 @@
+"""
+共享HTTP客户端
+同一上游（PPINFRA）的所有OpenAI兼容客户端共用一个连接池，复用TCP/TLS连接
+"""
+
+from typing import Optional
+
+import httpx
+from openai import DefaultAsyncHttpxClient
+
+try:
+    import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+_shared_async_client: Optional[httpx.AsyncClient] = None
+
+
+def get_shared_async_client() -> httpx.AsyncClient:
+    """获取进程内共享的异步HTTP客户端，可用时启用HTTP/2多路复用"""
+    global _shared_async_client
+    if _shared_async_client is None or _shared_async_client.is_closed:
+        _shared_async_client = DefaultAsyncHttpxClient(
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=50)
+        )
+    return _shared_async_client
+
+
+async def close_shared_async_client():
+    """关闭共享的异步HTTP客户端，应用关闭时调用"""
+    global _shared_async_client
+    if _shared_async_client is not None:
+        await _shared_async_client.aclose()
+        _shared_async_client = None
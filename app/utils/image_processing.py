@@ -4,9 +4,75 @@
 """
 
 import io
-from PIL import Image, ImageFilter, ImageEnhance
-import cv2
-import numpy as np
+import math
+
+from PIL import Image, ImageFilter, ImageEnhance, ImageOps
+try:
+    # 仅下方的预处理函数使用OpenCV；未安装时模块仍可导入，compress_image 只依赖PIL
+    import cv2
+    import numpy as np
+except ImportError:
+    cv2 = None
+    np = None
+
+JPEG_QUALITY = 95
+ORIENTATION_TAG = 0x0112
+
+
+def _open_image(image_data: bytes) -> Image.Image:
+    """解码图片字节"""
+    return Image.open(io.BytesIO(image_data))
+
+
+def _encode_jpeg(image: Image.Image) -> bytes:
+    """将图片编码为JPEG字节"""
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=JPEG_QUALITY)
+    return output.getvalue()
+
+
+def compress_image(image_data: bytes, max_area: int) -> bytes:
+    """
+    将像素面积超过 max_area 的图片等比缩小
+
+    Image.open 只解析文件头即可得到尺寸，未超限的图片直接返回原字节，不做任何解码和重编码；
+    JPEG 缩小时先通过 draft 让 libjpeg 在解码阶段按 1/2、1/4、1/8 做 DCT 域缩放，
+    再用 LANCZOS 缩放到目标尺寸；重编码会丢失EXIF，缩放前先按方向标记转正图片
+
+    Args:
+        image_data: 原始图片数据
+        max_area: 允许的最大像素面积
+
+    Returns:
+        压缩后的JPEG数据，无需压缩或处理失败时返回原图
+    """
+    try:
+        image = _open_image(image_data)
+        width, height = image.size
+        if max_area <= 0 or width * height <= max_area:
+            return image_data
+
+        scale = math.sqrt(max_area / (width * height))
+        new_size = (max(1, int(width * scale)), max(1, int(height * scale)))
+
+        if image.format == 'JPEG':
+            # 保留两倍余量给LANCZOS，避免DCT缩放过度损失细节
+            image.draft('RGB', (new_size[0] * 2, new_size[1] * 2))
+
+        # 方向标记5-8表示需要旋转90度，转正后宽高互换
+        if image.getexif().get(ORIENTATION_TAG) in (5, 6, 7, 8):
+            new_size = (new_size[1], new_size[0])
+        image = ImageOps.exif_transpose(image)
+
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+
+        return _encode_jpeg(image.resize(new_size, Image.LANCZOS))
+
+    except Exception as e:
+        # 如果处理失败，返回原图
+        return image_data
+
 
 def preprocess_image_color(image_data: bytes, mimetype: str) -> bytes:
     """
@@ -185,4 +251,4 @@ def enhance_text_clarity(image_data: bytes) -> bytes:
         
     except Exception as e:
         # 如果处理失败，返回原图
-        return image_data
\ No newline at end of file
+        return image_data
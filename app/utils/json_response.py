@@ -0,0 +1,21 @@
+"""
+JSON序列化工具
+WebSocket文本帧和SSE优先使用orjson序列化，未安装orjson时回退到标准库json；
+HTTP响应直接使用 fastapi.responses.ORJSONResponse
+"""
+
+import json
+from typing import Any
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+def dumps_text(content: Any) -> str:
+    """序列化为不转义非ASCII字符的JSON字符串，用于WebSocket文本帧和SSE"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(content, ensure_ascii=False)
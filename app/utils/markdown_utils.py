@@ -3,6 +3,7 @@ Markdown处理工具
 """
 
 import re
+from functools import lru_cache
 from typing import Optional
 try:
     import markdown
@@ -11,6 +12,31 @@ try:
 except ImportError:
     MARKDOWN_AVAILABLE = False
 
+# 预编译的正则表达式，避免每次调用时重新查找编译缓存
+ANY_CODEBLOCK_RE = re.compile(r"```\w*\s*\n(.*?)\n```", re.DOTALL)
+HEADER_RE = re.compile(r'^(#{1,6}) (.*?)$', re.MULTILINE)
+BOLD_RE = re.compile(r'\*\*(.*?)\*\*')
+ITALIC_RE = re.compile(r'\*(.*?)\*')
+FENCED_CODE_RE = re.compile(r'```(.*?)```', re.DOTALL)
+INLINE_CODE_RE = re.compile(r'`(.*?)`')
+LINK_RE = re.compile(r'\[([^\]]+)\]\(([^)]+)\)')
+LIST_ITEM_RE = re.compile(r'^\s*[-*+]\s+')
+EXTRA_BLANK_LINES_RE = re.compile(r'\n\s*\n\s*\n')
+HAS_CONTENT_RE = re.compile(r'[a-zA-Z0-9\u4e00-\u9fff]')
+WORD_RE = re.compile(r'\b\w+\b')
+HAS_HEADERS_RE = re.compile(r'^#+\s+', re.MULTILINE)
+HAS_LISTS_RE = re.compile(r'^\s*[-*+]\s+', re.MULTILINE)
+HAS_CODE_RE = re.compile(r'`.*?`')
+HAS_LINKS_RE = re.compile(r'\[.*?\]\(.*?\)')
+HAS_IMAGES_RE = re.compile(r'!\[.*?\]\(.*?\)')
+
+
+@lru_cache(maxsize=16)
+def _language_codeblock_re(language: str) -> "re.Pattern[str]":
+    """按语言标识符编译并缓存代码块正则"""
+    return re.compile(rf"```{language}?\s*\n(.*?)\n```", re.DOTALL | re.IGNORECASE)
+
+
 def extract_codeblock(text: str, language: str = "markdown") -> str:
     """
     从文本中提取代码块内容
@@ -22,22 +48,17 @@ def extract_codeblock(text: str, language: str = "markdown") -> str:
     Returns:
         提取的代码块内容，如果没有找到则返回原文本
     """
-    # 匹配代码块的正则表达式
-    pattern = rf"```{language}?\s*\n(.*?)\n```"
-    
-    # 查找代码块
-    matches = re.findall(pattern, text, re.DOTALL | re.IGNORECASE)
+    # 只需要第一个匹配的代码块，使用search避免扫描全文收集所有匹配
+    match = _language_codeblock_re(language).search(text)
     
-    if matches:
-        # 返回第一个匹配的代码块内容
-        return matches[0].strip()
+    if match:
+        return match.group(1).strip()
     
     # 如果没有找到指定语言的代码块，尝试查找任意代码块
-    pattern = r"```\w*\s*\n(.*?)\n```"
-    matches = re.findall(pattern, text, re.DOTALL)
+    match = ANY_CODEBLOCK_RE.search(text)
     
-    if matches:
-        return matches[0].strip()
+    if match:
+        return match.group(1).strip()
     
     # 如果没有找到代码块，返回原文本
     return text.strip()
@@ -76,24 +97,19 @@ def simple_markdown_to_html(markdown_text: str) -> str:
     """
     html = markdown_text
     
-    # 标题转换
-    html = re.sub(r'^# (.*?)$', r'<h1>\1</h1>', html, flags=re.MULTILINE)
-    html = re.sub(r'^## (.*?)$', r'<h2>\1</h2>', html, flags=re.MULTILINE)
-    html = re.sub(r'^### (.*?)$', r'<h3>\1</h3>', html, flags=re.MULTILINE)
-    html = re.sub(r'^#### (.*?)$', r'<h4>\1</h4>', html, flags=re.MULTILINE)
-    html = re.sub(r'^##### (.*?)$', r'<h5>\1</h5>', html, flags=re.MULTILINE)
-    html = re.sub(r'^###### (.*?)$', r'<h6>\1</h6>', html, flags=re.MULTILINE)
+    # 标题转换：一次扫描处理1-6级标题
+    html = HEADER_RE.sub(lambda m: f'<h{len(m.group(1))}>{m.group(2)}</h{len(m.group(1))}>', html)
     
     # 粗体和斜体
-    html = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', html)
-    html = re.sub(r'\*(.*?)\*', r'<em>\1</em>', html)
+    html = BOLD_RE.sub(r'<strong>\1</strong>', html)
+    html = ITALIC_RE.sub(r'<em>\1</em>', html)
     
     # 代码块
-    html = re.sub(r'```(.*?)```', r'<pre><code>\1</code></pre>', html, flags=re.DOTALL)
-    html = re.sub(r'`(.*?)`', r'<code>\1</code>', html)
+    html = FENCED_CODE_RE.sub(r'<pre><code>\1</code></pre>', html)
+    html = INLINE_CODE_RE.sub(r'<code>\1</code>', html)
     
     # 链接
-    html = re.sub(r'\[([^\]]+)\]\(([^)]+)\)', r'<a href="\2">\1</a>', html)
+    html = LINK_RE.sub(r'<a href="\2">\1</a>', html)
     
     # 列表（简单处理）
     lines = html.split('\n')
@@ -101,11 +117,12 @@ def simple_markdown_to_html(markdown_text: str) -> str:
     result_lines = []
     
     for line in lines:
-        if re.match(r'^\s*[-*+]\s+', line):
+        list_match = LIST_ITEM_RE.match(line)
+        if list_match:
             if not in_list:
                 result_lines.append('<ul>')
                 in_list = True
-            item_text = re.sub(r'^\s*[-*+]\s+', '', line)
+            item_text = line[list_match.end():]
             result_lines.append(f'<li>{item_text}</li>')
         else:
             if in_list:
@@ -134,7 +151,7 @@ def clean_markdown_text(text: str) -> str:
     清理Markdown文本，移除多余的空行和格式
     """
     # 移除多余的空行
-    text = re.sub(r'\n\s*\n\s*\n', '\n\n', text)
+    text = EXTRA_BLANK_LINES_RE.sub('\n\n', text)
     
     # 移除行首行尾的空白
     lines = [line.strip() for line in text.split('\n')]
@@ -155,7 +172,7 @@ def validate_markdown(text: str) -> bool:
         return False
     
     # 检查是否包含基本的Markdown元素
-    has_content = bool(re.search(r'[a-zA-Z0-9\u4e00-\u9fff]', text))
+    has_content = bool(HAS_CONTENT_RE.search(text))
     
     return has_content
 
@@ -164,13 +181,13 @@ def extract_markdown_metadata(text: str) -> dict:
     提取Markdown文本的元数据信息
     """
     metadata = {
-        'word_count': len(re.findall(r'\b\w+\b', text)),
-        'line_count': len(text.split('\n')),
-        'has_headers': bool(re.search(r'^#+\s+', text, re.MULTILINE)),
-        'has_lists': bool(re.search(r'^\s*[-*+]\s+', text, re.MULTILINE)),
-        'has_code': bool(re.search(r'`.*?`', text)),
-        'has_links': bool(re.search(r'\[.*?\]\(.*?\)', text)),
-        'has_images': bool(re.search(r'!\[.*?\]\(.*?\)', text))
+        'word_count': sum(1 for _ in WORD_RE.finditer(text)),
+        'line_count': text.count('\n') + 1,
+        'has_headers': bool(HAS_HEADERS_RE.search(text)),
+        'has_lists': bool(HAS_LISTS_RE.search(text)),
+        'has_code': bool(HAS_CODE_RE.search(text)),
+        'has_links': bool(HAS_LINKS_RE.search(text)),
+        'has_images': bool(HAS_IMAGES_RE.search(text))
     }
     
     return metadata
\ No newline at end of file
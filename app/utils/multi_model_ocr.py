@@ -208,6 +208,11 @@ class MultiModelOCR:
         mime_type = self._get_mime_type(image_data)
         return image_data, mime_type
     
+    @staticmethod
+    def _build_data_uri(image_data: bytes, mime_type: str) -> str:
+        """将图片数据编码为 data URI，base64 结果为纯 ASCII，直接按 ASCII 解码"""
+        return f"data:{mime_type};base64,{base64.b64encode(memoryview(image_data)).decode('ascii')}"
+    
     def _extract_text_gemini(self, 
                            image_data: bytes, 
                            mime_type: str,
@@ -267,13 +272,11 @@ class MultiModelOCR:
             else:
                 # 本地图片转换为 base64
                 image_data, mime_type = self._prepare_image_data(image_source)
-                image_base64 = base64.b64encode(image_data).decode('utf-8')
-                image_url = f"data:{mime_type};base64,{image_base64}"
+                image_url = self._build_data_uri(image_data, mime_type)
         else:
             # 字节数据转换为 base64
             image_data, mime_type = self._prepare_image_data(image_source)
-            image_base64 = base64.b64encode(image_data).decode('utf-8')
-            image_url = f"data:{mime_type};base64,{image_base64}"
+            image_url = self._build_data_uri(image_data, mime_type)
         
         # 构建消息
         messages = [
@@ -351,8 +354,7 @@ class MultiModelOCR:
             
             # 获取 MIME 类型
             mime_type = self._get_mime_type(image_data)
-            image_base64 = base64.b64encode(image_data).decode('utf-8')
-            image_url = f"data:{mime_type};base64,{image_base64}"
+            image_url = self._build_data_uri(image_data, mime_type)
         
         # 构建消息
         messages = [
@@ -8,7 +8,7 @@ import asyncio
 import uuid
 import hashlib
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 from enum import Enum
 import logging
 from dataclasses import dataclass, field
@@ -70,6 +70,10 @@ class TaskManager:
         self.max_concurrent_tasks = settings.NOTE_MAX_CONCURRENT_TASKS
         self.task_timeout = settings.NOTE_TASK_TIMEOUT
         self._cleanup_task = None
+        # 待推送的最新进度消息 (websocket管理器, 消息)，以及对应的防抖计时器和后台推送
+        self._pending_progress: Dict[str, Tuple[Any, Dict[str, Any]]] = {}
+        self._progress_timers: Dict[str, asyncio.TimerHandle] = {}
+        self._progress_flushes: Dict[str, asyncio.Task] = {}
         self.text_processor = TextProcessor()
         self.confidence_calculator = ConfidenceCalculator()
         
@@ -151,6 +155,60 @@ class TaskManager:
         logger.info(f"任务已取消: {task_id}")
         return True
     
+    async def _notify(self, task: SummaryTask, websocket_manager, message: Dict[str, Any]):
+        """
+        向任务所属用户推送消息
+        
+        进度更新在 NOTE_PROGRESS_DEBOUNCE 秒内合并，只推送最后一条；
+        其他消息发送前先推送积压的进度，保证客户端收到的顺序不变
+        """
+        if not websocket_manager:
+            return
+        
+        task_id = task.task_id
+        if message.get("type") == "progress_update":
+            self._pending_progress[task_id] = (websocket_manager, message)
+            if task_id not in self._progress_timers:
+                self._progress_timers[task_id] = asyncio.get_running_loop().call_later(
+                    settings.NOTE_PROGRESS_DEBOUNCE, self._flush_progress_later, task
+                )
+            return
+        
+        await self._flush_progress(task)
+        await websocket_manager.send_message(task.user_id, message)
+    
+    def _flush_progress_later(self, task: SummaryTask):
+        """防抖计时到期，在后台推送积压的进度"""
+        self._progress_timers.pop(task.task_id, None)
+        flush = asyncio.ensure_future(self._flush_progress(task))
+        self._progress_flushes[task.task_id] = flush
+        flush.add_done_callback(
+            lambda _: self._progress_flushes.pop(task.task_id, None)
+            if self._progress_flushes.get(task.task_id) is flush else None
+        )
+    
+    async def _flush_progress(self, task: SummaryTask):
+        """立即推送积压的进度，并等待进行中的后台推送完成"""
+        timer = self._progress_timers.pop(task.task_id, None)
+        if timer:
+            timer.cancel()
+        
+        pending = self._pending_progress.pop(task.task_id, None)
+        flush = self._progress_flushes.get(task.task_id)
+        if flush and flush is not asyncio.current_task():
+            await asyncio.shield(flush)
+        
+        if pending:
+            websocket_manager, message = pending
+            await websocket_manager.send_message(task.user_id, message)
+    
+    def _discard_progress(self, task_id: str):
+        """丢弃任务积压的进度推送"""
+        timer = self._progress_timers.pop(task_id, None)
+        if timer:
+            timer.cancel()
+        self._pending_progress.pop(task_id, None)
+    
     async def _execute_task(self, task_id: str, websocket_manager=None):
         """执行总结任务"""
         task = self.tasks[task_id]
@@ -163,13 +221,12 @@ class TaskManager:
             
             logger.info(f"开始执行任务: {task_id}")
             
-            if websocket_manager:
-                await websocket_manager.send_message(task.user_id, {
-                    "type": "task_started",
-                    "message": "总结任务已开始",
-                    "task_id": task_id,
-                    "timestamp": datetime.now().isoformat()
-                })
+            await self._notify(task, websocket_manager, {
+                "type": "task_started",
+                "message": "总结任务已开始",
+                "task_id": task_id,
+                "timestamp": datetime.now().isoformat()
+            })
             
             # 设置超时
             result = await asyncio.wait_for(
@@ -183,14 +240,13 @@ class TaskManager:
             task.result = result
             task.progress = 100
             
-            if websocket_manager:
-                await websocket_manager.send_message(task.user_id, {
-                    "type": "task_completed",
-                    "message": "总结任务已完成",
-                    "task_id": task_id,
-                    "result": result,
-                    "timestamp": datetime.now().isoformat()
-                })
+            await self._notify(task, websocket_manager, {
+                "type": "task_completed",
+                "message": "总结任务已完成",
+                "task_id": task_id,
+                "result": result,
+                "timestamp": datetime.now().isoformat()
+            })
             
             logger.info(f"任务完成: {task_id}")
             
@@ -199,13 +255,12 @@ class TaskManager:
             task.error_message = "任务执行超时"
             task.completed_at = datetime.now()
             
-            if websocket_manager:
-                await websocket_manager.send_message(task.user_id, {
-                    "type": "task_timeout",
-                    "message": "任务执行超时",
-                    "task_id": task_id,
-                    "timestamp": datetime.now().isoformat()
-                })
+            await self._notify(task, websocket_manager, {
+                "type": "task_timeout",
+                "message": "任务执行超时",
+                "task_id": task_id,
+                "timestamp": datetime.now().isoformat()
+            })
             
             logger.error(f"任务超时: {task_id}")
             
@@ -214,13 +269,12 @@ class TaskManager:
             task.error_message = str(e)
             task.completed_at = datetime.now()
             
-            if websocket_manager:
-                await websocket_manager.send_message(task.user_id, {
-                    "type": "task_failed",
-                    "message": f"任务执行失败: {str(e)}",
-                    "task_id": task_id,
-                    "timestamp": datetime.now().isoformat()
-                })
+            await self._notify(task, websocket_manager, {
+                "type": "task_failed",
+                "message": f"任务执行失败: {str(e)}",
+                "task_id": task_id,
+                "timestamp": datetime.now().isoformat()
+            })
             
             logger.error(f"任务执行失败: {task_id}, 错误: {e}")
             
@@ -228,6 +282,7 @@ class TaskManager:
             # 清理运行中的任务
             if task_id in self.running_tasks:
                 del self.running_tasks[task_id]
+            self._discard_progress(task_id)
     
     async def _process_summary(self, task: SummaryTask, websocket_manager=None) -> Dict[str, Any]:
         """处理总结逻辑"""
@@ -236,13 +291,12 @@ class TaskManager:
         try:
             # 1. 获取用户内容
             task.progress = 20
-            if websocket_manager:
-                await websocket_manager.send_message(task.user_id, {
-                    "type": "progress_update",
-                    "message": "正在获取笔记内容...",
-                    "progress": task.progress,
-                    "timestamp": datetime.now().isoformat()
-                })
+            await self._notify(task, websocket_manager, {
+                "type": "progress_update",
+                "message": "正在获取笔记内容...",
+                "progress": task.progress,
+                "timestamp": datetime.now().isoformat()
+            })
             
             contents = []
             for content_id in task.content_ids:
@@ -255,13 +309,12 @@ class TaskManager:
             
             # 2. 检查缓存
             task.progress = 30
-            if websocket_manager:
-                await websocket_manager.send_message(task.user_id, {
-                    "type": "progress_update",
-                    "message": "检查缓存的总结...",
-                    "progress": task.progress,
-                    "timestamp": datetime.now().isoformat()
-                })
+            await self._notify(task, websocket_manager, {
+                "type": "progress_update",
+                "message": "检查缓存的总结...",
+                "progress": task.progress,
+                "timestamp": datetime.now().isoformat()
+            })
             
             cached_summaries = await self._check_cache(contents)
             
@@ -288,13 +341,12 @@ class TaskManager:
         # 检查是否有缓存
         if cached_summaries.get(content_id):
             task.progress = 90
-            if websocket_manager:
-                await websocket_manager.send_message(task.user_id, {
-                    "type": "progress_update",
-                    "message": "使用缓存的总结",
-                    "progress": task.progress,
-                    "timestamp": datetime.now().isoformat()
-                })
+            await self._notify(task, websocket_manager, {
+                "type": "progress_update",
+                "message": "使用缓存的总结",
+                "progress": task.progress,
+                "timestamp": datetime.now().isoformat()
+            })
             
             return {
                 "summary_title": content_obj.summary_title or "笔记总结",
@@ -307,13 +359,12 @@ class TaskManager:
         
         # 生成新的总结
         task.progress = 50
-        if websocket_manager:
-            await websocket_manager.send_message(task.user_id, {
-                "type": "progress_update",
-                "message": "正在生成笔记总结...",
-                "progress": task.progress,
-                "timestamp": datetime.now().isoformat()
-            })
+        await self._notify(task, websocket_manager, {
+            "type": "progress_update",
+            "message": "正在生成笔记总结...",
+            "progress": task.progress,
+            "timestamp": datetime.now().isoformat()
+        })
         
         # 获取内容文本
         content_text = content_obj.text_data or ""
@@ -346,13 +397,12 @@ class TaskManager:
         )
         
         task.progress = 100
-        if websocket_manager:
-            await websocket_manager.send_message(task.user_id, {
-                "type": "progress_update",
-                "message": "单个笔记总结完成",
-                "progress": task.progress,
-                "timestamp": datetime.now().isoformat()
-            })
+        await self._notify(task, websocket_manager, {
+            "type": "progress_update",
+            "message": "单个笔记总结完成",
+            "progress": task.progress,
+            "timestamp": datetime.now().isoformat()
+        })
         
         logger.info(f"单个内容总结完成，内容ID: {content_obj.id}")
         return {
@@ -369,30 +419,28 @@ class TaskManager:
         # 3. 生成单笔记总结
         task.progress = 40
         individual_summaries = await self._generate_individual_summaries(
-            contents, cached_summaries, task.user_id, websocket_manager, db
+            contents, cached_summaries, task, websocket_manager, db
         )
         
         # 4. 生成综合总结
         task.progress = 70
-        if websocket_manager:
-            await websocket_manager.send_message(task.user_id, {
-                "type": "progress_update",
-                "message": "正在生成综合总结...",
-                "progress": task.progress,
-                "timestamp": datetime.now().isoformat()
-            })
+        await self._notify(task, websocket_manager, {
+            "type": "progress_update",
+            "message": "正在生成综合总结...",
+            "progress": task.progress,
+            "timestamp": datetime.now().isoformat()
+        })
         
         comprehensive_summary = await self._generate_comprehensive_summary(individual_summaries)
         
         # 5. 计算置信度
         task.progress = 85
-        if websocket_manager:
-            await websocket_manager.send_message(task.user_id, {
-                "type": "progress_update",
-                "message": "计算置信度分数...",
-                "progress": task.progress,
-                "timestamp": datetime.now().isoformat()
-            })
+        await self._notify(task, websocket_manager, {
+            "type": "progress_update",
+            "message": "计算置信度分数...",
+            "progress": task.progress,
+            "timestamp": datetime.now().isoformat()
+        })
         
         confidence_scores = await self._calculate_confidence_scores(
             comprehensive_summary, individual_summaries
@@ -403,13 +451,12 @@ class TaskManager:
         avg_confidence = sum(confidence_scores) / len(confidence_scores)
         
         if avg_confidence < settings.NOTE_CONFIDENCE_THRESHOLD:
-            if websocket_manager:
-                await websocket_manager.send_message(task.user_id, {
-                    "type": "progress_update",
-                    "message": "修正低置信度的总结...",
-                    "progress": task.progress,
-                    "timestamp": datetime.now().isoformat()
-                })
+            await self._notify(task, websocket_manager, {
+                "type": "progress_update",
+                "message": "修正低置信度的总结...",
+                "progress": task.progress,
+                "timestamp": datetime.now().isoformat()
+            })
             
             # 选择置信度最低的总结进行修正
             min_idx = confidence_scores.index(min(confidence_scores))
@@ -459,7 +506,7 @@ class TaskManager:
         self, 
         contents: List[Any], 
         cached_summaries: Dict[str, Optional[str]],
-        user_id: str,
+        task: SummaryTask,
         websocket_manager=None,
         db=None
     ) -> List[str]:
@@ -472,23 +519,21 @@ class TaskManager:
             # 使用缓存或生成新总结
             if cached_summaries.get(content_id):
                 summary = cached_summaries[content_id]
-                if websocket_manager:
-                    await websocket_manager.send_message(user_id, {
-                        "type": "using_cached_summary",
-                        "message": f"使用第 {i+1} 份笔记的缓存总结",
-                        "timestamp": datetime.now().isoformat(),
-                        "progress": f"{i+1}/{len(contents)}"
-                    })
+                await self._notify(task, websocket_manager, {
+                    "type": "using_cached_summary",
+                    "message": f"使用第 {i+1} 份笔记的缓存总结",
+                    "timestamp": datetime.now().isoformat(),
+                    "progress": f"{i+1}/{len(contents)}"
+                })
                 # 对于缓存的内容，直接使用（假设已经是正确格式）
                 final_summary = summary
             else:
-                if websocket_manager:
-                    await websocket_manager.send_message(user_id, {
-                        "type": "generating_summary",
-                        "message": f"正在生成第 {i+1} 份笔记的总结...",
-                        "timestamp": datetime.now().isoformat(),
-                        "progress": f"{i+1}/{len(contents)}"
-                    })
+                await self._notify(task, websocket_manager, {
+                    "type": "generating_summary",
+                    "message": f"正在生成第 {i+1} 份笔记的总结...",
+                    "timestamp": datetime.now().isoformat(),
+                    "progress": f"{i+1}/{len(contents)}"
+                })
                 
                 # 生成新总结
                 content_text = content_obj.text_data or ""
@@ -520,13 +565,12 @@ class TaskManager:
                     # 使用完整的总结响应作为最终总结
                     final_summary = summary
                 
-                if websocket_manager:
-                    await websocket_manager.send_message(user_id, {
-                        "type": "summary_generated",
-                        "message": f"第 {i+1} 份笔记总结已生成",
-                        "timestamp": datetime.now().isoformat(),
-                        "progress": f"{i+1}/{len(contents)}"
-                    })
+                await self._notify(task, websocket_manager, {
+                    "type": "summary_generated",
+                    "message": f"第 {i+1} 份笔记总结已生成",
+                    "timestamp": datetime.now().isoformat(),
+                    "progress": f"{i+1}/{len(contents)}"
+                })
             
             summaries.append(final_summary)
         
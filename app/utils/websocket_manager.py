@@ -1,9 +1,10 @@
 import asyncio
-import json
 import logging
 from typing import Dict, Set, Any
 from fastapi import WebSocket, WebSocketDisconnect
 
+from app.utils.json_response import dumps_text
+
 logger = logging.getLogger(__name__)
 
 class WebSocketManager:
@@ -48,7 +49,7 @@ class WebSocketManager:
             return
         
         # 准备消息
-        message_text = json.dumps(message, ensure_ascii=False)
+        message_text = dumps_text(message)
         
         # 向用户的所有连接发送消息
         disconnected_connections = set()
@@ -70,7 +71,7 @@ class WebSocketManager:
     
     async def broadcast_message(self, message: Dict[str, Any]):
         """向所有用户广播消息"""
-        message_text = json.dumps(message, ensure_ascii=False)
+        message_text = dumps_text(message)
         
         for user_id in list(self.active_connections.keys()):
             await self.send_message_to_user_connections(user_id, message_text)
@@ -152,7 +152,7 @@ async def test_tag_generation():
         向量空间是现代数学的中心主题；因此，线性代数被广泛地应用于抽象代数和泛函分析中。
         """
         
-        result = tag_generation_service.generate_tags_for_text(db, test_text)
+        result = await tag_generation_service.generate_tags_for_text(db, test_text)
         
         if result.get("success"):
             print("✅ AI标签生成成功")
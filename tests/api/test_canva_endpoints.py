@@ -103,8 +103,8 @@ class TestCanvaAPIEndpoints(unittest.TestCase):
     
     @patch('app.api.v2.endpoints.canva.canvas_crud')
     @patch('app.api.v2.endpoints.canva.card_crud')
-    @patch('app.api.v2.endpoints.canva.CanvaService')
-    def test_pull_endpoint_logic(self, mock_service_class, mock_card_crud, mock_canvas_crud):
+    @patch('app.api.v2.endpoints.canva.canva_service')
+    def test_pull_endpoint_logic(self, mock_service, mock_card_crud, mock_canvas_crud):
         """测试Pull端点的业务逻辑"""
         # 模拟数据库返回
         mock_canvas = Mock()
@@ -118,18 +118,14 @@ class TestCanvaAPIEndpoints(unittest.TestCase):
         mock_card.content_id = self.test_content_id
         mock_card_crud.get_by_canvas.return_value = [mock_card]
         
-        # 模拟服务
-        mock_service = Mock()
-        mock_service_class.return_value = mock_service
-        
         # 验证逻辑结构
         self.assertTrue(hasattr(mock_service, 'verify_user_permission'))
         self.assertTrue(callable(getattr(mock_service, 'verify_user_permission', None)))
     
     @patch('app.api.v2.endpoints.canva.canvas_crud')
     @patch('app.api.v2.endpoints.canva.card_crud')
-    @patch('app.api.v2.endpoints.canva.CanvaService')
-    def test_push_endpoint_logic(self, mock_service_class, mock_card_crud, mock_canvas_crud):
+    @patch('app.api.v2.endpoints.canva.canva_service')
+    def test_push_endpoint_logic(self, mock_service, mock_card_crud, mock_canvas_crud):
         """测试Push端点的业务逻辑"""
         # 模拟数据库返回
         mock_canvas = Mock()
@@ -141,10 +137,6 @@ class TestCanvaAPIEndpoints(unittest.TestCase):
         mock_card.canvas_id = self.test_canvas_id
         mock_card_crud.get.return_value = mock_card
         
-        # 模拟服务
-        mock_service = Mock()
-        mock_service_class.return_value = mock_service
-        
         # 验证逻辑结构
         self.assertTrue(hasattr(mock_service, 'verify_user_permission'))
         self.assertTrue(hasattr(mock_service, 'verify_content_access'))
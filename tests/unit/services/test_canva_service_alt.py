@@ -5,13 +5,15 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from types import SimpleNamespace
+from unittest.mock import MagicMock, Mock, patch
 from uuid import uuid4
 from app.services.canva_service import (
     CanvaService, CanvaServiceError, PermissionDeniedError, 
-    CanvaNotFoundError, DataConsistencyError
+    CanvaNotFoundError, CardNotFoundError, DataConsistencyError, CARD_LIST_ADAPTER
 )
 from app.schemas.canva import (
-    CanvaPullRequest, CanvaPushRequest, CardUpdateRequest, PositionModel
+    CanvaPullRequest, CanvaPushRequest, CardUpdateRequest, CardResponse, PositionModel
 )
 
 
@@ -186,6 +188,136 @@ def test_service_integration():
         print("✗ 服务实例类型错误")
 
 
+def test_pull_canva_batches_content_queries():
+    """测试拉取画布时批量查询内容和权限"""
+    service = CanvaService()
+    user_id = uuid4()
+    cards_list = [
+        SimpleNamespace(id=1, content_id=101, position_x=1.0, position_y=2.0),
+        SimpleNamespace(id=2, content_id=102, position_x=3.0, position_y=4.0),
+        SimpleNamespace(id=3, content_id=101, position_x=5.0, position_y=6.0),
+    ]
+    
+    with patch("app.services.canva_service.canvas") as mock_canvas, \
+            patch("app.services.canva_service.card") as mock_card, \
+            patch("app.services.canva_service.content") as mock_content:
+        mock_canvas.get.return_value = SimpleNamespace(id=12, owner_id=user_id)
+        mock_card.get_by_canvas.return_value = cards_list
+        mock_content.get_many.return_value = [SimpleNamespace(id=101), SimpleNamespace(id=102)]
+        mock_content.check_user_access_bulk.return_value = {101}
+        
+        response = service.pull_canva(Mock(), CanvaPullRequest(canva_id=12), user_id)
+    
+    assert [c.card_id for c in response.cards] == [1, 3]
+    mock_content.get_many.assert_called_once()
+    mock_content.check_user_access_bulk.assert_called_once()
+    mock_content.get.assert_not_called()
+    mock_content.check_user_access.assert_not_called()
+
+
+def test_push_canva_uses_bulk_upsert():
+    """测试推送画布时批量写入卡片"""
+    service = CanvaService()
+    user_id = uuid4()
+    request = CanvaPushRequest(
+        canva_id=12,
+        cards=[
+            CardUpdateRequest(card_id=1, position=PositionModel(x=10, y=20), content_id=101),
+            CardUpdateRequest(card_id=None, position=PositionModel(x=30, y=40), content_id=102)
+        ]
+    )
+    
+    with patch("app.services.canva_service.canvas") as mock_canvas, \
+            patch("app.services.canva_service.card") as mock_card, \
+            patch("app.services.canva_service.content") as mock_content:
+        mock_canvas.get.return_value = SimpleNamespace(id=12, owner_id=user_id)
+        mock_content.get_many.return_value = [SimpleNamespace(id=101), SimpleNamespace(id=102)]
+        mock_content.check_user_access_bulk.return_value = {101, 102}
+        mock_card.get_canvas_ids.return_value = {1: 12}
+        mock_card.bulk_upsert.return_value = [1, 7]
+        
+        db = MagicMock()
+        result = service.push_canva(db, request, user_id)
+    
+    assert result["updated_card_ids"] == [1, 7]
+    assert result["created_card_ids"] == [7]
+    mock_card.get_canvas_ids.assert_called_once_with(db, [1])
+    mock_card.bulk_upsert.assert_called_once()
+    db.commit.assert_called_once()
+    db.rollback.assert_not_called()
+    mock_card.get_by_canvas_and_id.assert_not_called()
+
+
+def test_push_canva_integrity_error_rolls_back_without_retry():
+    """测试约束冲突时回滚会话并直接返回错误，不重复写入"""
+    from sqlalchemy.exc import IntegrityError
+    
+    service = CanvaService()
+    user_id = uuid4()
+    request = CanvaPushRequest(
+        canva_id=12,
+        cards=[CardUpdateRequest(card_id=None, position=PositionModel(x=30, y=40), content_id=102)]
+    )
+    
+    with patch("app.services.canva_service.canvas") as mock_canvas, \
+            patch("app.services.canva_service.card") as mock_card, \
+            patch("app.services.canva_service.content") as mock_content:
+        mock_canvas.get.return_value = SimpleNamespace(id=12, owner_id=user_id)
+        mock_content.get_many.return_value = [SimpleNamespace(id=102)]
+        mock_content.check_user_access_bulk.return_value = {102}
+        mock_card.get_canvas_ids.return_value = {}
+        mock_card.bulk_upsert.side_effect = IntegrityError("INSERT", {}, Exception("conflict"))
+        
+        db = MagicMock()
+        try:
+            service.push_canva(db, request, user_id)
+            assert False, "应抛出异常"
+        except DataConsistencyError:
+            pass
+    
+    mock_card.bulk_upsert.assert_called_once()
+    db.rollback.assert_called_once()
+    db.commit.assert_not_called()
+
+
+def test_push_canva_checks_card_ownership():
+    """测试推送画布时拒绝不存在或属于其他画布的卡片，且不写入任何卡片"""
+    service = CanvaService()
+    user_id = uuid4()
+    
+    for canvas_ids, expected_error in (({}, CardNotFoundError), ({1: 99}, DataConsistencyError)):
+        request = CanvaPushRequest(
+            canva_id=12,
+            cards=[CardUpdateRequest(card_id=1, position=PositionModel(x=10, y=20), content_id=101)]
+        )
+        with patch("app.services.canva_service.canvas") as mock_canvas, \
+                patch("app.services.canva_service.card") as mock_card, \
+                patch("app.services.canva_service.content") as mock_content:
+            mock_canvas.get.return_value = SimpleNamespace(id=12, owner_id=user_id)
+            mock_content.get_many.return_value = [SimpleNamespace(id=101)]
+            mock_content.check_user_access_bulk.return_value = {101}
+            mock_card.get_canvas_ids.return_value = canvas_ids
+            
+            db = MagicMock()
+            try:
+                service.push_canva(db, request, user_id)
+                assert False, "应抛出异常"
+            except expected_error:
+                pass
+        
+        mock_card.bulk_upsert.assert_not_called()
+        db.commit.assert_not_called()
+
+
+def test_card_list_adapter_dump_json():
+    """测试卡片列表预构建序列化器输出"""
+    cards = [CardResponse(card_id=1, position=PositionModel(x=1.5, y=2.0), content_id=101)]
+    
+    assert CARD_LIST_ADAPTER.dump_json(cards) == (
+        b'[{"card_id":1,"position":{"x":1.5,"y":2.0},"content_id":101}]'
+    )
+
+
 def main():
     """运行所有测试"""
     print("开始测试画布业务服务层...")
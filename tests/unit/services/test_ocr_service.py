@@ -0,0 +1,394 @@
+"""
+OCR服务单元测试
+"""
+import asyncio
+import threading
+import unittest
+
+
+# 当前场景中创建的服务，场景结束时在同一事件循环中关闭
+_services = []
+
+
+def _run(coro):
+    async def scenario():
+        try:
+            return await coro
+        finally:
+            while _services:
+                await _services.pop().close()
+
+    return asyncio.run(scenario())
+
+
+async def _make_service(ocr_client):
+    """在事件循环中构建服务，并替换为测试用客户端"""
+    from app.services.ocr_service import OCRService
+
+    service = OCRService()
+    service.ocr_client = ocr_client
+    _services.append(service)
+    return service
+
+
+class _FakeOCRClient:
+    """记录调用线程的假OCR客户端"""
+
+    def __init__(self):
+        self.calling_threads = []
+
+    def extract_text(self, image_source, prompt, model):
+        self.calling_threads.append(threading.current_thread().name)
+        return "识别结果"
+
+    def extract_text_stream(self, image_source, prompt, model):
+        self.calling_threads.append(threading.current_thread().name)
+        yield "第一段"
+        yield "第二段"
+
+    def get_available_models(self):
+        return {"qwen-vl-plus": {"available": True}}
+
+
+class TestOCRServiceThreading(unittest.TestCase):
+    """测试同步模型调用在专用线程池中执行，不占用事件循环线程"""
+
+    def test_process_task_runs_client_off_loop(self):
+        """测试任务处理在模型调用专用线程池中调用模型"""
+        async def scenario():
+            client = _FakeOCRClient()
+            service = await _make_service(client)
+            task_id = await service.create_task(b"image", "qwen-vl-plus", "prompt")
+            await service.queue.join()
+            return client, service.get_task_status(task_id)
+
+        client, task = _run(scenario())
+        self.assertEqual(task.result, "识别结果")
+        self.assertEqual(task.status.value, "completed")
+        self.assertTrue(all(name.startswith("ocr-ai") for name in client.calling_threads))
+
+    def test_stream_chunks_delivered_in_order(self):
+        """测试流式片段经事件循环按顺序返回"""
+        async def scenario():
+            client = _FakeOCRClient()
+            service = await _make_service(client)
+            chunks = [chunk async for chunk in service.process_ocr_stream(b"image", "qwen-vl-plus", "prompt")]
+            return client, chunks
+
+        client, chunks = _run(scenario())
+        self.assertEqual(chunks, ["第一段", "第二段"])
+        self.assertTrue(all(name.startswith("ocr-ai") for name in client.calling_threads))
+
+
+class TestOCRServiceConcurrency(unittest.TestCase):
+    """测试上游调用并发上限"""
+
+    def test_in_flight_calls_capped(self):
+        """测试同时进行的模型调用不超过信号量上限"""
+        lock = threading.Lock()
+        state = {"current": 0, "peak": 0}
+
+        class SlowClient(_FakeOCRClient):
+            def extract_text(self, image_source, prompt, model):
+                with lock:
+                    state["current"] += 1
+                    state["peak"] = max(state["peak"], state["current"])
+                threading.Event().wait(0.05)
+                with lock:
+                    state["current"] -= 1
+                return "识别结果"
+
+        async def scenario():
+            service = await _make_service(SlowClient())
+            service._sem = asyncio.Semaphore(2)
+            service.limiter.interval = 0.0
+            for i in range(6):
+                await service.create_task(b"image-%d" % i, "qwen-vl-plus", "prompt")
+            await service.queue.join()
+
+        _run(scenario())
+        self.assertLessEqual(state["peak"], 2)
+
+
+class TestOCRServiceQueue(unittest.TestCase):
+    """测试任务队列与工作协程"""
+
+    def test_queue_full_rejects_task(self):
+        """测试队列已满时拒绝新任务且不登记任务"""
+        async def scenario():
+            service = await _make_service(_FakeOCRClient())
+            for worker in service.workers:
+                worker.cancel()
+            service.queue = asyncio.Queue(maxsize=1)
+            service.queue.put_nowait("占位任务")
+            with self.assertRaises(Exception):
+                await service.create_task(b"image", "qwen-vl-plus", "prompt")
+            return service
+
+        service = _run(scenario())
+        self.assertEqual(len(service.tasks), 0)
+
+    def test_cleaned_task_skipped_by_worker(self):
+        """测试排队期间被清理的任务不会调用模型"""
+        async def scenario():
+            client = _FakeOCRClient()
+            service = await _make_service(client)
+            task_id = await service.create_task(b"image", "qwen-vl-plus", "prompt")
+            service.cleanup_task(task_id)
+            await service.queue.join()
+            return client
+
+        client = _run(scenario())
+        self.assertEqual(client.calling_threads, [])
+
+
+class TestOCRServiceRateLimit(unittest.TestCase):
+    """测试全局限速与限流暂停"""
+
+    def test_rate_limited_call_pauses_and_retries(self):
+        """测试上游返回429后全局暂停并重试成功"""
+        from unittest.mock import patch
+
+        class ThrottledClient(_FakeOCRClient):
+            def __init__(self):
+                super().__init__()
+                self.attempts = 0
+
+            def extract_text(self, image_source, prompt, model):
+                self.attempts += 1
+                if self.attempts == 1:
+                    raise Exception("Qwen OCR 识别失败: Error code: 429 - rate limit exceeded")
+                return "识别结果"
+
+        async def scenario():
+            client = ThrottledClient()
+            service = await _make_service(client)
+            with patch("app.services.ocr_service.OCR_RATE_LIMIT_BACKOFF", 0.01):
+                task_id = await service.create_task(b"image", "qwen-vl-plus", "prompt")
+                await service.queue.join()
+            return client, service.get_task_status(task_id)
+
+        client, task = _run(scenario())
+        self.assertEqual(client.attempts, 2)
+        self.assertEqual(task.result, "识别结果")
+
+    def test_limiter_spaces_calls(self):
+        """测试限速器按时隙间隔放行调用"""
+        async def scenario():
+            from app.services.ocr_service import RateLimiter
+
+            loop = asyncio.get_running_loop()
+            limiter = RateLimiter(20, loop)
+            start = loop.time()
+            for _ in range(3):
+                await limiter.acquire()
+            return loop.time() - start
+
+        self.assertGreaterEqual(_run(scenario()), 0.09)
+
+
+class TestOCRServiceImageBuffer(unittest.TestCase):
+    """测试排队任务的图片缓冲"""
+
+    def test_large_image_spooled_and_released(self):
+        """测试大图片转存到临时文件，任务处理时原样读回并释放"""
+        from unittest.mock import patch
+
+        payload = b"x" * 4096
+
+        class RecordingClient(_FakeOCRClient):
+            def extract_text(self, image_source, prompt, model):
+                self.received = image_source
+                return "识别结果"
+
+        async def scenario():
+            client = RecordingClient()
+            service = await _make_service(client)
+            with patch("app.services.ocr_service.OCR_IMAGE_SPOOL_BYTES", 1024):
+                task_id = await service.create_task(payload, "qwen-vl-plus", "prompt")
+            task = service.get_task_status(task_id)
+            image_file = task.image_file
+            rolled = image_file._rolled
+            await service.queue.join()
+            return client, task, image_file, rolled
+
+        client, task, image_file, rolled = _run(scenario())
+        self.assertTrue(rolled)
+        self.assertEqual(client.received, payload)
+        self.assertIsNone(task.image_file)
+        self.assertTrue(image_file.closed)
+
+
+class TestOCRServiceCPUPool(unittest.TestCase):
+    """测试图片压缩在进程池中执行"""
+
+    def test_large_image_compressed_in_process_pool(self):
+        """测试超限图片经进程池缩小后再交给模型"""
+        import io
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        from unittest.mock import patch
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new("RGB", (400, 300), "white").save(buffer, format="PNG")
+
+        class RecordingClient(_FakeOCRClient):
+            def extract_text(self, image_source, prompt, model):
+                self.received = image_source
+                return "识别结果"
+
+        async def scenario():
+            client = RecordingClient()
+            service = await _make_service(client)
+            service.cpu_pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+            try:
+                with patch("app.services.ocr_service.OCR_MAX_IMAGE_AREA", 100 * 75):
+                    await service.create_task(buffer.getvalue(), "qwen-vl-plus", "prompt")
+                await service.queue.join()
+            finally:
+                service.cpu_pool.shutdown()
+            return client
+
+        client = _run(scenario())
+        self.assertEqual(Image.open(io.BytesIO(client.received)).size, (100, 75))
+
+    def test_close_shuts_down_lazily_created_pool(self):
+        """测试进程池在首次使用时创建，关闭服务时随工作协程一并释放"""
+        from unittest.mock import patch
+
+        async def scenario():
+            service = await _make_service(_FakeOCRClient())
+            self.assertIsNone(service.cpu_pool)
+            with patch("app.services.ocr_service.OCR_CPU_WORKERS", 1):
+                await service.create_task(b"image", "qwen-vl-plus", "prompt")
+                await service.queue.join()
+            pool = service.cpu_pool
+            self.assertIsNotNone(pool)
+            await service.close()
+            return service, pool
+
+        service, pool = _run(scenario())
+        self.assertIsNone(service.cpu_pool)
+        self.assertTrue(all(worker.done() for worker in service.workers))
+        with self.assertRaises(RuntimeError):
+            pool.submit(int)
+
+
+class TestOCRServiceSingleFlight(unittest.TestCase):
+    """测试相同请求共享上游调用"""
+
+    def test_identical_tasks_share_one_call(self):
+        """测试相同图片、模型和提示词的并发任务只调用一次模型"""
+        class CountingClient(_FakeOCRClient):
+            def __init__(self):
+                super().__init__()
+                self.calls = 0
+
+            def extract_text(self, image_source, prompt, model):
+                self.calls += 1
+                threading.Event().wait(0.05)
+                return "识别结果"
+
+        async def scenario():
+            client = CountingClient()
+            service = await _make_service(client)
+            same = [await service.create_task(b"image", "qwen-vl-plus", "prompt") for _ in range(3)]
+            other = await service.create_task(b"image", "qwen-vl-plus", "另一个提示词")
+            task_ids = same + [other]
+            await service.queue.join()
+            return client, [service.get_task_status(task_id) for task_id in task_ids]
+
+        client, tasks = _run(scenario())
+        self.assertEqual(client.calls, 2)
+        self.assertTrue(all(task.result == "识别结果" for task in tasks))
+        self.assertTrue(all(task.image_file is None for task in tasks))
+
+
+class TestOCRServiceModelsCache(unittest.TestCase):
+    """测试可用模型缓存"""
+
+    def test_models_queried_once_within_ttl(self):
+        """测试缓存有效期内只查询一次客户端"""
+        class CountingClient(_FakeOCRClient):
+            def __init__(self):
+                super().__init__()
+                self.model_queries = 0
+
+            def get_available_models(self):
+                self.model_queries += 1
+                return {"qwen-vl-plus": {"available": True}, "gemini-2.5-pro": {"available": False}}
+
+        async def scenario():
+            client = CountingClient()
+            service = await _make_service(client)
+            checks = [service._validate_model(model) for model in ("qwen-vl-plus", "gemini-2.5-pro", "unknown")]
+            return client, checks
+
+        client, checks = _run(scenario())
+        self.assertEqual(checks, [True, False, False])
+        self.assertEqual(client.model_queries, 1)
+
+
+class TestOCRServiceEviction(unittest.TestCase):
+    """测试过期任务清理"""
+
+    def test_evicts_only_expired_tasks(self):
+        """测试按创建时间和结束时间清理过期任务"""
+        from datetime import datetime, timedelta
+
+        async def scenario():
+            from app.services.ocr_service import OCRTask, OCRTaskStatus
+
+            service = await _make_service(_FakeOCRClient())
+            now = datetime.now()
+
+            def add(task_id, status, created_ago, updated_ago):
+                service.tasks[task_id] = OCRTask(
+                    task_id=task_id,
+                    status=status,
+                    model="qwen-vl-plus",
+                    prompt="prompt",
+                    created_at=now - created_ago,
+                    updated_at=now - updated_ago
+                )
+
+            add("stale", OCRTaskStatus.PENDING, timedelta(hours=25), timedelta(hours=25))
+            add("done-old", OCRTaskStatus.COMPLETED, timedelta(hours=3), timedelta(hours=2))
+            add("done-new", OCRTaskStatus.COMPLETED, timedelta(minutes=30), timedelta(minutes=10))
+            add("pending", OCRTaskStatus.PENDING, timedelta(minutes=5), timedelta(minutes=5))
+            service._finished_heap = [
+                (now - timedelta(hours=1), "done-old"),
+                (now + timedelta(minutes=50), "done-new"),
+            ]
+
+            evicted = service._evict_expired_tasks(now)
+            return evicted, list(service.tasks)
+
+        evicted, remaining = _run(scenario())
+        self.assertEqual(evicted, 2)
+        self.assertEqual(remaining, ["done-new", "pending"])
+
+    def test_finished_task_evicted_at_expiry(self):
+        """测试清理协程在已结束任务到期时被唤醒，无需等待固定轮询周期"""
+        from datetime import timedelta
+        from unittest.mock import patch
+
+        async def scenario():
+            service = await _make_service(_FakeOCRClient())
+            with patch("app.services.ocr_service.FINISHED_TASK_TTL", timedelta(seconds=0.2)):
+                task_id = await service.create_task(b"image", "qwen-vl-plus", "prompt")
+                await service.queue.join()
+            self.assertIn(task_id, service.tasks)
+            # 轮询直到任务被清理，截止时间远大于TTL，避免负载较高时误判
+            deadline = asyncio.get_running_loop().time() + 5
+            while task_id in service.tasks and asyncio.get_running_loop().time() < deadline:
+                await asyncio.sleep(0.02)
+            return service
+
+        service = _run(scenario())
+        self.assertEqual(len(service.tasks), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,748 @@
+"""
+智能笔记服务单元测试
+"""
+import asyncio
+import io
+import json
+import unittest
+from types import SimpleNamespace
+
+
+class _FakeCompletions:
+    """记录并发调用数的假Chat Completions接口，要求JSON输出时返回总结和关键词"""
+
+    def __init__(self, json_supported=True, knowledge_record=None):
+        self.json_supported = json_supported
+        self.knowledge_record = knowledge_record
+        self.current = 0
+        self.peak = 0
+        self.calls = 0
+
+    async def create(self, model, messages, temperature, response_format=None):
+        self.calls += 1
+        self.current += 1
+        self.peak = max(self.peak, self.current)
+        await asyncio.sleep(0.05)
+        self.current -= 1
+        content = f"结果{temperature}"
+        if response_format and self.json_supported:
+            data = {"summary": "总结", "keywords": ["概念", "定理"]}
+            if self.knowledge_record is not None:
+                data["knowledge_record"] = self.knowledge_record
+            content = json.dumps(data, ensure_ascii=False)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class _EchoStreamCompletions(_FakeCompletions):
+    """以流式增量返回“纠正:”前缀和最后一条用户消息的假接口"""
+
+    async def create(self, model, messages, temperature, response_format=None, stream=False):
+        await super().create(model, messages, temperature, response_format)
+        deltas = ["纠正:", messages[-1]["content"]]
+
+        async def chunks():
+            for delta in deltas:
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))])
+
+        return chunks()
+
+
+class TestSmartNoteSummary(unittest.TestCase):
+    """测试笔记总结步骤"""
+
+    def test_summary_and_keywords_fused_into_one_call(self):
+        """测试笔记总结与关键词提取合并为一次调用"""
+        from app.services.smart_note_service import SmartNoteService
+
+        service = SmartNoteService()
+        completions = _FakeCompletions()
+        service.kimi_client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        service.tasks["task"] = {"title": "测试笔记"}
+
+        result = asyncio.run(service._perform_note_summary("task", "纠错后的文本"))
+
+        self.assertEqual(completions.calls, 1)
+        self.assertEqual(result, {"title": "测试笔记", "content": "总结", "keywords": "概念, 定理"})
+
+    def test_invalid_json_falls_back_to_concurrent_calls(self):
+        """测试合并调用返回格式无效时退回并发的两次调用"""
+        from app.services.smart_note_service import SmartNoteService
+
+        service = SmartNoteService()
+        completions = _FakeCompletions(json_supported=False)
+        service.kimi_client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        service.tasks["task"] = {"title": "测试笔记"}
+
+        result = asyncio.run(service._perform_note_summary("task", "纠错后的文本"))
+
+        self.assertEqual(completions.calls, 3)
+        self.assertEqual(completions.peak, 2)
+        self.assertEqual(result, {"title": "测试笔记", "content": "结果0.3", "keywords": "结果0.1"})
+
+    def test_knowledge_record_reused_from_fused_call(self):
+        """测试合并调用一并返回知识库记录时不再单独调用模型"""
+        from app.services.smart_note_service import SmartNoteService
+
+        service = SmartNoteService()
+        completions = _FakeCompletions(knowledge_record={"title": "勾股定理", "date": "2025-01-01"})
+        service.kimi_client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        service.tasks["task"] = {"title": "测试笔记"}
+
+        async def scenario():
+            summary = await service._perform_note_summary("task", "纠错后的文本")
+            return await service._generate_knowledge_base_record("task", summary)
+
+        record = asyncio.run(scenario())
+
+        self.assertEqual(completions.calls, 1)
+        self.assertEqual(record, {"title": "勾股定理", "date": "2025-01-01", "content_preview": "总结"})
+        self.assertNotIn("knowledge_record_draft", service.tasks["task"])
+
+    def test_repeated_text_served_from_cache(self):
+        """测试相同文本再次总结时直接使用缓存结果"""
+        from app.services.smart_note_service import SmartNoteService
+
+        service = SmartNoteService()
+        completions = _FakeCompletions()
+        service.kimi_client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        service.tasks["first"] = {"title": "测试笔记"}
+        service.tasks["second"] = {"title": "测试笔记"}
+
+        async def scenario():
+            first = await service._perform_note_summary("first", "纠错后的文本")
+            second = await service._perform_note_summary("second", "纠错后的文本")
+            await service._perform_note_summary("first", "另一段文本")
+            return first, second
+
+        first, second = asyncio.run(scenario())
+
+        self.assertEqual(first, second)
+        self.assertEqual(completions.calls, 2)
+
+    def test_expired_cache_entry_refetched(self):
+        """测试缓存条目过期后重新调用上游"""
+        from app.services.smart_note_service import SmartNoteService
+
+        service = SmartNoteService()
+        completions = _FakeCompletions()
+        client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+        async def scenario():
+            await service._chat_completion(client, "model", [], temperature=0.1)
+            await service._chat_completion(client, "model", [], temperature=0.1)
+            for key, (_, result) in list(service._result_cache.items()):
+                service._result_cache[key] = (0.0, result)
+            await service._chat_completion(client, "model", [], temperature=0.1)
+
+        asyncio.run(scenario())
+        self.assertEqual(completions.calls, 2)
+
+    def test_concurrent_duplicates_share_one_call(self):
+        """测试同时进行的相同总结请求共享一次上游调用"""
+        from app.services.smart_note_service import SmartNoteService
+
+        service = SmartNoteService()
+        completions = _FakeCompletions()
+        service.kimi_client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        for task_id in ("first", "second"):
+            service.tasks[task_id] = {"title": "测试笔记"}
+
+        async def scenario():
+            return await asyncio.gather(
+                service._perform_note_summary("first", "纠错后的文本"),
+                service._perform_note_summary("second", "纠错后的文本")
+            )
+
+        first, second = asyncio.run(scenario())
+
+        self.assertEqual(first, second)
+        self.assertEqual(completions.calls, 1)
+        self.assertEqual(service._inflight, {})
+
+
+class TestSmartNoteOCR(unittest.TestCase):
+    """测试OCR识别步骤"""
+
+    def test_same_image_hashed_once_and_served_from_cache(self):
+        """测试图片摘要在创建任务时计算一次，相同图片再次识别时使用缓存结果"""
+        from app.services.smart_note_service import SmartNoteService
+
+        class CountingOCRClient:
+            def __init__(self):
+                self.calls = 0
+
+            def extract_text(self, image_source, model, prompt):
+                self.calls += 1
+                return " 识别结果 "
+
+        async def no_process(task_id):
+            return None
+
+        service = SmartNoteService()
+        service.ocr_client = CountingOCRClient()
+        service._process_task = no_process
+
+        async def scenario():
+            first = await service.create_task(b"image", user_id="user")
+            second = await service.create_task(b"image", user_id="user")
+            results = [await service._perform_ocr(task_id) for task_id in (first, second)]
+            return service.tasks[first]["image_hash"], service.tasks[second]["image_hash"], results
+
+        first_hash, second_hash, results = asyncio.run(scenario())
+        self.assertEqual(first_hash, second_hash)
+        self.assertEqual(results, ["识别结果", "识别结果"])
+        self.assertEqual(service.ocr_client.calls, 1)
+
+    def test_concurrent_identical_images_share_one_ocr_call(self):
+        """测试同时处理的相同图片共享同一次OCR识别"""
+        import threading
+        from app.services.smart_note_service import SmartNoteService
+
+        class SlowCountingOCRClient:
+            def __init__(self):
+                self.calls = 0
+
+            def extract_text(self, image_source, model, prompt):
+                self.calls += 1
+                threading.Event().wait(0.05)
+                return "识别结果"
+
+        async def no_process(task_id):
+            return None
+
+        service = SmartNoteService()
+        service.ocr_client = SlowCountingOCRClient()
+        service._process_task = no_process
+
+        async def scenario():
+            task_ids = [await service.create_task(b"image", user_id=f"user-{i}") for i in range(3)]
+            return await asyncio.gather(*(service._perform_ocr(task_id) for task_id in task_ids))
+
+        results = asyncio.run(scenario())
+        self.assertEqual(results, ["识别结果"] * 3)
+        self.assertEqual(service.ocr_client.calls, 1)
+        self.assertEqual(service._inflight, {})
+
+    def test_shared_ocr_survives_originating_task_deleted(self):
+        """测试发起共享识别的任务在等待名额时被删除，相同图片的其他任务仍得到识别结果"""
+        from app.services.smart_note_service import SmartNoteService
+
+        class CountingOCRClient:
+            def __init__(self):
+                self.calls = 0
+
+            def extract_text(self, image_source, model, prompt):
+                self.calls += 1
+                return "识别结果"
+
+        async def stop_after_ocr(task_id, ocr_text):
+            return None
+
+        service = SmartNoteService()
+        service.ocr_client = CountingOCRClient()
+        service._perform_error_correction = stop_after_ocr
+
+        async def wait_until(condition):
+            deadline = asyncio.get_running_loop().time() + 5
+            while not condition():
+                self.assertLess(asyncio.get_running_loop().time(), deadline)
+                await asyncio.sleep(0.01)
+
+        async def scenario():
+            service._ocr_sem = asyncio.Semaphore(1)
+            await service._ocr_sem.acquire()
+            first = await service.create_task(b"image", user_id="user-a")
+            second = await service.create_task(b"image", user_id="user-b")
+            images = [service.tasks[task_id]["image_file"] for task_id in (first, second)]
+            await wait_until(lambda: all(
+                len(service.tasks[task_id].get("console_outputs", [])) >= 2 for task_id in (first, second)
+            ))
+            await asyncio.sleep(0.01)
+
+            service.delete_task(first)
+            self.assertFalse(images[0].closed)
+            service._ocr_sem.release()
+            await service._queue.join()
+            return second, images
+
+        second, images = asyncio.run(scenario())
+        task = service.tasks[second]
+        self.assertIsNone(task["error_message"])
+        self.assertEqual(task["current_step"], "error_correction")
+        self.assertEqual(service.ocr_client.calls, 1)
+        self.assertTrue(all(image.closed for image in images))
+
+    def test_ocr_calls_capped(self):
+        """测试同时进行的OCR调用不超过OCR信号量上限"""
+        import threading
+        from app.services.smart_note_service import SmartNoteService
+
+        lock = threading.Lock()
+        state = {"current": 0, "peak": 0}
+
+        class SlowOCRClient:
+            def extract_text(self, image_source, model, prompt):
+                with lock:
+                    state["current"] += 1
+                    state["peak"] = max(state["peak"], state["current"])
+                threading.Event().wait(0.05)
+                with lock:
+                    state["current"] -= 1
+                return "识别结果"
+
+        async def no_process(task_id):
+            return None
+
+        service = SmartNoteService()
+        service.ocr_client = SlowOCRClient()
+        service._process_task = no_process
+
+        async def scenario():
+            service._ocr_sem = asyncio.Semaphore(2)
+            task_ids = [await service.create_task(b"image-%d" % i, user_id="user") for i in range(4)]
+            await asyncio.gather(*(service._perform_ocr(task_id) for task_id in task_ids))
+
+        asyncio.run(scenario())
+        self.assertEqual(state["peak"], 2)
+
+
+class TestSmartNoteCorrection(unittest.TestCase):
+    """测试纠错校正步骤"""
+
+    def test_long_text_corrected_in_parallel_chunks(self):
+        """测试长文本按段落分块并行纠错，结果按原顺序拼接"""
+        from unittest.mock import patch
+        from app.services.smart_note_service import SmartNoteService
+
+        service = SmartNoteService()
+        completions = _EchoStreamCompletions()
+        service.deepseek_client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        service.tasks["task"] = {"title": "测试笔记"}
+        text = "\n\n".join(["甲" * 6, "乙" * 6, "丙" * 6])
+
+        with patch("app.services.smart_note_service.CORRECTION_CHUNK_CHARS", 10):
+            result = asyncio.run(service._perform_error_correction("task", text))
+
+        self.assertEqual(result, "\n\n".join(["纠正:" + "甲" * 6, "纠正:" + "乙" * 6, "纠正:" + "丙" * 6]))
+        self.assertEqual(completions.calls, 3)
+        self.assertEqual(completions.peak, 3)
+
+    def test_correction_deltas_pushed_while_streaming(self):
+        """测试纠错内容边生成边推送，增量不记入任务中间结果历史"""
+        from app.services.smart_note_service import SmartNoteService
+
+        service = SmartNoteService()
+        service.deepseek_client = SimpleNamespace(chat=SimpleNamespace(completions=_EchoStreamCompletions()))
+        service.tasks["task"] = {"title": "测试笔记"}
+        pushed = []
+
+        async def record_live(task_id, result_type, data):
+            pushed.append((result_type, data))
+
+        service._push_live_result = record_live
+
+        result = asyncio.run(service._perform_error_correction("task", "原文"))
+
+        self.assertEqual(result, "纠正:原文")
+        self.assertEqual(pushed, [
+            ("correction_delta", {"chunk": 0, "delta": "纠正:"}),
+            ("correction_delta", {"chunk": 0, "delta": "原文"})
+        ])
+        history = [item["type"] for item in service.tasks["task"]["intermediate_results"]]
+        self.assertNotIn("correction_delta", history)
+
+    def test_split_keeps_short_paragraphs_together(self):
+        """测试相邻短段落合并到同一块，超长段落独立成块"""
+        from app.services.smart_note_service import SmartNoteService
+
+        chunks = SmartNoteService._split_paragraphs("ab\n\ncd\n\n" + "e" * 12 + "\n\nfg", 10)
+
+        self.assertEqual(chunks, ["ab\n\ncd", "e" * 12, "fg"])
+        self.assertEqual(SmartNoteService._split_paragraphs("短文本", 10), ["短文本"])
+
+
+class TestSmartNoteRetry(unittest.TestCase):
+    """测试上游临时错误重试"""
+
+    def _rate_limit_error(self):
+        import httpx
+        import openai
+
+        request = httpx.Request("POST", "https://api.example.com/chat/completions")
+        return openai.RateLimitError("rate limited", response=httpx.Response(429, request=request), body=None)
+
+    def test_rate_limited_call_retried(self):
+        """测试上游限流后退避重试成功，不使任务失败"""
+        from unittest.mock import patch
+        from app.services.smart_note_service import SmartNoteService
+
+        error = self._rate_limit_error()
+
+        class FlakyCompletions(_FakeCompletions):
+            async def create(self, model, messages, temperature, response_format=None):
+                if self.calls < 2:
+                    self.calls += 1
+                    raise error
+                return await super().create(model, messages, temperature, response_format)
+
+        service = SmartNoteService()
+        completions = FlakyCompletions()
+        client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+        with patch("app.services.smart_note_service.LLM_RETRY_BACKOFF", 0):
+            content = asyncio.run(service._chat_completion(client, "model", [], temperature=0.1))
+
+        self.assertEqual(content, "结果0.1")
+        self.assertEqual(completions.calls, 3)
+
+    def test_non_retryable_error_raised_immediately(self):
+        """测试非临时错误不重试，直接抛出"""
+        from app.services.smart_note_service import SmartNoteService
+
+        class BrokenCompletions(_FakeCompletions):
+            async def create(self, model, messages, temperature, response_format=None):
+                self.calls += 1
+                raise ValueError("bad request")
+
+        service = SmartNoteService()
+        completions = BrokenCompletions()
+        client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+        with self.assertRaises(ValueError):
+            asyncio.run(service._chat_completion(client, "model", [], temperature=0.1))
+        self.assertEqual(completions.calls, 1)
+
+    def test_stream_not_retried_after_delta_forwarded(self):
+        """测试流式调用在推送增量前出错时重试，推送增量后出错直接抛出"""
+        from unittest.mock import patch
+        from app.services.smart_note_service import SmartNoteService
+
+        error = self._rate_limit_error()
+
+        class BrokenStreamCompletions(_FakeCompletions):
+            def __init__(self, fail_before_delta):
+                super().__init__()
+                self.fail_before_delta = fail_before_delta
+
+            async def create(self, model, messages, temperature, response_format=None, stream=False):
+                self.calls += 1
+                attempt = self.calls
+
+                async def chunks():
+                    if attempt == 1 and self.fail_before_delta:
+                        raise error
+                    yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="片段"))])
+                    if attempt == 1:
+                        raise error
+
+                return chunks()
+
+        async def scenario(completions):
+            service = SmartNoteService()
+            deltas = []
+
+            async def on_delta(delta):
+                deltas.append(delta)
+
+            client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+            try:
+                return await service._chat_completion(client, "model", [], temperature=0.1, on_delta=on_delta), deltas
+            except Exception as e:
+                return e, deltas
+
+        with patch("app.services.smart_note_service.LLM_RETRY_BACKOFF", 0):
+            retried = BrokenStreamCompletions(fail_before_delta=True)
+            content, deltas = asyncio.run(scenario(retried))
+            self.assertEqual(content, "片段")
+            self.assertEqual(deltas, ["片段"])
+            self.assertEqual(retried.calls, 2)
+
+            interrupted = BrokenStreamCompletions(fail_before_delta=False)
+            raised, deltas = asyncio.run(scenario(interrupted))
+            self.assertIs(raised, error)
+            self.assertEqual(deltas, ["片段"])
+            self.assertEqual(interrupted.calls, 1)
+
+
+class TestSmartNoteConcurrency(unittest.TestCase):
+    """测试对话模型调用并发上限"""
+
+    def test_llm_calls_capped_across_tasks(self):
+        """测试多个任务同时总结时上游调用数不超过上限"""
+        from app.services.smart_note_service import SmartNoteService
+
+        service = SmartNoteService()
+        completions = _FakeCompletions()
+        service.kimi_client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+        async def scenario():
+            service._llm_sem = asyncio.Semaphore(3)
+            for i in range(4):
+                service.tasks[f"task-{i}"] = {"title": "测试笔记"}
+            await asyncio.gather(*(
+                service._perform_note_summary(f"task-{i}", f"第{i}段文本") for i in range(4)
+            ))
+
+        asyncio.run(scenario())
+
+        self.assertEqual(completions.calls, 4)
+        self.assertEqual(completions.peak, 3)
+
+
+class TestSmartNoteQueue(unittest.TestCase):
+    """测试任务队列与工作协程"""
+
+    def test_tasks_processed_by_bounded_workers(self):
+        """测试同时处理的任务数不超过工作协程数，其余任务排队等待"""
+        from unittest.mock import patch
+        from app.services.smart_note_service import SmartNoteService
+
+        service = SmartNoteService()
+        state = {"current": 0, "peak": 0, "done": 0}
+
+        async def fake_process(task_id):
+            state["current"] += 1
+            state["peak"] = max(state["peak"], state["current"])
+            await asyncio.sleep(0.02)
+            state["current"] -= 1
+            state["done"] += 1
+
+        service._process_text_task = fake_process
+
+        async def scenario():
+            with patch("app.services.smart_note_service.TASK_WORKERS", 2):
+                for i in range(5):
+                    await service.create_text_task(f"笔记内容{i}")
+            await service._queue.join()
+
+        asyncio.run(scenario())
+        self.assertEqual(state["done"], 5)
+        self.assertEqual(state["peak"], 2)
+
+    def test_queue_full_rejects_task(self):
+        """测试队列已满时拒绝新任务且不登记任务"""
+        from unittest.mock import patch
+        from app.services.smart_note_service import SmartNoteService
+
+        service = SmartNoteService()
+
+        async def scenario():
+            with patch("app.services.smart_note_service.TASK_QUEUE_SIZE", 1):
+                await service.create_text_task("第一条")
+                with self.assertRaises(Exception):
+                    await service.create_text_task("第二条")
+
+        asyncio.run(scenario())
+        self.assertEqual(len(service.tasks), 1)
+
+    def test_deleted_task_skipped_by_worker(self):
+        """测试排队期间被删除的任务不会被处理，图片缓冲随删除关闭"""
+        from app.services.smart_note_service import SmartNoteService
+
+        service = SmartNoteService()
+        processed = []
+
+        async def fake_process(task_id):
+            processed.append(task_id)
+
+        service._process_text_task = fake_process
+        service._process_task = fake_process
+
+        async def scenario():
+            image_task_id = await service.create_task(b"image", user_id="user")
+            text_task_id = await service.create_text_task("笔记内容")
+            image_file = service.tasks[image_task_id]["image_file"]
+            service.delete_task(text_task_id)
+            service.delete_task(image_task_id)
+            await service._queue.join()
+            return image_file
+
+        image_file = asyncio.run(scenario())
+        self.assertEqual(processed, [])
+        self.assertTrue(image_file.closed)
+        self.assertEqual(service.tasks, {})
+
+
+class TestSmartNoteTaskRetention(unittest.TestCase):
+    """测试任务数据的释放与过期清理"""
+
+    def test_image_released_after_processing(self):
+        """测试处理结束后关闭并释放任务中的图片缓冲"""
+        from app.services.smart_note_service import SmartNoteService
+
+        service = SmartNoteService()
+        opened = []
+
+        async def failed_ocr(task_id):
+            opened.append(service.tasks[task_id]["image_file"])
+            return None
+
+        service._perform_ocr = failed_ocr
+
+        async def scenario():
+            task_id = await service.create_task(b"image", user_id="user")
+            await service._queue.join()
+            return task_id
+
+        task_id = asyncio.run(scenario())
+        self.assertIn(task_id, service.tasks)
+        self.assertNotIn("image_file", service.tasks[task_id])
+        self.assertTrue(opened[0].closed)
+
+    def test_large_image_spooled_to_disk(self):
+        """测试超过阈值的图片转存到临时文件，OCR和保存步骤读回原始字节"""
+        from unittest.mock import patch
+        from app.services.smart_note_service import SmartNoteService, _read_image
+
+        payload = b"x" * 4096
+        service = SmartNoteService()
+
+        async def scenario():
+            with patch("app.services.smart_note_service.IMAGE_SPOOL_BYTES", 1024):
+                task_id = await service.create_task(payload, user_id="user")
+            return service.tasks[task_id]["image_file"]
+
+        async def no_process(task_id):
+            return None
+
+        service._process_task = no_process
+        image_file = asyncio.run(scenario())
+        self.assertTrue(image_file._rolled)
+        self.assertEqual(_read_image(image_file), payload)
+        self.assertEqual(_read_image(image_file), payload)
+
+    def test_status_snapshot_hides_image_and_is_detached(self):
+        """测试任务状态返回不含图片和知识库记录草稿的副本，修改副本不影响内部任务"""
+        from app.services.smart_note_service import SmartNoteService
+
+        service = SmartNoteService()
+        service.tasks["t"] = {
+            "task_id": "t",
+            "status": "completed",
+            "image_file": io.BytesIO(b"image"),
+            "knowledge_record_draft": {"title": "草稿"},
+            "result": {"content_id": 1}
+        }
+
+        snapshot = service.get_task_status("t")
+        snapshot["status"] = "failed"
+        result = service.get_task_result("t")
+        result["content_id"] = 2
+
+        self.assertNotIn("image_file", snapshot)
+        self.assertNotIn("knowledge_record_draft", snapshot)
+        self.assertEqual(service.tasks["t"]["status"], "completed")
+        self.assertEqual(service.tasks["t"]["result"], {"content_id": 1})
+        self.assertIsNone(service.get_task_status("missing"))
+
+    def test_evicts_only_expired_tasks(self):
+        """测试按结束时间和创建时间清理过期任务"""
+        from datetime import datetime, timedelta
+        from app.services.smart_note_service import SmartNoteService
+
+        service = SmartNoteService()
+        now = datetime.now()
+
+        def add(task_id, status, created_ago, updated_ago):
+            service.tasks[task_id] = {
+                "task_id": task_id,
+                "status": status,
+                "created_at": now - created_ago,
+                "updated_at": now - updated_ago
+            }
+
+        add("stale", "processing", timedelta(hours=25), timedelta(hours=25))
+        add("done-old", "completed", timedelta(hours=3), timedelta(hours=2))
+        add("failed-new", "failed", timedelta(minutes=30), timedelta(minutes=10))
+        add("processing", "processing", timedelta(hours=2), timedelta(hours=2))
+
+        self.assertEqual(service._evict_expired_tasks(now), 2)
+        self.assertEqual(list(service.tasks), ["failed-new", "processing"])
+
+    def test_delete_and_eviction_close_image(self):
+        """测试删除任务和清理过期任务时关闭图片缓冲"""
+        from datetime import datetime, timedelta
+        from app.services.smart_note_service import SmartNoteService
+
+        service = SmartNoteService()
+        now = datetime.now()
+        images = {}
+        for task_id in ("deleted", "expired"):
+            images[task_id] = io.BytesIO(b"image")
+            service.tasks[task_id] = {
+                "task_id": task_id,
+                "status": "failed",
+                "image_file": images[task_id],
+                "created_at": now - timedelta(hours=3),
+                "updated_at": now - timedelta(hours=2)
+            }
+
+        self.assertTrue(service.delete_task("deleted"))
+        self.assertTrue(images["deleted"].closed)
+        self.assertFalse(images["expired"].closed)
+
+        self.assertEqual(service._evict_expired_tasks(now), 1)
+        self.assertTrue(images["expired"].closed)
+        self.assertEqual(service.tasks, {})
+
+
+class TestSmartNoteSave(unittest.TestCase):
+    """测试保存到数据库"""
+
+    def test_database_write_runs_off_loop(self):
+        """测试同步数据库写入在事件循环线程之外执行"""
+        import threading
+        from app.services.smart_note_service import SmartNoteService
+
+        service = SmartNoteService()
+        calls = []
+
+        def fake_insert(user_id, **content_fields):
+            calls.append((threading.current_thread() is threading.main_thread(), user_id, content_fields))
+            return 42
+
+        service._insert_owned_content = fake_insert
+        service.tasks["task"] = {"user_id": "user", "image_file": io.BytesIO(b"image")}
+        summary = {"title": "标题", "content": "总结"}
+
+        content_id = asyncio.run(service._save_to_database("task", "原文", "纠错文本", summary, {}))
+
+        self.assertEqual(content_id, 42)
+        on_main_thread, user_id, fields = calls[0]
+        self.assertFalse(on_main_thread)
+        self.assertEqual(user_id, "user")
+        self.assertEqual(fields["image_data"], b"image")
+
+    def test_content_and_owner_committed_together(self):
+        """测试内容和所有权记录在一次提交中写入，失败时回滚"""
+        from unittest.mock import MagicMock, patch
+        from app.services.smart_note_service import SmartNoteService
+
+        db = MagicMock()
+        db.__enter__.return_value = db
+        db.flush.side_effect = lambda: setattr(db.add.call_args_list[0].args[0], "id", 7)
+
+        with patch("app.services.smart_note_service.SessionLocal", return_value=db):
+            content_id = SmartNoteService._insert_owned_content(
+                "00000000-0000-0000-0000-000000000001", content_type="text", text_data="文本"
+            )
+
+        self.assertEqual(content_id, 7)
+        self.assertEqual(db.commit.call_count, 1)
+        self.assertEqual(db.add.call_args_list[1].args[0].content_id, 7)
+        db.refresh.assert_not_called()
+        db.__exit__.assert_called_once()
+
+        db = MagicMock()
+        db.__enter__.return_value = db
+        db.commit.side_effect = RuntimeError("commit failed")
+        with patch("app.services.smart_note_service.SessionLocal", return_value=db):
+            with self.assertRaises(RuntimeError):
+                SmartNoteService._insert_owned_content(
+                    "00000000-0000-0000-0000-000000000001", content_type="text", text_data="文本"
+                )
+        db.rollback.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,10 @@
 """
 测试画布DTOs的数据验证功能
 """
+import subprocess
+import sys
+from pathlib import Path
+
 from pydantic import ValidationError
 from app.schemas.canva import (
     PositionModel,
@@ -181,6 +185,31 @@ def test_error_response():
     assert error.details["canvas_id"] == 12
 
 
+def test_schemas_complete_after_import():
+    """测试在全新进程中导入服务层后热路径模型已完成构建"""
+    code = (
+        "import app.services\n"
+        "from app.schemas.canva import CanvaResponse, CardResponse, PositionModel\n"
+        "assert CanvaResponse.__pydantic_complete__\n"
+        "assert CardResponse.__pydantic_complete__\n"
+        "assert PositionModel.__pydantic_complete__\n"
+        "from app.schemas.note_summary import SummaryResult\n"
+        "from app.schemas.ocr import OCRTaskStatusResponse\n"
+        "from app.schemas.smart_note import SmartNoteStatusResponse\n"
+        "assert SummaryResult.__pydantic_complete__\n"
+        "assert OCRTaskStatusResponse.__pydantic_complete__\n"
+        "assert SmartNoteStatusResponse.__pydantic_complete__\n"
+    )
+    project_root = Path(__file__).parent.parent.parent
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=project_root,
+        capture_output=True,
+        text=True
+    )
+    assert result.returncode == 0, result.stderr
+
+
 if __name__ == "__main__":
     # 运行一些基本测试
     print("运行DTOs验证测试...")
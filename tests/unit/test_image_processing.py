@@ -0,0 +1,51 @@
+"""
+测试图片处理工具
+"""
+import io
+
+from PIL import Image
+
+from app.utils.image_processing import compress_image
+
+
+def _jpeg_bytes(width: int, height: int, orientation: int = None) -> bytes:
+    output = io.BytesIO()
+    image = Image.new('RGB', (width, height), (200, 10, 10))
+    if orientation is None:
+        image.save(output, format='JPEG')
+    else:
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        image.save(output, format='JPEG', exif=exif)
+    return output.getvalue()
+
+
+def test_compress_image_within_limit_returns_original():
+    """测试未超限的图片原样返回，不重新编码"""
+    data = _jpeg_bytes(400, 300)
+    assert compress_image(data, 400 * 300) is data
+
+
+def test_compress_image_downscales_large_jpeg():
+    """测试超限的JPEG被等比缩小到面积上限以内"""
+    data = _jpeg_bytes(1600, 1200)
+    result = compress_image(data, 400 * 300)
+    width, height = Image.open(io.BytesIO(result)).size
+    assert width * height <= 400 * 300
+    assert abs(width / height - 4 / 3) < 0.01
+
+
+def test_compress_image_applies_exif_orientation():
+    """测试缩小时按EXIF方向标记转正图片，输出不再带方向标记"""
+    data = _jpeg_bytes(1600, 1200, orientation=6)
+    result = Image.open(io.BytesIO(compress_image(data, 400 * 300)))
+    width, height = result.size
+    assert width * height <= 400 * 300
+    assert abs(height / width - 4 / 3) < 0.01
+    assert result.getexif().get(0x0112) is None
+
+
+def test_compress_image_invalid_data_returns_original():
+    """测试无法解析的数据原样返回"""
+    data = b"not an image"
+    assert compress_image(data, 100) is data
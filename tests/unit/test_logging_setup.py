@@ -0,0 +1,39 @@
+"""
+日志配置单元测试
+"""
+import logging
+import logging.handlers
+import unittest
+
+
+class TestQueueLogging(unittest.TestCase):
+    """测试队列日志的启动与关闭"""
+
+    def setUp(self):
+        self.root_level = logging.getLogger().level
+
+    def tearDown(self):
+        from app.core.logging import shutdown_logging
+
+        shutdown_logging()
+        logging.getLogger().setLevel(self.root_level)
+
+    @staticmethod
+    def _queue_handlers():
+        return [h for h in logging.getLogger().handlers if isinstance(h, logging.handlers.QueueHandler)]
+
+    def test_shutdown_detaches_queue_handler(self):
+        """测试关闭后根日志器不再挂载队列处理器，重新启动只挂载一个"""
+        from app.core.logging import setup_logging, shutdown_logging
+
+        for _ in range(2):
+            setup_logging()
+            setup_logging()
+            self.assertEqual(len(self._queue_handlers()), 1)
+
+            shutdown_logging()
+            self.assertEqual(self._queue_handlers(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -191,6 +191,35 @@ class TestTaskManager:
         """测试获取空的用户任务列表"""
         tasks = await self.task_manager.get_user_tasks("user-id")
         assert tasks == []
+    
+    def test_progress_updates_debounced(self):
+        """测试连续的进度推送被合并，结束消息前先推送最后一条进度"""
+        task = SummaryTask(task_id="test-task-id", user_id="test-user-id", content_ids=["1"])
+        websocket_manager = Mock()
+        websocket_manager.send_message = AsyncMock()
+        
+        async def scenario():
+            for progress in (20, 30, 50):
+                await self.task_manager._notify(task, websocket_manager, {
+                    "type": "progress_update",
+                    "progress": progress
+                })
+            await self.task_manager._notify(task, websocket_manager, {"type": "task_completed"})
+            
+            await self.task_manager._notify(task, websocket_manager, {
+                "type": "progress_update",
+                "progress": 100
+            })
+            await asyncio.sleep(0.2)
+        
+        asyncio.run(scenario())
+        
+        sent = [call.args[1] for call in websocket_manager.send_message.call_args_list]
+        assert sent == [
+            {"type": "progress_update", "progress": 50},
+            {"type": "task_completed"},
+            {"type": "progress_update", "progress": 100}
+        ]
 
 
 class TestSummarySchemas:
@@ -205,6 +234,24 @@ class TestSummarySchemas:
         # 空列表应该通过验证（业务逻辑会处理）
         request = SummaryRequest(content_ids=[])
         assert request.content_ids == []
+    
+    def test_examples_in_openapi_document(self):
+        """测试模型示例数据出现在生成的OpenAPI文档中"""
+        from fastapi import FastAPI
+        from app.schemas.note_summary import SummaryTaskResponse
+        
+        app = FastAPI()
+        
+        @app.post("/summary", response_model=SummaryTaskResponse)
+        async def create_summary(request: SummaryRequest):
+            pass
+        
+        schemas = app.openapi()["components"]["schemas"]
+        
+        assert schemas["SummaryRequest"]["example"]["min_notes_threshold"] == 3
+        assert schemas["NoteInput"]["example"]["title"] == "机器学习基础概念"
+        assert schemas["SummaryTaskResponse"]["example"]["status"] == "completed"
+        assert schemas["SummaryResult"]["example"]["processing_method"] == "multi_note_workflow"
 
 
 def test_imports():
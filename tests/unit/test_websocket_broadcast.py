@@ -0,0 +1,47 @@
+"""
+WebSocket广播单元测试
+"""
+import asyncio
+import json
+import unittest
+from unittest.mock import patch
+
+from fastapi.websockets import WebSocketState
+
+
+class _FakeWebSocket:
+    """记录发送内容的假WebSocket连接"""
+
+    def __init__(self):
+        self.client_state = WebSocketState.CONNECTED
+        self.sent = []
+
+    async def send_text(self, text):
+        self.sent.append(text)
+
+
+class TestWebSocketBroadcast(unittest.TestCase):
+    """测试向多个连接推送同一消息"""
+
+    def test_send_to_task_serializes_once(self):
+        """测试同一任务的多个连接共享一次序列化结果且保留中文"""
+        from app.api.v2.endpoints import smart_note_websocket
+        from app.utils.json_response import dumps_text
+
+        manager = smart_note_websocket.ConnectionManager()
+        sockets = [_FakeWebSocket() for _ in range(3)]
+        manager.task_connections["task"] = set(sockets)
+        message = {"type": "status", "message": "处理中"}
+
+        with patch.object(smart_note_websocket, "dumps_text", wraps=dumps_text) as dumps:
+            asyncio.run(manager.send_to_task("task", message))
+
+        self.assertEqual(dumps.call_count, 1)
+        for websocket in sockets:
+            self.assertEqual(len(websocket.sent), 1)
+            self.assertIn("处理中", websocket.sent[0])
+            self.assertEqual(json.loads(websocket.sent[0]), message)
+
+
+if __name__ == '__main__':
+    unittest.main()